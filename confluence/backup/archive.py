@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+
+try:
+    from .confapi import inventory as confapi_inventory
+    from .confapi import store as confapi_store
+except ImportError:
+    from confapi import inventory as confapi_inventory
+    from confapi import store as confapi_store
+
+# global variables
+error_collection = []
+
+
+def collect_error(error_code, value):
+    global error_collection
+    error_collection.append(str(error_code) + ": " + value)
+    return 0 if error_code == 0 else 1
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description="sample usage: \n"
+                    "python3 archive.py list /backup/store\n"
+                    "python3 archive.py restore /backup/store Confluence-space-export-ds.xml.zip\n"
+                    "python3 archive.py add /backup/store Confluence-space-export-*.xml.zip\n"
+                    "python3 archive.py prune /backup/store --keep 30\n"
+                    "python3 archive.py inventory Confluence-space-export-*.xml.zip\n",
+        formatter_class=argparse.RawTextHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="list the archives and snapshots in a store.")
+    list_parser.add_argument("store", help="directory of the chunk store")
+    list_parser.add_argument("name", nargs="*", help="archive file names, e.g. Confluence-space-export-ds.xml.zip")
+
+    restore_parser = commands.add_parser("restore", help="rebuild archives from a store.")
+    restore_parser.add_argument("store", help="directory of the chunk store")
+    restore_parser.add_argument("name", nargs="+", help="archive file names, e.g. Confluence-space-export-ds.xml.zip")
+    restore_parser.add_argument("-s", "--snapshot", help="snapshot to restore (default: the latest one).")
+    restore_parser.add_argument("-o", "--output", default=".",
+                                help="directory the archives are written to (default: current directory).")
+
+    add_parser = commands.add_parser("add", help="add existing archives to a store.")
+    add_parser.add_argument("store", help="directory of the chunk store")
+    add_parser.add_argument("file", nargs="+", help="archive files")
+
+    prune_parser = commands.add_parser("prune", help="remove old snapshots and the chunks only they use.")
+    prune_parser.add_argument("store", help="directory of the chunk store")
+    prune_parser.add_argument("-k", "--keep", type=int, required=True,
+                              help="number of snapshots to keep per archive.")
+
+    inventory_parser = commands.add_parser("inventory", help="count the content of space export archives.")
+    inventory_parser.add_argument("file", nargs="+", help="archive files")
+    inventory_parser.add_argument("--json", action="store_true", help="print one JSON object per archive.")
+
+    return parser.parse_args(args[1:])
+
+
+def list_archives(store, names):
+    for name in names or store.names():
+        print(name)
+        for snapshot in store.snapshots(name):
+            manifest = store.load(name, snapshot)
+            print("- {}: {} bytes in {} chunks, sha256 {}".format(snapshot, manifest["size"],
+                                                                  len(manifest["chunks"]), manifest["sha256"]))
+    return collect_error(0, "Success")
+
+
+def restore_archives(store, names, snapshot, output):
+    for name in names:
+        target = os.path.join(output, name)
+        try:
+            manifest = store.restore(name, target, snapshot)
+        except IOError as e:
+            print("Restoring {} failed: {}".format(name, e))
+            collect_error(1, str(e))
+            continue
+        print("Restored {} from snapshot {} ({} bytes)".format(target, manifest["snapshot"], manifest["size"]))
+        collect_error(0, "Success")
+    return 0
+
+
+def add_archives(store, files):
+    for file in files:
+        snapshot = store.add(file)
+        print("Stored {} as snapshot {}: {} of {} chunks new, {} of {} bytes written".format(
+            snapshot["name"], snapshot["snapshot"], snapshot["new_chunks"], len(snapshot["chunks"]),
+            snapshot["new_bytes"], snapshot["size"]))
+        collect_error(0, "Success")
+    return 0
+
+
+def prune_archives(store, keep):
+    removed_snapshots, removed_chunks = store.prune(keep)
+    print("Removed {} snapshots and {} chunks".format(removed_snapshots, removed_chunks))
+    return collect_error(0, "Success")
+
+
+def inventory_archives(files, json_output):
+    for file in files:
+        try:
+            inventory = confapi_inventory.space_inventory(file)
+        except confapi_inventory.InventoryError as e:
+            print(e)
+            collect_error(1, "invalid archive")
+            continue
+        if json_output:
+            print(json.dumps(inventory, sort_keys=True))
+        else:
+            print(format_inventory(inventory))
+        collect_error(0, "Success")
+    return 0
+
+
+def format_inventory(inventory):
+    return "{}: space {}, {} pages, {} blog posts, {} attachments ({} bytes in {} files)".format(
+        inventory["file"], inventory["space_key"], inventory["pages"], inventory["blog_posts"],
+        inventory["attachments"], inventory["attachment_bytes"], inventory["attachment_files"])
+
+
+def main(argv):
+    global error_collection
+    error_collection = []
+
+    args = parse_args(argv)
+    if args.command == "inventory":
+        inventory_archives(args.file, args.json)
+        return report_errors()
+
+    if args.command != "add" and not os.path.isdir(args.store):
+        print("Store {} does not exist".format(args.store))
+        collect_error(1, "store not found")
+        return error_collection
+    store = confapi_store.ChunkStore(args.store)
+
+    if args.command == "list":
+        list_archives(store, args.name)
+    elif args.command == "restore":
+        restore_archives(store, args.name, args.snapshot, args.output)
+    elif args.command == "add":
+        add_archives(store, args.file)
+    elif args.command == "prune":
+        prune_archives(store, args.keep)
+
+    return report_errors()
+
+
+def report_errors():
+    if any(error != '0: Success' for error in error_collection):
+        print(error_collection)
+    return error_collection
+
+
+if __name__ == "__main__":
+    main(argv=sys.argv)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# Throughput benchmark of export.py and import.py against the local mock
+# ConfAPI server (tests/mock_server.py). Every scenario runs the script in a
+# separate process, so that the CPU time and peak memory only cover the client.
+#
+# sample usage:
+#   python3 bench_backup.py --spaces 20 --archive-size 8388608 --job-duration 2 --latency 0.02
+#   python3 bench_backup.py --scenario export-parallel --extra-args "--segments 4"
+
+import argparse
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKUP_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, os.path.join(BACKUP_DIR, "tests"))
+
+from mock_server import MockConfapiServer, build_archive  # noqa: E402
+
+CREDENTIALS = ["--username", "admin", "--password", "admin", "--batch"]
+SCENARIOS = {
+    "export-sequential": ("export.py", []),
+    "export-parallel": ("export.py", ["--parallel", "{parallel}"]),
+    "import-sequential": ("import.py", []),
+    "import-parallel": ("import.py", ["--parallel", "{parallel}"]),
+}
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="benchmark of export.py and import.py against a mock server")
+    parser.add_argument("--spaces", type=int, default=10, help="number of spaces (default: %(default)s).")
+    parser.add_argument("--archive-size", type=int, default=4 * 1024 * 1024,
+                        help="attachment bytes per archive (default: %(default)s).")
+    parser.add_argument("--job-duration", type=float, default=1.0,
+                        help="seconds of server-side processing per job (default: %(default)s).")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request.")
+    parser.add_argument("--bandwidth", type=int, help="bytes per second and connection.")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="probability of a 503 for a status request.")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="probability of a dropped download.")
+    parser.add_argument("--parallel", type=int, default=4,
+                        help="jobs of the parallel scenarios (default: %(default)s).")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run, may be repeated (default: all).")
+    parser.add_argument("--extra-args", default="", help="additional arguments for the scripts.")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON lines.")
+    return parser.parse_args(args[1:])
+
+
+def run_script(script, arguments, directory):
+    # -> (wall seconds, CPU seconds, peak RSS in bytes, exit status) of the client process
+    command = [sys.executable, os.path.join(BACKUP_DIR, script)] + arguments
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    error_output = process.stderr.read().decode("utf-8", "replace")
+    process.stderr.close()
+    if process.returncode:
+        raise RuntimeError("{} failed:\n{}".format(script, error_output))
+    # ru_maxrss is reported in KiB on Linux and in bytes on macOS
+    peak_memory = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return wall, usage.ru_utime + usage.ru_stime, peak_memory, process.returncode
+
+
+def run_scenario(name, args, directory):
+    script, scenario_args = SCENARIOS[name]
+    keys = ["BENCH{}".format(index) for index in range(args.spaces)]
+    server = MockConfapiServer(spaces=[] if script == "import.py" else keys, archive_size=args.archive_size,
+                               job_duration=args.job_duration, latency=args.latency, bandwidth=args.bandwidth,
+                               fail_rate=args.fail_rate, drop_rate=args.drop_rate, seed=1)
+    base_url = server.start()
+    try:
+        if script == "export.py":
+            for key in keys:
+                # build the archives before the clock starts
+                server.archive(key)
+            arguments = [base_url, ",".join(keys)]
+        else:
+            for key in keys:
+                with open(os.path.join(directory, "Confluence-space-export-" + key + ".xml.zip"), "wb") as fd:
+                    fd.write(build_archive(key, args.archive_size))
+            arguments = [base_url, "Confluence-space-export-BENCH*.xml.zip"]
+
+        arguments += CREDENTIALS + [argument.format(parallel=args.parallel) for argument in scenario_args]
+        arguments += shlex.split(args.extra_args)
+        wall, cpu, peak_memory, _ = run_script(script, arguments, directory)
+        stats = server.stats()
+    finally:
+        server.stop()
+
+    transferred = stats["bytes_sent"] + stats["bytes_received"]
+    return {
+        "scenario": name,
+        "jobs": args.spaces,
+        "seconds": round(wall, 3),
+        "jobs_per_minute": round(60 * args.spaces / wall, 1),
+        "megabytes_per_second": round(transferred / wall / 1e6, 2),
+        "requests": stats["requests"],
+        "status_requests": stats["requests_by_endpoint"].get("GET queue", 0),
+        "connections": stats["connections"],
+        "cpu_seconds": round(cpu, 3),
+        "peak_memory_mb": round(peak_memory / 1e6, 1),
+    }
+
+
+def print_results(results):
+    columns = ["scenario", "seconds", "jobs_per_minute", "megabytes_per_second", "requests", "status_requests",
+               "connections", "cpu_seconds", "peak_memory_mb"]
+    headers = ["scenario", "time [s]", "jobs/min", "MB/s", "requests", "polls", "conns", "CPU [s]", "peak MB"]
+    print("  ".join("{:>10}".format(header) if index else "{:<18}".format(header)
+                    for index, header in enumerate(headers)))
+    for result in results:
+        print("  ".join("{:>10}".format(result[column]) if index else "{:<18}".format(result[column])
+                        for index, column in enumerate(columns)))
+
+
+def main(argv):
+    args = parse_args(argv)
+    results = []
+    for name in args.scenario or sorted(SCENARIOS):
+        directory = tempfile.mkdtemp()
+        try:
+            results.append(run_scenario(name, args, directory))
+        finally:
+            shutil.rmtree(directory)
+        if args.json:
+            print(json.dumps(results[-1]))
+
+    if not args.json:
+        print_results(results)
+    return results
+
+
+if __name__ == "__main__":
+    main(argv=sys.argv)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Compares the download write path of export.py before and after the switch
+# from iter_content(4096) to readinto() into a reusable buffer. The archive
+# is served by "python -m http.server" in a separate process, so the CPU time
+# below only covers the client.
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from confapi import download as confapi_download  # noqa: E402
+from confapi import session as confapi_session  # noqa: E402
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="benchmark of the export download write path")
+    parser.add_argument("--size", type=int, default=512, help="archive size in MiB (default: %(default)s).")
+    parser.add_argument("--chunk-size", type=int, default=confapi_download.DEFAULT_CHUNK_SIZE,
+                        help="buffer size of the new write path (default: %(default)s).")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per variant (default: %(default)s).")
+    return parser.parse_args(args[1:])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(directory):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "http.server", str(port), "--bind", "127.0.0.1",
+                               "--directory", directory], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = "http://127.0.0.1:{}/".format(port)
+    for _ in range(100):
+        try:
+            requests.get(url)
+            return server, url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("benchmark server did not start")
+
+
+def print_progress(devnull, title, percentage):
+    # same work as print_progress() of export.py, without the terminal
+    devnull.write("\r%s: %d%%" % (title, percentage))
+    devnull.flush()
+
+
+def legacy_download(url, path, devnull):
+    with open(path, "wb") as fd:
+        response = requests.get(url, stream=True, verify=False)
+        download_size = response.headers["Content-Length"]
+        download_progress = 0.0
+        for chunk in response.iter_content(chunk_size=4096):
+            fd.write(chunk)
+            download_progress += len(chunk)
+            print_progress(devnull, "Download", int(100 * download_progress / int(download_size)))
+
+
+def readinto_download(url, path, devnull, chunk_size):
+    session = confapi_session.ConfapiSession()
+    try:
+        confapi_download.download(session, url, path, chunk_size=chunk_size,
+                                  callback=lambda size, total: print_progress(devnull, "Download",
+                                                                              int(100 * size / total)))
+    finally:
+        session.close()
+
+
+def measure(name, function, size, rounds):
+    results = []
+    for _ in range(rounds):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        function()
+        results.append((time.perf_counter() - wall_start, time.process_time() - cpu_start))
+    wall, cpu = min(results)
+    print("{:<34} {:>9.1f} MB/s {:>8.2f} s CPU {:>6.1f} CPU-s/GB".format(
+        name, size / wall / 1e6, cpu, cpu / (size / 1e9)))
+    return wall, cpu
+
+
+def main(argv):
+    args = parse_args(argv)
+    size = args.size * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "archive.zip"), "wb") as fd:
+            block = os.urandom(1024 * 1024)
+            for _ in range(args.size):
+                fd.write(block)
+
+        server, url = start_server(directory)
+        target = os.path.join(directory, "download.zip")
+        try:
+            with open(os.devnull, "w") as devnull:
+                print("Downloading {} MiB, best of {} runs".format(args.size, args.rounds))
+                before = measure("before: iter_content(4096)",
+                                 lambda: legacy_download(url + "archive.zip", target, devnull), size, args.rounds)
+                after = measure("after: readinto({})".format(args.chunk_size),
+                                lambda: readinto_download(url + "archive.zip", target, devnull, args.chunk_size),
+                                size, args.rounds)
+        finally:
+            server.kill()
+            server.wait()
+
+    print("speedup: {:.1f}x wall time, {:.1f}x CPU time".format(before[0] / after[0], before[1] / after[1]))
+
+
+if __name__ == "__main__":
+    main(argv=sys.argv)
@@ -0,0 +1,2 @@
+# Shared client code of the ConfAPI backup scripts (export.py, import.py) and
+# of the asyncio client library for in-process use (client.BackupClient)
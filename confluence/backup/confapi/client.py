@@ -0,0 +1,271 @@
+import asyncio
+import collections
+import contextlib
+import functools
+import importlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import polling
+from . import protocol
+from . import scheduler
+
+# constant variables
+DEFAULT_MAX_REQUESTS = 16
+UNREACHABLE_CODE = 444
+
+
+def load(name):
+    # requests and the modules built on it are only imported once the first
+    # request is sent, so importing the client stays cheap
+    return importlib.import_module(name, __package__)
+
+
+def status_message(status_code):
+    codes = load("requests").status_codes._codes
+    return codes[status_code][0] if status_code in codes else "unknown"
+
+
+class JobResult:
+    # Outcome of a job or of one step of it. state is one of the scheduler
+    # states, code is 0 on success, the HTTP status of a failed request, 444
+    # if the server could not be reached or 1 for other errors, the same
+    # codes the scripts report as "code: message" strings.
+
+    def __init__(self, item, state, code=0, message="Success", location=None, queue_url=None, path=None,
+                 bytes=0, sha256=None, seconds=None, error_messages=None, error=None):
+        self.item = item
+        self.state = state
+        self.code = code
+        self.message = message
+        self.location = location
+        self.queue_url = queue_url
+        self.path = path
+        self.bytes = bytes
+        self.sha256 = sha256
+        self.seconds = seconds
+        self.error_messages = error_messages or []
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.state != scheduler.FAILED and self.code == 0
+
+    def __str__(self):
+        return "{}: {}".format(self.code, self.message)
+
+    def __repr__(self):
+        return "JobResult({!r}, {}, {})".format(self.item, self.state, self)
+
+    def to_dict(self):
+        return collections.OrderedDict([
+            ("item", self.item), ("state", self.state), ("code", self.code), ("message", self.message),
+            ("location", self.location), ("queue_url", self.queue_url), ("path", self.path), ("bytes", self.bytes),
+            ("sha256", self.sha256), ("seconds", round(self.seconds, 3) if self.seconds is not None else None),
+            ("error_messages", self.error_messages)])
+
+
+def failed(item, code, message, **fields):
+    return JobResult(item, scheduler.FAILED, code=code, message=message, **fields)
+
+
+def http_failure(item, response):
+    return failed(item, response.status_code, status_message(response.status_code),
+                  error_messages=protocol.error_messages(response))
+
+
+def unreachable(item, error):
+    return failed(item, UNREACHABLE_CODE, "url not reachable", error=error)
+
+
+class BackupClient:
+    # Asyncio API of the ConfAPI backup resources for use in-process, e.g. by
+    # an orchestrator that runs the jobs of many spaces on one event loop.
+    # Requests are sent on at most max_requests threads of one HTTP session,
+    # while the waiting for server-side jobs happens on the event loop, so
+    # thousands of jobs may be in flight. max_jobs optionally caps the jobs
+    # of export_space and import_archive that are running at once. Progress
+    # callbacks are called on the event loop with (item, done, total).
+    # Submissions answered with 429 or 503 are sent again up to
+    # overload_retries times, by default as often as the scripts do.
+
+    def __init__(self, host, auth=(), max_requests=DEFAULT_MAX_REQUESTS, max_jobs=None,
+                 polling_strategy=polling.AdaptivePolling, session=None, download_options=None,
+                 overload_retries=None):
+        self.host = host
+        self.auth = auth
+        self.max_requests = max_requests
+        self.max_jobs = max_jobs
+        self.polling_strategy = polling_strategy
+        self.session = session
+        self.download_options = download_options or {}
+        self.overload_retries = overload_retries
+        self.executor = ThreadPoolExecutor(max_workers=max_requests, thread_name_prefix="confapi")
+        self.lock = threading.Lock()
+        self.job_slots = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+    def connect(self):
+        with self.lock:
+            if self.session is None:
+                self.session = load(".session").ConfapiSession(auth=self.auth, pool_size=self.max_requests)
+            return self.session
+
+    async def run(self, function, *args, **kwargs):
+        # runs a blocking step on the threads of the client
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    def send(self, method, url, overload_retries=0, **kwargs):
+        # returns the response or the error if the server could not be reached
+        requests = load("requests")
+        limiter = load(".limiter")
+        if overload_retries is None:
+            overload_retries = limiter.DEFAULT_OVERLOAD_RETRIES
+        try:
+            return limiter.send_submission(self.connect(), method, url, overload_retries, **kwargs), None
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            return None, e
+
+    async def request(self, method, url, **kwargs):
+        return await self.run(self.send, method, url, **kwargs)
+
+    def progress(self, callback, item):
+        # forwards the progress of a transfer from a thread of the client to the event loop
+        if callback is None:
+            return None
+        loop = asyncio.get_running_loop()
+        return lambda done, total: loop.call_soon_threadsafe(callback, item, done, total)
+
+    async def check(self, resource=None):
+        # checks the credentials and, with a resource, the permission to use it
+        result = await self.run(load(".preflight").check_server, self.connect(), self.host, resource)
+        if result.error is not None:
+            return unreachable(None, result.error)
+        if not result.ok:
+            return http_failure(None, result.response)
+        return JobResult(None, scheduler.DONE)
+
+    async def submit_export(self, key):
+        response, error = await self.request("GET", protocol.export_url(self.host, key),
+                                             overload_retries=self.overload_retries)
+        return submission_result(key, response, error)
+
+    async def upload(self, path, callback=None):
+        # submits an import; the archive is streamed from disk
+        return await self.run(self.send_archive, path, self.progress(callback, path))
+
+    def send_archive(self, path, callback):
+        encoder = load(".multipart").MultipartFileEncoder.from_path(path, callback=callback)
+        response, error = self.send("POST", protocol.import_url(self.host), overload_retries=self.overload_retries,
+                                    data=encoder, headers={'Content-Type': encoder.content_type})
+        result = submission_result(path, response, error)
+        result.path = path
+        result.bytes = encoder.bytes_read
+        if result.state == scheduler.READY:
+            # the space has been imported right away
+            result.state = scheduler.DONE
+        return result
+
+    async def poll(self, item, queue_url, poller=None, callback=None):
+        # waits for a server-side job on the event loop; returns a READY result
+        # with the location of the download or of the imported space
+        poller = poller or self.polling_strategy()
+        while True:
+            response, error = await self.request("GET", queue_url)
+            if error is not None:
+                return unreachable(item, error)
+
+            state, value = protocol.queue_state(response)
+            if state == scheduler.FAILED:
+                return http_failure(item, response)
+            if state == scheduler.READY:
+                return JobResult(item, scheduler.READY, location=value, queue_url=queue_url)
+
+            if value is not None and callback is not None:
+                callback(item, value, 100)
+            await asyncio.sleep(poller.next_interval(value, response))
+
+    async def download(self, key, location, path, callback=None):
+        # downloads an archive into path, resuming it if the connection drops
+        return await self.run(self.fetch, key, location, path, self.progress(callback, key))
+
+    def fetch(self, key, location, path, callback):
+        download = load(".download")
+        checksum = load(".integrity").StreamChecksum()
+        try:
+            download.download(self.connect(), location, path, callback=callback, checksum=checksum,
+                              **self.download_options)
+        except load("requests").exceptions.HTTPError as e:
+            return http_failure(key, e.response)
+        except download.RETRY_EXCEPTIONS + (download.IncompleteDownloadError,) as e:
+            return unreachable(key, e)
+        return JobResult(key, scheduler.DONE, location=location, path=path, bytes=os.path.getsize(path),
+                         sha256=checksum.hexdigest())
+
+    async def export_space(self, key, directory=".", progress=None, transfer_progress=None):
+        # submit, poll and download of one space; progress gets the percentage
+        # of the server-side job, transfer_progress the bytes of the download
+        async with self.job_slot():
+            started = time.monotonic()
+            result = await self.submit_export(key)
+            if result.state == scheduler.QUEUED:
+                result = await self.poll(key, result.queue_url, callback=progress)
+            if result.state == scheduler.READY:
+                if not result.location:
+                    result = failed(key, 1, "no download location")
+                else:
+                    path = os.path.join(directory, protocol.export_file_name(key))
+                    result = await self.download(key, result.location, path, callback=transfer_progress)
+            result.seconds = time.monotonic() - started
+            return result
+
+    async def import_archive(self, path, progress=None, transfer_progress=None):
+        # upload and poll of one archive; progress gets the percentage of the
+        # server-side job, transfer_progress the bytes of the upload
+        async with self.job_slot():
+            started = time.monotonic()
+            result = await self.upload(path, callback=transfer_progress)
+            if result.state == scheduler.QUEUED:
+                uploaded = result
+                result = await self.poll(path, uploaded.queue_url, callback=progress)
+                if result.state == scheduler.READY:
+                    result.state = scheduler.DONE
+                result.path = path
+                result.bytes = uploaded.bytes
+            result.seconds = time.monotonic() - started
+            return result
+
+    @contextlib.asynccontextmanager
+    async def job_slot(self):
+        if self.max_jobs is None:
+            yield
+            return
+        if self.job_slots is None:
+            self.job_slots = asyncio.Semaphore(self.max_jobs)
+        async with self.job_slots:
+            yield
+
+
+def submission_result(item, response, error):
+    if error is not None:
+        return unreachable(item, error)
+    state, location = protocol.submission_state(response)
+    if state == scheduler.FAILED:
+        return http_failure(item, response)
+    return JobResult(item, state, location=location if state == scheduler.READY else None,
+                     queue_url=location if state == scheduler.QUEUED else None)
@@ -0,0 +1,135 @@
+import collections
+import fnmatch
+import functools
+import glob
+import os
+import re
+
+from . import ziputil
+
+# constant variables
+RECURSIVE_WILDCARD = "**"
+MAGIC_CHARACTERS = re.compile(r"[*?\[]")
+ORDERS = ["size", "inventory", "name"]
+
+
+def split_pattern(pattern):
+    # "exports/2020/**/*.zip" -> ("exports/2020", ["**", "*.zip"])
+    parts = pattern.split("/")
+    for index, part in enumerate(parts[:-1]):
+        if MAGIC_CHARACTERS.search(part):
+            break
+    else:
+        index = len(parts) - 1
+    directory = "/".join(parts[:index])
+    if pattern.startswith("/") and not directory:
+        directory = "/"
+    return os.path.normpath(directory or "."), [part for part in parts[index:] if part]
+
+
+def match_parts(pattern_parts, path_parts):
+    if not pattern_parts:
+        return not path_parts
+    if pattern_parts[0] == RECURSIVE_WILDCARD:
+        return any(match_parts(pattern_parts[1:], path_parts[index:]) for index in range(len(path_parts) + 1))
+    return bool(path_parts) and fnmatch.fnmatch(path_parts[0], pattern_parts[0]) \
+        and match_parts(pattern_parts[1:], path_parts[1:])
+
+
+def match_directory(pattern_parts, directory_parts):
+    # whether a file below the directory may match the pattern
+    if not directory_parts:
+        return bool(pattern_parts)
+    if not pattern_parts:
+        return False
+    if pattern_parts[0] == RECURSIVE_WILDCARD:
+        return True
+    return fnmatch.fnmatch(directory_parts[0], pattern_parts[0]) \
+        and match_directory(pattern_parts[1:], directory_parts[1:])
+
+
+def match_any_directory(pattern_parts, directory_parts):
+    return any(match_directory(parts, directory_parts) for parts in pattern_parts)
+
+
+def scan(directory, descend, parts=()):
+    # yields the path components of every file below directory, relative to
+    # it, entering only the subdirectories descend(parts) accepts; links to
+    # directories are not followed
+    try:
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if descend(parts + (entry.name,)):
+                yield from scan(entry.path, descend, parts + (entry.name,))
+        elif entry.is_file():
+            yield list(parts) + [entry.name]
+
+
+def group_patterns(patterns):
+    # -> {directory to scan: [(directory of the pattern, its depth below the
+    # scanned one, pattern parts relative to the scanned one)]}
+    # A directory below the one of another pattern is scanned as part of it,
+    # so overlapping patterns like "a/b/*.zip" and "a/**/*.zip" walk a once.
+    split = [split_pattern(pattern) for pattern in patterns]
+    # the directories as written in the first pattern that refers to them
+    directories = {}
+    for directory, _ in split:
+        directories.setdefault(os.path.abspath(directory), directory)
+
+    groups = collections.OrderedDict()
+    for directory, parts in split:
+        path = os.path.abspath(directory)
+        root = min((candidate for candidate in directories
+                    if path == candidate or path.startswith(candidate.rstrip(os.sep) + os.sep)), key=len)
+        relative = os.path.relpath(path, root)
+        prefix = [glob.escape(part) for part in relative.split(os.sep)] if relative != "." else []
+        groups.setdefault(root, (directories[root], []))[1].append((directory, len(prefix), prefix + parts))
+    return collections.OrderedDict((scanned, entries) for scanned, entries in groups.values())
+
+
+def discover_files(patterns):
+    # Finds the files matching any of the patterns, with "**" for any number
+    # of directories. Every directory is scanned once, no matter how many
+    # patterns refer to it, and a file matched more than once, also through
+    # another path or a link, is only returned the first time.
+    file_names = []
+    seen = set()
+    for directory, entries in group_patterns(patterns).items():
+        pattern_parts = [parts for _, _, parts in entries]
+        descend = functools.partial(match_any_directory, pattern_parts)
+        for path_parts in scan(directory, descend):
+            for pattern_directory, depth, parts in entries:
+                if match_parts(parts, path_parts):
+                    break
+            else:
+                continue
+            # named after the first matching pattern, as if its directory had been scanned
+            file_name = pattern_directory.rstrip("/") + "/" + "/".join(path_parts[depth:])
+            real_path = os.path.realpath(file_name)
+            if real_path not in seen:
+                seen.add(real_path)
+                file_names.append(file_name)
+    return file_names
+
+
+def content_size(file_name):
+    # uncompressed size of all entries, i.e. entities.xml plus the attachments,
+    # from the zip central directory; the file size for anything else
+    try:
+        with open(file_name, "rb") as fd, ziputil.map_file(fd) as data:
+            _, offset, size = ziputil.end_of_central_directory(data)
+            return sum(entry[2] for entry in ziputil.central_directory_entries(data, offset, size))
+    except (IOError, ValueError):
+        return os.path.getsize(file_name)
+
+
+def order_files(file_names, order="size"):
+    # largest first, so that a big space does not start last and hold up the run
+    if order == "size":
+        return sorted(file_names, key=lambda file_name: -os.path.getsize(file_name))
+    if order == "inventory":
+        return sorted(file_names, key=lambda file_name: -content_size(file_name))
+    return list(file_names)
@@ -0,0 +1,322 @@
+import http.client
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from . import metrics
+# constant variables
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_RETRIES = 5
+DEFAULT_RETRY_DELAY = 1.0
+DEFAULT_SEGMENTS = 1
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".json"
+RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout)
+
+
+class IncompleteDownloadError(IOError):
+    pass
+
+
+def download(session, url, path, retries=DEFAULT_RETRIES, retry_delay=DEFAULT_RETRY_DELAY,
+             chunk_size=DEFAULT_CHUNK_SIZE, callback=None, checksum=None, retry_callback=None):
+    # Downloads url into path + ".part" and renames it to path once it is
+    # complete. After a dropped connection the download resumes from the last
+    # byte on disk, also across runs if the server sent a validator for it.
+    # An optional checksum (see integrity.StreamChecksum) is fed in-stream,
+    # retry_callback is called with the error before every retry.
+    part_file = path + PART_SUFFIX
+    attempt = 0
+
+    while True:
+        try:
+            download_part(session, url, part_file, chunk_size, callback, checksum)
+            break
+        except RETRY_EXCEPTIONS + (IncompleteDownloadError,) as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            if retry_callback is not None:
+                retry_callback(e)
+            time.sleep(retry_delay * attempt)
+
+    os.replace(part_file, path)
+    remove_state(part_file)
+    return path
+
+
+def download_part(session, url, part_file, chunk_size=DEFAULT_CHUNK_SIZE, callback=None, checksum=None):
+    offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+    state = load_state(part_file) if offset else None
+
+    headers = {}
+    if state is not None and resumable(state, url):
+        headers["Range"] = "bytes={}-".format(offset)
+        validator = state.get("etag") or state.get("last_modified")
+        if validator:
+            # the server sends the whole file again if it has changed
+            headers["If-Range"] = validator
+    else:
+        offset = 0
+
+    with session.get(url, stream=True, headers=headers) as response:
+        if response.status_code == 416 and offset:
+            # nothing left to download if the part file is already complete
+            if content_range(response.headers)[2] == offset == state.get("length"):
+                if checksum is not None:
+                    checksum.seek(part_file, offset)
+                return offset
+            remove_state(part_file)
+            os.remove(part_file)
+            raise IncompleteDownloadError("requested range not satisfiable, restarting download")
+
+        response.raise_for_status()
+
+        first, last, total = content_range(response.headers)
+        if response.status_code == 206 and first == offset and total == state.get("length"):
+            mode = "ab"
+        else:
+            offset = 0
+            mode = "wb"
+            total = content_length(response.headers)
+
+        save_state(part_file, {
+            "url": url,
+            "etag": strong_etag(response.headers.get("ETag")),
+            "last_modified": response.headers.get("Last-Modified"),
+            "length": total,
+        })
+
+        if checksum is not None:
+            checksum.seek(part_file, offset)
+
+        size = offset
+        # unbuffered, the chunks are written straight from the read buffer
+        with open(part_file, mode, buffering=0) as fd:
+            for chunk in read_chunks(response, chunk_size):
+                write_all(fd, chunk)
+                if checksum is not None:
+                    checksum.update(chunk)
+                size += len(chunk)
+                if callback is not None:
+                    callback(size, total)
+
+    if total is not None and size != total:
+        raise IncompleteDownloadError("received {} of {} bytes".format(size, total))
+    return size
+
+
+def download_segmented(session, url, path, segments, retries=DEFAULT_RETRIES, retry_delay=DEFAULT_RETRY_DELAY,
+                       chunk_size=DEFAULT_CHUNK_SIZE, callback=None, checksum=None, retry_callback=None):
+    # Fetches the archive as byte-range segments over parallel connections and
+    # writes them with positional writes into a preallocated part file. Falls
+    # back to download() if the server does not support ranges. The segments
+    # arrive out of order, so a checksum is computed from the finished file,
+    # which is still in the page cache at that point.
+    total, validator = probe_ranges(session, url)
+    segments = min(segments, total // MIN_SEGMENT_SIZE) if total else 0
+    if segments < 2:
+        return download(session, url, path, retries, retry_delay, chunk_size, callback, checksum, retry_callback)
+
+    part_file = path + PART_SUFFIX
+    # a part file with holes must never be resumed as a single stream
+    remove_state(part_file)
+
+    bounds = [total * i // segments for i in range(segments + 1)]
+    progress = SegmentProgress(total, callback)
+    fd = os.open(part_file, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0))
+    try:
+        preallocate(fd, total)
+        writer = PositionalWriter(fd)
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            # the requests of the segments are counted for the job of the calling thread
+            segment = metrics.bound(download_segment)
+            futures = [executor.submit(segment, session, url, validator, writer, bounds[i], bounds[i + 1],
+                                       total, retries, retry_delay, chunk_size, progress, retry_callback)
+                       for i in range(segments)]
+            for future in futures:
+                future.result()
+    finally:
+        os.close(fd)
+
+    if checksum is not None:
+        checksum.seek(part_file, total)
+    os.replace(part_file, path)
+    return path
+
+
+def read_chunks(response, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Yields the body of a streamed response as memoryviews of one reusable
+    # buffer, which is filled with readinto() directly from the connection.
+    # A view is only valid until the next one has been requested.
+    reader = getattr(response.raw, "_fp", None)
+    if not isinstance(reader, http.client.HTTPResponse) \
+            or response.headers.get("Content-Encoding", "identity").lower() != "identity":
+        # content that has to be decoded goes through requests
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            yield memoryview(chunk)
+        return
+
+    buffer = memoryview(bytearray(chunk_size))
+    while True:
+        try:
+            size = reader.readinto(buffer)
+        except (OSError, http.client.HTTPException) as e:
+            raise requests.exceptions.ConnectionError(e)
+        if not size:
+            break
+        yield buffer[:size]
+
+    # the body has been read completely, so the connection can be reused
+    response.raw.release_conn()
+
+
+def write_all(fd, data):
+    while data:
+        written = fd.write(data)
+        data = data[written:]
+
+
+def probe_ranges(session, url):
+    # -> (size, validator) if the server accepts byte ranges, (None, None) otherwise
+    try:
+        response = session.head(url, allow_redirects=True)
+    except RETRY_EXCEPTIONS:
+        return None, None
+    if not response.ok or response.headers.get("Accept-Ranges", "").lower() != "bytes":
+        return None, None
+    validator = strong_etag(response.headers.get("ETag")) or response.headers.get("Last-Modified")
+    return content_length(response.headers), validator
+
+
+def download_segment(session, url, validator, writer, first, end, total, retries, retry_delay, chunk_size,
+                     progress, retry_callback=None):
+    # downloads the bytes first .. end - 1, resuming the segment after errors
+    position = first
+    attempt = 0
+
+    while position < end:
+        headers = {"Range": "bytes={}-{}".format(position, end - 1)}
+        if validator:
+            headers["If-Range"] = validator
+        try:
+            with session.get(url, stream=True, headers=headers) as response:
+                response.raise_for_status()
+                if response.status_code != 206 or content_range(response.headers) != (position, end - 1, total):
+                    raise IncompleteDownloadError("server did not return the requested range")
+                for chunk in read_chunks(response, chunk_size):
+                    chunk = chunk[:end - position]
+                    writer.write(chunk, position)
+                    position += len(chunk)
+                    progress.add(len(chunk))
+            if position < end:
+                raise IncompleteDownloadError("received {} of {} bytes".format(position - first, end - first))
+        except RETRY_EXCEPTIONS + (IncompleteDownloadError,) as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            if retry_callback is not None:
+                retry_callback(e)
+            time.sleep(retry_delay * attempt)
+
+
+class SegmentProgress:
+
+    def __init__(self, total, callback):
+        self.total = total
+        self.callback = callback
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def add(self, size):
+        with self.lock:
+            self.size += size
+            if self.callback is not None:
+                self.callback(self.size, self.total)
+
+
+class PositionalWriter:
+    # os.pwrite where available, otherwise seek and write under a lock
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.lock = threading.Lock()
+
+    def write(self, data, offset):
+        view = memoryview(data)
+        while view:
+            if hasattr(os, "pwrite"):
+                written = os.pwrite(self.fd, view, offset)
+            else:
+                with self.lock:
+                    os.lseek(self.fd, offset, os.SEEK_SET)
+                    written = os.write(self.fd, view)
+            view = view[written:]
+            offset += written
+
+
+def preallocate(fd, size):
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+
+def resumable(state, url):
+    # without a validator a partial file can only be continued from the same url
+    if state.get("length") is None:
+        return False
+    return bool(state.get("etag") or state.get("last_modified") or state.get("url") == url)
+
+
+def content_length(headers):
+    value = headers.get("Content-Length")
+    return int(value) if value is not None and value.isdigit() else None
+
+
+def content_range(headers):
+    # "bytes 100-199/200" or "bytes */200" -> (first, last, total)
+    match = re.match(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)", headers.get("Content-Range", ""))
+    if match is None:
+        return None, None, None
+    return tuple(int(value) if value is not None and value != "*" else None for value in match.groups())
+
+
+def strong_etag(etag):
+    # weak validators must not be used in If-Range
+    if etag is None or etag.startswith("W/"):
+        return None
+    return etag
+
+
+def state_file(part_file):
+    return part_file + STATE_SUFFIX
+
+
+def load_state(part_file):
+    try:
+        with open(state_file(part_file)) as fd:
+            return json.load(fd)
+    except (IOError, ValueError):
+        return None
+
+
+def save_state(part_file, state):
+    with open(state_file(part_file), "w") as fd:
+        json.dump(state, fd)
+
+
+def remove_state(part_file):
+    if os.path.exists(state_file(part_file)):
+        os.remove(state_file(part_file))
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+
+from . import manifest
+from . import ziputil
+
+# constant variables
+SIDECAR_SUFFIX = ".manifest.json"
+
+
+class StreamChecksum:
+    # SHA-256 of a file that is written from start to end, fed with the
+    # chunks as they arrive. If a download continues a part file that was not
+    # hashed in this run, the bytes already on disk are read back once.
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def update(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+
+    def seek(self, path, offset):
+        if offset == self.size:
+            return
+        self.digest = hashlib.sha256()
+        self.size = 0
+        if not offset:
+            return
+        with open(path, "rb") as fd:
+            while self.size < offset:
+                block = fd.read(min(manifest.HASH_BUFFER_SIZE, offset - self.size))
+                if not block:
+                    raise IOError("{} is shorter than {} bytes".format(path, offset))
+                self.update(block)
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def sidecar_path(path):
+    return path + SIDECAR_SUFFIX
+
+
+def write_sidecar(path, **fields):
+    temp_file = sidecar_path(path) + ".tmp"
+    with open(temp_file, "w") as fd:
+        json.dump(dict(fields, file=os.path.basename(path)), fd, indent=2, sort_keys=True)
+    os.replace(temp_file, sidecar_path(path))
+
+
+def load_sidecar(path):
+    try:
+        with open(sidecar_path(path)) as fd:
+            return json.load(fd)
+    except (IOError, ValueError):
+        return None
+
+
+def verify_archive(path):
+    # -> None if the archive matches its sidecar manifest, the reason otherwise
+    if not os.path.exists(path):
+        return "archive missing"
+    expected = load_sidecar(path)
+    if expected is None:
+        return "manifest missing"
+    if os.path.getsize(path) != expected.get("size"):
+        return "size mismatch"
+    if expected.get("central_directory_crc32") is not None:
+        # cheap check first, it only reads the end of the archive
+        try:
+            crc = ziputil.central_directory_crc32(path)
+        except ziputil.InvalidArchiveError:
+            return "central directory damaged"
+        if crc != expected["central_directory_crc32"]:
+            return "central directory mismatch"
+    if manifest.file_sha256(path) != expected.get("sha256"):
+        return "checksum mismatch"
+    return None
+
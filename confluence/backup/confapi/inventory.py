@@ -0,0 +1,116 @@
+import os
+import xml.etree.ElementTree as ElementTree
+import zipfile
+
+# constant variables
+ENTITIES_FILE = "entities.xml"
+DESCRIPTOR_FILE = "exportDescriptor.properties"
+ATTACHMENTS_PREFIX = "attachments/"
+READ_BUFFER_SIZE = 1024 * 1024
+COUNTED_CLASSES = {"Page": "pages", "BlogPost": "blog_posts", "Attachment": "attachments"}
+
+
+class InventoryError(IOError):
+    pass
+
+
+def read_descriptor(archive):
+    properties = {}
+    if DESCRIPTOR_FILE not in archive.NameToInfo:
+        return properties
+    with archive.open(DESCRIPTOR_FILE) as fd:
+        for line in fd.read().decode("utf-8", "replace").splitlines():
+            if "=" in line and not line.lstrip().startswith("#"):
+                name, value = line.split("=", 1)
+                properties[name.strip()] = value.strip()
+    return properties
+
+
+def space_inventory(path):
+    # Counts the pages, blog posts and attachments of a space export. The
+    # entities.xml is decompressed and parsed as a stream and every top-level
+    # object is dropped as soon as it has been counted, so the memory use does
+    # not depend on the size of the archive. Historical versions of content
+    # are not counted. The attachment bytes are taken from the zip directory.
+    try:
+        archive = zipfile.ZipFile(path)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise InventoryError("cannot read {}: {}".format(path, e))
+
+    with archive:
+        if ENTITIES_FILE not in archive.NameToInfo:
+            raise InventoryError("{} contains no {}".format(path, ENTITIES_FILE))
+
+        inventory = {
+            "file": os.path.basename(path),
+            "size": os.path.getsize(path),
+            "space_key": read_descriptor(archive).get("spaceKey"),
+            "pages": 0,
+            "blog_posts": 0,
+            "attachments": 0,
+            "attachment_files": 0,
+            "attachment_bytes": 0,
+            "entities_bytes": archive.getinfo(ENTITIES_FILE).file_size,
+        }
+        for info in archive.infolist():
+            if info.filename.startswith(ATTACHMENTS_PREFIX) and not info.is_dir():
+                inventory["attachment_files"] += 1
+                inventory["attachment_bytes"] += info.file_size
+
+        with archive.open(ENTITIES_FILE) as fd:
+            try:
+                count_objects(fd, inventory)
+            except ElementTree.ParseError as e:
+                raise InventoryError("{} of {} is damaged: {}".format(ENTITIES_FILE, path, e))
+            except (zipfile.BadZipFile, EOFError, OSError) as e:
+                raise InventoryError("cannot read {} of {}: {}".format(ENTITIES_FILE, path, e))
+
+    return inventory
+
+
+def count_objects(fd, inventory):
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    depth = 0
+    root = None
+    while True:
+        block = fd.read(READ_BUFFER_SIZE)
+        if not block:
+            break
+        parser.feed(block)
+        for event, element in parser.read_events():
+            if event == "start":
+                if depth == 0:
+                    root = element
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth == 1 and element.tag == "object":
+                count_object(element, inventory)
+                # forget the object, only the counters are kept
+                root.clear()
+    parser.close()
+
+
+def count_object(element, inventory):
+    object_class = element.get("class")
+    if object_class == "Space":
+        key = find_property(element, "key")
+        if key and not inventory["space_key"]:
+            inventory["space_key"] = key
+        return
+
+    counter = COUNTED_CLASSES.get(object_class)
+    if counter is None or find_property(element, "originalVersion") is not None:
+        return
+    if find_property(element, "contentStatus") not in (None, "current"):
+        return
+    inventory[counter] += 1
+
+
+def find_property(element, name):
+    for child in element:
+        if child.tag == "property" and child.get("name") == name:
+            # references to other objects keep their id in a nested element
+            return child.text if len(child) == 0 else "".join(child.itertext())
+    return None
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import threading
+import time
+
+from . import manifest
+
+# constant variables
+JOURNAL_PREFIX = ".confapi-"
+JOURNAL_SUFFIX = ".db"
+PROGRESS_INTERVAL = 1.0
+QUEUED = "queued"
+READY = "ready"
+DONE = "done"
+FAILED = "failed"
+COLUMNS = ["item", "state", "queue_url", "location", "bytes", "sha256", "updated"]
+
+
+def journal_path(host, kind, directory=None):
+    # one journal per host and script, e.g. .confapi-export-localhost_1990_confluence.db
+    return os.path.join(directory or os.getcwd(),
+                        JOURNAL_PREFIX + kind + "-" + manifest.host_slug(host) + JOURNAL_SUFFIX)
+
+
+class JobJournal:
+    # Records every state change of the jobs of a run in a SQLite database
+    # before the run goes on, so that a run which has been killed can
+    # re-attach to the server-side tasks it started instead of starting them
+    # again. Items are space keys or file names.
+
+    def __init__(self, path, progress_interval=PROGRESS_INTERVAL, clock=time.monotonic):
+        self.path = path
+        self.progress_interval = progress_interval
+        self.clock = clock
+        self.progress_times = {}
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS jobs (item TEXT PRIMARY KEY, state TEXT NOT NULL, "
+                                    "queue_url TEXT, location TEXT, bytes INTEGER, sha256 TEXT, updated TEXT)")
+
+    def get(self, item):
+        with self.lock:
+            row = self.connection.execute("SELECT " + ", ".join(COLUMNS) + " FROM jobs WHERE item = ?",
+                                          (item,)).fetchone()
+        return dict(zip(COLUMNS, row)) if row is not None else None
+
+    def entries(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT " + ", ".join(COLUMNS) + " FROM jobs ORDER BY item").fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def record(self, item, state, **fields):
+        # fields that are not given keep their value
+        unknown = set(fields) - set(COLUMNS[2:-1])
+        if unknown:
+            raise ValueError("unknown journal fields: " + ", ".join(sorted(unknown)))
+        fields["state"] = state
+        fields["updated"] = manifest.utc_now()
+        names = sorted(fields)
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO jobs (item, state) VALUES (?, ?)", (item, state))
+            self.connection.execute("UPDATE jobs SET " + ", ".join(name + " = ?" for name in names) +
+                                    " WHERE item = ?", [fields[name] for name in names] + [item])
+            self.progress_times.pop(item, None)
+
+    def progress(self, item, bytes_transferred):
+        # called for every chunk, so it is only written once per interval
+        now = self.clock()
+        with self.lock:
+            last = self.progress_times.get(item)
+            if last is not None and now - last < self.progress_interval:
+                return
+            self.progress_times[item] = now
+            with self.connection:
+                self.connection.execute("UPDATE jobs SET bytes = ? WHERE item = ?", (bytes_transferred, item))
+
+    def forget(self, items):
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM jobs WHERE item = ?", [(item,) for item in items])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
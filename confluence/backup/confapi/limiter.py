@@ -0,0 +1,173 @@
+import threading
+import time
+
+import requests
+
+from . import polling
+
+# constant variables
+DEFAULT_OVERLOAD_RETRIES = 5
+DEFAULT_OVERLOAD_DELAY = 1.0
+MAX_OVERLOAD_DELAY = 30.0
+DEFAULT_LATENCY_TOLERANCE = 2.0
+DEFAULT_DECREASE_FACTOR = 0.5
+DEFAULT_COOLDOWN = 1.0
+# latencies differing by less than this are noise, not a trend
+MIN_LATENCY_INCREASE = 0.05
+LATENCY_SMOOTHING = 0.2
+BASELINE_DRIFT = 0.01
+
+
+def is_overload(response=None, error=None):
+    # 429, 503 and timeouts mean the server cannot keep up, unlike other errors
+    if error is not None:
+        return isinstance(error, requests.exceptions.Timeout)
+    return response is not None and response.status_code in polling.RETRY_STATUS_CODES
+
+
+def overload_delay(response, attempt):
+    # the delay the server asks for, or an exponential backoff
+    retry_after = polling.parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+    if retry_after is not None:
+        return min(MAX_OVERLOAD_DELAY, retry_after)
+    return min(MAX_OVERLOAD_DELAY, DEFAULT_OVERLOAD_DELAY * 2 ** attempt)
+
+
+def create_limiters(max_jobs=None, max_rps=None):
+    # -> (AdaptiveLimiter for up to max_jobs jobs or None, TokenBucket or None)
+    adaptive_limiter = AdaptiveLimiter(maximum=max_jobs) if max_jobs else None
+    token_bucket = TokenBucket(max_rps) if max_rps else None
+    return adaptive_limiter, token_bucket
+
+
+def send_submission(session, method, url, retries=DEFAULT_OVERLOAD_RETRIES, retry_callback=None, sleep=time.sleep,
+                    **kwargs):
+    # an overloaded server gets the submission again after the delay it asks
+    # for; retry_callback is called with the response and the delay
+    attempt = 0
+    while True:
+        response = session.request(method, url, **kwargs)
+        if not is_overload(response) or attempt >= retries:
+            return response
+        delay = overload_delay(response, attempt)
+        attempt += 1
+        if retry_callback is not None:
+            retry_callback(response, delay)
+        sleep(delay)
+
+
+class TokenBucket:
+    # Allows rate requests per second on average with bursts of up to burst
+    # requests. acquire() reserves a token and sleeps until it is due, so
+    # concurrent callers are served in order.
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("invalid request rate: {}".format(rate))
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.updated = clock()
+        self.lock = threading.Lock()
+        self.waits = 0
+
+    def acquire(self):
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if delay:
+                self.waits += 1
+        if delay:
+            self.sleep(delay)
+        return delay
+
+
+class AdaptiveLimiter:
+    # Number of concurrent jobs, adapted like a TCP congestion window:
+    # every limit successful requests without rising latency add one job,
+    # an overload response, a timeout or a smoothed latency above tolerance
+    # times the baseline cut the limit by the decrease factor. Cuts happen
+    # at most once per cooldown, so one burst of errors counts once.
+
+    def __init__(self, maximum, minimum=1, initial=None, tolerance=DEFAULT_LATENCY_TOLERANCE,
+                 decrease=DEFAULT_DECREASE_FACTOR, cooldown=DEFAULT_COOLDOWN, clock=time.monotonic):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = float(min(self.maximum, max(self.minimum, initial or self.minimum)))
+        self.tolerance = tolerance
+        self.decrease_factor = decrease
+        self.cooldown = cooldown
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.latency = None
+        self.baseline = None
+        self.successes = 0
+        self.last_decrease = None
+        # statistics for the summary
+        self.highest = int(self.limit)
+        self.increases = 0
+        self.decreases = 0
+        self.overloads = 0
+
+    def current(self):
+        with self.lock:
+            return int(self.limit)
+
+    def success(self, latency=None):
+        with self.lock:
+            if latency is not None and self.observe_latency(latency):
+                self.decrease()
+                return
+            self.successes += 1
+            if self.successes >= int(self.limit) and self.limit < self.maximum:
+                self.successes = 0
+                self.limit = min(self.maximum, self.limit + 1)
+                self.highest = max(self.highest, int(self.limit))
+                self.increases += 1
+
+    def overload(self):
+        with self.lock:
+            self.overloads += 1
+            self.decrease()
+
+    def observe(self, method, response=None, error=None):
+        # overloads cut the limit and answers below 400 count as successes;
+        # other errors, like 404 or 500, say nothing about the load
+        if is_overload(response, error):
+            self.overload()
+        elif response is not None and response.status_code < 400:
+            # the time until the headers of an upload includes the upload itself
+            self.success(response.elapsed.total_seconds() if method in ("GET", "HEAD") else None)
+
+    def observe_latency(self, latency):
+        # returns True if the latency is rising
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+        if self.baseline is None:
+            self.baseline = self.latency
+        else:
+            # follows a server that has become slower for good, but slowly
+            self.baseline = min(self.latency, self.baseline + BASELINE_DRIFT * (self.latency - self.baseline))
+        return self.latency > self.baseline * self.tolerance and self.latency - self.baseline > MIN_LATENCY_INCREASE
+
+    def decrease(self):
+        now = self.clock()
+        self.successes = 0
+        if self.last_decrease is not None and now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        if self.limit > self.minimum:
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            self.decreases += 1
+
+    def summary(self):
+        with self.lock:
+            return "Concurrency: {} jobs (highest {}, maximum {}), {} increases, {} decreases, {} overloads".format(
+                int(self.limit), self.highest, self.maximum, self.increases, self.decreases, self.overloads)
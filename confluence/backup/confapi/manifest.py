@@ -0,0 +1,69 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+
+# constant variables
+MANIFEST_PREFIX = ".confapi-export-"
+MANIFEST_SUFFIX = ".json"
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def host_slug(host):
+    # "http://localhost:1990/confluence" -> "localhost_1990_confluence"
+    return re.sub(r"[^A-Za-z0-9]+", "_", re.sub(r"^[a-z]+://", "", host)).strip("_")
+
+
+def manifest_path(host, directory=None):
+    # one manifest per host, e.g. .confapi-export-localhost_1990_confluence.json
+    return os.path.join(directory or os.getcwd(), MANIFEST_PREFIX + host_slug(host) + MANIFEST_SUFFIX)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fd:
+        for block in iter(lambda: fd.read(HASH_BUFFER_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class ExportManifest:
+    # Remembers the last export of every space of one host: when it was
+    # exported, the last-modified marker of the space at that time and the
+    # checksum of the archive. Saved after every update, so that an aborted
+    # run keeps what it has finished.
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.spaces = {}
+        if os.path.exists(path):
+            with open(path) as fd:
+                self.spaces = json.load(fd).get("spaces", {})
+
+    def get(self, key):
+        with self.lock:
+            return self.spaces.get(key)
+
+    def unchanged(self, key, last_modified, archive_size):
+        # a space can only be skipped if its archive is still there
+        entry = self.get(key)
+        return entry is not None and last_modified is not None and entry.get("last_modified") == last_modified \
+            and archive_size is not None and archive_size == entry.get("size")
+
+    def update(self, key, **fields):
+        with self.lock:
+            self.spaces.setdefault(key, {}).update(fields)
+            self.save()
+
+    def save(self):
+        temp_file = self.path + ".tmp"
+        with open(temp_file, "w") as fd:
+            json.dump({"spaces": self.spaces}, fd, indent=2, sort_keys=True)
+        os.replace(temp_file, self.path)
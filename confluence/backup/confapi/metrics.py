@@ -0,0 +1,260 @@
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+from . import polling
+from . import scheduler
+
+# constant variables
+PROMETHEUS_PREFIX = "confapi_"
+TRANSFER_PHASES = ("download", "upload", "transfer")
+
+# item of the job processed by this thread outside of the scheduler
+_context = threading.local()
+
+
+@contextlib.contextmanager
+def bind(item):
+    previous = getattr(_context, "item", None)
+    _context.item = item
+    try:
+        yield
+    finally:
+        _context.item = previous
+
+
+def bound(function):
+    # runs function with the item of the calling thread, e.g. on a worker thread
+    item = current_item()
+
+    @functools.wraps(function)
+    def run(*args, **kwargs):
+        with bind(item):
+            return function(*args, **kwargs)
+    return run
+
+
+def current_item():
+    item = getattr(_context, "item", None)
+    if item is None:
+        job = scheduler.current_job()
+        item = job.item if job is not None else None
+    return item
+
+
+class JobMetrics:
+
+    def __init__(self, item, started):
+        self.item = item
+        self.started = started
+        self.phase = None
+        self.phase_started = started
+        self.phases = collections.OrderedDict()
+        self.bytes = 0
+        self.requests = 0
+        self.throttled = 0
+        self.failed_requests = 0
+        self.retries = 0
+        self.code = None
+        self.message = None
+        self.seconds = None
+
+    def transfer_seconds(self):
+        return sum(seconds for phase, seconds in self.phases.items() if phase in TRANSFER_PHASES)
+
+    def bytes_per_second(self):
+        seconds = self.transfer_seconds()
+        return int(self.bytes / seconds) if self.bytes and seconds > 0 else None
+
+    def describe_phases(self):
+        return ", ".join("{} {:.2f}s".format(phase, seconds) for phase, seconds in self.phases.items())
+
+    def to_dict(self):
+        return {"item": self.item, "code": self.code, "message": self.message,
+                "seconds": round(self.seconds, 3) if self.seconds is not None else None,
+                "phases": collections.OrderedDict((phase, round(seconds, 3)) for phase, seconds in self.phases.items()),
+                "bytes": self.bytes, "bytes_per_second": self.bytes_per_second(), "requests": self.requests,
+                "throttled": self.throttled, "failed_requests": self.failed_requests, "retries": self.retries}
+
+
+class RunMetrics:
+    # Timings per job and phase plus request, retry and byte counts of one run.
+    # A job moves from phase to phase, e.g. submit, queue, processing,
+    # download, and the time until the next phase starts is booked on the
+    # current one. Finished phases and jobs are appended to an optional
+    # JSON-lines event log as they happen.
+
+    def __init__(self, script, event_log=None, clock=time.monotonic, wall_clock=time.time):
+        self.script = script
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.lock = threading.Lock()
+        self.started = clock()
+        self.seconds = None
+        self.jobs = collections.OrderedDict()
+        # requests that do not belong to a job, like the credential check
+        self.unassigned = JobMetrics(None, self.started)
+        self.event_fd = open(event_log, "a") if event_log else None
+        self.emit("run_started", script=script)
+
+    def job(self, item):
+        if item is None:
+            return self.unassigned
+        if item not in self.jobs:
+            self.jobs[item] = JobMetrics(item, self.clock())
+        return self.jobs[item]
+
+    def emit(self, event, **fields):
+        if self.event_fd is None:
+            return
+        record = collections.OrderedDict([("timestamp", round(self.wall_clock(), 3)), ("event", event)])
+        record.update(fields)
+        self.event_fd.write(json.dumps(record) + "\n")
+        self.event_fd.flush()
+
+    def end_phase(self, job, now):
+        if job.phase is None:
+            return
+        seconds = now - job.phase_started
+        job.phases[job.phase] = job.phases.get(job.phase, 0.0) + seconds
+        self.emit("phase", item=job.item, phase=job.phase, seconds=round(seconds, 3))
+        job.phase = None
+
+    def phase(self, item, phase):
+        with self.lock:
+            job = self.job(item)
+            if job.phase == phase:
+                return
+            now = self.clock()
+            self.end_phase(job, now)
+            job.phase = phase
+            job.phase_started = now
+
+    def add_bytes(self, item, size):
+        with self.lock:
+            self.job(item).bytes += size
+
+    def count_request(self, status_code):
+        # status_code is None if the request has failed
+        with self.lock:
+            job = self.job(current_item())
+            job.requests += 1
+            if status_code is None:
+                job.failed_requests += 1
+            elif status_code in polling.RETRY_STATUS_CODES:
+                job.throttled += 1
+
+    def count_retry(self, item):
+        with self.lock:
+            self.job(item).retries += 1
+
+    def finish(self, item, code, message):
+        with self.lock:
+            job = self.job(item)
+            if item is not None and job.code is not None:
+                # only the first result of a job counts
+                return
+            now = self.clock()
+            self.end_phase(job, now)
+            job.code = code
+            job.message = message
+            job.seconds = now - job.started
+            self.emit("job_finished", **job.to_dict())
+
+    def totals(self):
+        jobs = list(self.jobs.values()) + [self.unassigned]
+        phases = collections.OrderedDict()
+        for job in jobs:
+            for phase, seconds in job.phases.items():
+                phases[phase] = phases.get(phase, 0.0) + seconds
+        return {"jobs": len(self.jobs), "failed_jobs": sum(1 for job in self.jobs.values() if job.code),
+                "phases": phases, "bytes": sum(job.bytes for job in jobs),
+                "requests": sum(job.requests for job in jobs), "throttled": sum(job.throttled for job in jobs),
+                "failed_requests": sum(job.failed_requests for job in jobs),
+                "retries": sum(job.retries for job in jobs)}
+
+    def summary(self):
+        with self.lock:
+            totals = self.totals()
+        phases = ", ".join("{} {:.2f}s".format(phase, seconds) for phase, seconds in totals["phases"].items())
+        return "Time by phase: {}; {} jobs, {} bytes, {} retries, {} throttled responses".format(
+            phases or "none", totals["jobs"], totals["bytes"], totals["retries"], totals["throttled"])
+
+    def close(self, prometheus_file=None):
+        with self.lock:
+            self.seconds = self.clock() - self.started
+            totals = self.totals()
+            totals["phases"] = collections.OrderedDict((phase, round(seconds, 3))
+                                                       for phase, seconds in totals["phases"].items())
+            self.emit("run_finished", script=self.script, seconds=round(self.seconds, 3), **totals)
+            if prometheus_file:
+                write_textfile(prometheus_file, self.prometheus_lines())
+            if self.event_fd is not None:
+                self.event_fd.close()
+                self.event_fd = None
+
+    def prometheus_lines(self):
+        # node exporter textfile format; every job is a set of label values
+        script = [("script", self.script)]
+        totals = self.totals()
+        metrics = collections.OrderedDict()
+
+        def add(name, help_text, labels, value):
+            if value is None:
+                return
+            metrics.setdefault(name, (help_text, []))[1].append((labels, value))
+
+        for job in self.jobs.values():
+            labels = script + [("item", job.item)]
+            for phase, seconds in job.phases.items():
+                add("job_phase_seconds", "Seconds a job has spent in a phase.", labels + [("phase", phase)], seconds)
+            add("job_duration_seconds", "Seconds from the first to the last step of a job.", labels, job.seconds)
+            add("job_bytes", "Bytes downloaded or uploaded for a job.", labels, job.bytes)
+            add("job_bytes_per_second", "Throughput of the transfer of a job.", labels, job.bytes_per_second())
+            add("job_requests", "HTTP requests sent for a job.", labels, job.requests)
+            add("job_retries", "Transfers of a job that have been retried.", labels, job.retries)
+            add("job_throttled_responses", "Responses of a job with status 429 or 503.", labels, job.throttled)
+            add("job_success", "1 if the job has succeeded, 0 otherwise.", labels,
+                1 if job.code == 0 else 0 if job.code is not None else None)
+
+        for phase, seconds in totals["phases"].items():
+            add("run_phase_seconds", "Seconds all jobs of the run have spent in a phase.",
+                script + [("phase", phase)], seconds)
+        add("run_duration_seconds", "Seconds the run has taken.", script, self.seconds)
+        add("run_jobs", "Jobs of the run.", script, totals["jobs"])
+        add("run_failed_jobs", "Jobs of the run that have failed.", script, totals["failed_jobs"])
+        add("run_bytes", "Bytes downloaded or uploaded in the run.", script, totals["bytes"])
+        add("run_requests", "HTTP requests sent in the run.", script, totals["requests"])
+        add("run_retries", "Transfers retried in the run.", script, totals["retries"])
+        add("run_finished_timestamp_seconds", "Unix time the run has finished.", script, self.wall_clock())
+
+        lines = []
+        for name, (help_text, samples) in metrics.items():
+            lines.append("# HELP {}{} {}".format(PROMETHEUS_PREFIX, name, help_text))
+            lines.append("# TYPE {}{} gauge".format(PROMETHEUS_PREFIX, name))
+            for labels, value in samples:
+                lines.append("{}{}{{{}}} {}".format(PROMETHEUS_PREFIX, name, ",".join(
+                    '{}="{}"'.format(label, escape_label(value)) for label, value in labels), format_value(value)))
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def write_textfile(path, lines):
+    # the node exporter must never read a half-written file
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as fd:
+        fd.write("\n".join(lines) + "\n")
+    os.replace(temporary_path, path)
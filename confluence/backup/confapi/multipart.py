@@ -0,0 +1,61 @@
+import os
+import uuid
+
+# constant variables
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class MultipartFileEncoder:
+    # multipart/form-data body with a single file field that is streamed from
+    # its source in chunks instead of being encoded in memory. Instances are
+    # iterable and have a length, so requests sends them with Content-Length.
+
+    def __init__(self, file_name, size, open_file, field_name="file", content_type="application/octet-stream",
+                 chunk_size=DEFAULT_CHUNK_SIZE, callback=None):
+        # open_file returns a binary file-like object; it is opened when the
+        # body is sent and closed as soon as it has been read. Without a size
+        # the encoder has no length and is only usable as a chunked body.
+        self.size = size
+        self.open_file = open_file
+        self.chunk_size = chunk_size
+        self.callback = callback
+        self.boundary = uuid.uuid4().hex
+        self.content_type = "multipart/form-data; boundary=" + self.boundary
+
+        self.header = ("--{}\r\n"
+                       "Content-Disposition: form-data; name=\"{}\"; filename=\"{}\"\r\n"
+                       "Content-Type: {}\r\n"
+                       "\r\n").format(self.boundary, quote(field_name), quote(file_name), content_type).encode("utf-8")
+        self.footer = "\r\n--{}--\r\n".format(self.boundary).encode("ascii")
+        self.bytes_read = 0
+
+    @classmethod
+    def from_path(cls, path, **kwargs):
+        return cls(os.path.basename(path), os.path.getsize(path), lambda: open(path, "rb"), **kwargs)
+
+    def __len__(self):
+        return len(self.header) + self.size + len(self.footer)
+
+    def __iter__(self):
+        # the body can be sent again, e.g. after the server was overloaded
+        self.bytes_read = 0
+        yield self.header
+
+        with self.open_file() as fd:
+            while True:
+                chunk = fd.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.bytes_read += len(chunk)
+                yield chunk
+                if self.callback is not None:
+                    self.callback(self.bytes_read, self.size)
+
+        if self.size is not None and self.bytes_read != self.size:
+            raise IOError("expected {} bytes but read {} bytes".format(self.size, self.bytes_read))
+
+        yield self.footer
+
+
+def quote(value):
+    return value.replace("\\", "\\\\").replace("\"", "%22").replace("\r", "%0D").replace("\n", "%0A")
@@ -0,0 +1,110 @@
+import threading
+from urllib.parse import urljoin
+
+from . import progress
+
+
+def normalize_url(url):
+    return url.rstrip("/")
+
+
+class Node:
+
+    def __init__(self, base_url):
+        self.base_url = normalize_url(base_url)
+        self.in_flight = 0
+        # statistics for the summary
+        self.jobs = 0
+        self.failed = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def bytes_per_second(self):
+        return int(self.bytes / self.seconds) if self.bytes and self.seconds > 0 else None
+
+    def describe(self):
+        text = "{}: {} jobs, {} failed, {}".format(self.base_url, self.jobs, self.failed,
+                                                   progress.format_bytes(self.bytes))
+        if self.bytes_per_second():
+            text += " in {:.1f}s ({}/s)".format(self.seconds, progress.format_bytes(self.bytes_per_second()))
+        return text
+
+
+class NodePool:
+    # Spreads the jobs of a run across the nodes of a Data Center cluster.
+    # A job goes to the node with the fewest jobs in flight and stays there:
+    # the queue and download URLs in the answers of a node carry the base URL
+    # of the cluster, which could lead to a node that does not know the job,
+    # so they are pinned to the node that has accepted it.
+
+    def __init__(self, base_urls, cluster_url=None):
+        self.nodes = [Node(base_url) for base_url in base_urls]
+        if not self.nodes:
+            raise ValueError("no nodes given")
+        self.cluster_url = normalize_url(cluster_url) if cluster_url else None
+        self.assigned = {}
+        self.released = set()
+        self.lock = threading.Lock()
+
+    def acquire(self, item):
+        with self.lock:
+            node = self.assigned.get(item)
+            if node is None:
+                # ties go to the node with the fewest jobs so far, then to the first one
+                node = min(self.nodes, key=lambda candidate: (candidate.in_flight, candidate.jobs))
+                self.assign(item, node)
+            return node
+
+    def assign(self, item, node):
+        self.assigned[item] = node
+        node.in_flight += 1
+        node.jobs += 1
+
+    def attach(self, item, url):
+        # moves a job to the node its URL points to, e.g. one of an interrupted run
+        with self.lock:
+            for node in self.nodes:
+                if url and (url == node.base_url or url.startswith(node.base_url + "/")):
+                    previous = self.assigned.pop(item, None)
+                    if previous is not None:
+                        previous.in_flight -= 1
+                        previous.jobs -= 1
+                    self.assign(item, node)
+                    return node
+            return self.assigned.get(item)
+
+    def node(self, item):
+        with self.lock:
+            return self.assigned.get(item)
+
+    def pin(self, item, url):
+        node = self.node(item)
+        if node is None or url is None:
+            return url
+        url = urljoin(node.base_url + "/", url)
+        if self.cluster_url and node.base_url != self.cluster_url and \
+                (url == self.cluster_url or url.startswith(self.cluster_url + "/")):
+            url = node.base_url + url[len(self.cluster_url):]
+        return url
+
+    def add_transfer(self, item, size, seconds):
+        with self.lock:
+            node = self.assigned.get(item)
+            if node is not None:
+                node.bytes += size
+                node.seconds += seconds
+
+    def release(self, item, failed=False):
+        # the node stays assigned for the statistics, but is free for another job
+        with self.lock:
+            node = self.assigned.get(item)
+            if node is None or item in self.released:
+                return
+            self.released.add(item)
+            node.in_flight -= 1
+            if failed:
+                node.failed += 1
+
+    def summary(self):
+        with self.lock:
+            return "\n".join("Node " + node.describe() for node in self.nodes)
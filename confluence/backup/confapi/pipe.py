@@ -0,0 +1,91 @@
+import collections
+import threading
+
+# constant variables
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+
+
+class StreamPipe:
+    # Bounded in-memory pipe between a writer and a reader thread, e.g. a
+    # download feeding an upload. write() blocks while the buffer is full, so
+    # a slow reader slows the writer down instead of the whole stream piling
+    # up in memory. The reader side is a binary file-like object.
+
+    def __init__(self, max_size=DEFAULT_BUFFER_SIZE):
+        self.max_size = max_size
+        self.chunks = collections.deque()
+        self.size = 0
+        self.closed = False
+        self.error = None
+        self.aborted = False
+        self.condition = threading.Condition()
+        # statistics for the summary
+        self.bytes_written = 0
+        self.writer_waits = 0
+
+    def write(self, data):
+        # the data is copied, so views of a reused read buffer can be passed
+        data = bytes(data)
+        with self.condition:
+            if self.size and self.size + len(data) > self.max_size and not self.aborted:
+                self.writer_waits += 1
+            # a chunk larger than the buffer is accepted once the buffer is empty
+            while self.size and self.size + len(data) > self.max_size and not self.aborted:
+                self.condition.wait()
+            if self.aborted:
+                raise BrokenPipeError("the reader has stopped reading")
+            self.chunks.append(data)
+            self.size += len(data)
+            self.bytes_written += len(data)
+            self.condition.notify_all()
+        return len(data)
+
+    def close(self, error=None):
+        # called by the writer when it is done, with the exception if it failed
+        with self.condition:
+            self.closed = True
+            self.error = error
+            self.condition.notify_all()
+
+    def abort(self):
+        # called by the reader if it stops reading before the end
+        with self.condition:
+            self.aborted = True
+            self.chunks.clear()
+            self.size = 0
+            self.condition.notify_all()
+
+    def read(self, size=-1):
+        with self.condition:
+            while not self.chunks and not self.closed:
+                self.condition.wait()
+            if not self.chunks:
+                if self.error is not None:
+                    raise IOError("the writer has failed: {}".format(self.error))
+                return b""
+
+            if size is None or size < 0:
+                size = self.size
+            parts = []
+            remaining = size
+            while self.chunks and remaining > 0:
+                chunk = self.chunks.popleft()
+                if len(chunk) > remaining:
+                    self.chunks.appendleft(chunk[remaining:])
+                    chunk = chunk[:remaining]
+                parts.append(chunk)
+                remaining -= len(chunk)
+            data = b"".join(parts)
+            self.size -= len(data)
+            self.condition.notify_all()
+            return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # the reader is done; if it stopped early the writer must not block forever
+        with self.condition:
+            finished = self.closed and not self.chunks
+        if not finished:
+            self.abort()
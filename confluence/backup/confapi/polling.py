@@ -0,0 +1,125 @@
+import email.utils
+import random
+import time
+
+# constant variables
+DEFAULT_MIN_INTERVAL = 0.5
+DEFAULT_MAX_INTERVAL = 30.0
+RETRY_STATUS_CODES = [429, 503]
+
+
+def parse_retry_after(value, now=None):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, date.timestamp() - now)
+
+
+class PollingStrategy:
+    # Decides how long to wait before the next status request of one job.
+    # A new instance is created for every job, so strategies may keep state.
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("invalid polling interval: {} - {}".format(min_interval, max_interval))
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    def next_interval(self, percentage, response=None):
+        retry_after = self.retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        return self.interval(percentage)
+
+    def interval(self, percentage):
+        raise NotImplementedError
+
+    def retry_after(self, response):
+        if response is None:
+            return None
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is None:
+            return None
+        # never poll earlier than the server asked for
+        return max(self.min_interval, retry_after)
+
+    def clamp(self, interval):
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def wait(self, percentage, response=None):
+        time.sleep(self.next_interval(percentage, response))
+
+
+class FixedPolling(PollingStrategy):
+    # Polls at the minimum interval. The scripts used to poll once per second,
+    # which is FixedPolling(min_interval=1).
+
+    def interval(self, percentage):
+        return self.min_interval
+
+
+class AdaptivePolling(PollingStrategy):
+    # Estimates the remaining time from the progress rate while the job moves
+    # and backs off exponentially (with jitter) while it hardly moves.
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL, backoff=2.0,
+                 jitter=0.1, min_progress=1.0, smoothing=0.5, clock=time.monotonic, rng=random.random):
+        super().__init__(min_interval, max_interval)
+        self.backoff = backoff
+        self.jitter = jitter
+        self.min_progress = min_progress
+        self.smoothing = smoothing
+        self.clock = clock
+        self.rng = rng
+        self._backoff_interval = min_interval
+        self._last_sample = None
+        self._rate = None
+
+    def interval(self, percentage):
+        now = self.clock()
+        last_sample = self._last_sample
+
+        if percentage is None or last_sample is None:
+            if percentage is not None:
+                self._last_sample = (now, percentage)
+            return self.add_jitter(self.min_interval)
+
+        last_time, last_percentage = last_sample
+        progress = percentage - last_percentage
+        elapsed = now - last_time
+
+        if progress < self.min_progress or elapsed <= 0:
+            # keep the last sample, so that slow progress adds up
+            self._backoff_interval = min(self.max_interval, self._backoff_interval * self.backoff)
+            return self.add_jitter(self._backoff_interval)
+
+        rate = progress / elapsed
+        if self._rate is not None:
+            rate = self.smoothing * rate + (1 - self.smoothing) * self._rate
+        self._rate = rate
+        self._last_sample = (now, percentage)
+        self._backoff_interval = self.min_interval
+
+        # poll close to the estimated time of completion
+        remaining = max(0.0, 100 - percentage) / rate
+        return self.add_jitter(remaining)
+
+    def add_jitter(self, interval):
+        factor = 1 + self.jitter * (2 * self.rng() - 1)
+        return self.clamp(interval * factor)
+
+
+POLLING_STRATEGIES = {
+    "adaptive": AdaptivePolling,
+    "fixed": FixedPolling,
+}
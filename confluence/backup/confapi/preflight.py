@@ -0,0 +1,73 @@
+import threading
+import time
+
+import requests
+
+from . import protocol
+
+# constant variables
+DEFAULT_TTL = 300.0
+
+
+class PreflightResult:
+    # outcome of a credential and permission check of one host; response is
+    # the failed response, error the exception if the host was not reachable
+
+    def __init__(self, host, resource=None, response=None, error=None, checked=0.0):
+        self.host = host
+        self.resource = resource
+        self.response = response
+        self.error = error
+        self.checked = checked
+
+    @property
+    def ok(self):
+        return self.error is None and (self.response is None or self.response.ok)
+
+    @property
+    def status_code(self):
+        return self.response.status_code if self.response is not None else None
+
+
+def check_server(session, host, resource=None, clock=time.monotonic):
+    # A GET of the base url verifies the credentials. A PUT to the resource,
+    # which the ConfAPI backup resources only answer with 403 for users who
+    # may not use them, verifies the permissions.
+    try:
+        response = session.get(host)
+        if response.ok and resource is not None:
+            permission_response = session.put(protocol.resource_url(host, resource))
+            if permission_response.status_code == 403:
+                response = permission_response
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        return PreflightResult(host, resource, error=e, checked=clock())
+
+    return PreflightResult(host, resource, response=None if response.ok else response, checked=clock())
+
+
+class PreflightCache:
+    # Checks every host once and keeps a successful result for ttl seconds,
+    # so that a long run notices revoked credentials without checking them
+    # for every single job. Failures are not cached.
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.results = {}
+        self.checks = 0
+        self.lock = threading.Lock()
+
+    def check(self, session, host, resource=None):
+        key = (host.rstrip("/"), resource)
+        with self.lock:
+            result = self.results.get(key)
+            if result is not None and self.clock() - result.checked < self.ttl:
+                return result
+
+            self.checks += 1
+            result = check_server(session, host, resource, self.clock)
+            if result.ok:
+                self.results[key] = result
+            else:
+                self.results.pop(key, None)
+            return result
@@ -0,0 +1,153 @@
+import collections
+import shutil
+import sys
+import threading
+import time
+
+# constant variables
+DEFAULT_INTERVAL = 0.2
+DEFAULT_LOG_INTERVAL = 10.0
+BYTES = "bytes"
+PERCENT = "percent"
+UNITS = ["B", "KiB", "MiB", "GiB", "TiB"]
+
+
+def format_bytes(size):
+    size = float(size)
+    for unit in UNITS[:-1]:
+        if abs(size) < 1024:
+            return "{:.1f} {}".format(size, unit) if unit != "B" else "{:d} B".format(int(size))
+        size /= 1024
+    return "{:.1f} {}".format(size, UNITS[-1])
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return "{:d}:{:02d}:{:02d}".format(hours, minutes, seconds)
+    return "{:d}:{:02d}".format(minutes, seconds)
+
+
+class JobProgress:
+
+    def __init__(self, item, title, unit, done, now):
+        self.item = item
+        self.title = title
+        self.unit = unit
+        self.done = done
+        self.total = None
+        # throughput is measured from the first update of a transfer, which
+        # may start at an offset if a download is resumed
+        self.started = now
+        self.start_done = done
+        self.updated = now
+
+    def rate(self):
+        elapsed = self.updated - self.started
+        if self.unit != BYTES or elapsed <= 0:
+            return None
+        return (self.done - self.start_done) / elapsed
+
+    def remaining(self):
+        if self.unit != BYTES or not self.total:
+            return None
+        return max(0, self.total - self.done)
+
+    def percentage(self):
+        if self.unit == PERCENT:
+            return self.done
+        return 100 * self.done // self.total if self.total else None
+
+    def describe(self):
+        text = "{} {}".format(self.item, self.title) if self.item is not None else self.title
+        percentage = self.percentage()
+        if percentage is not None:
+            text += " {:d}%".format(int(percentage))
+        if self.unit == BYTES:
+            text += " " + format_bytes(self.done)
+            rate = self.rate()
+            if rate:
+                text += " " + format_bytes(rate) + "/s"
+                if self.remaining() is not None:
+                    text += " ETA " + format_duration(self.remaining() / rate)
+        return text
+
+
+class ProgressRenderer:
+    # Shows the progress of all running jobs in one status line, which is
+    # redrawn at most every interval seconds no matter how often it is
+    # updated, with the throughput and ETA of every transfer and of all of
+    # them together. Without a terminal it writes a log line every
+    # log_interval seconds instead.
+
+    def __init__(self, stream=None, interactive=None, interval=DEFAULT_INTERVAL, log_interval=DEFAULT_LOG_INTERVAL,
+                 clock=time.monotonic):
+        self.stream = stream or sys.stdout
+        if interactive is None:
+            interactive = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.interactive = interactive
+        self.interval = interval if interactive else log_interval
+        self.clock = clock
+        self.jobs = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.drawn = 0
+        self.last_draw = clock()
+        self.updates = 0
+        self.draws = 0
+
+    def update(self, item, title, done, total=None, unit=PERCENT):
+        with self.lock:
+            now = self.clock()
+            job = self.jobs.get(item)
+            if job is None or job.title != title or job.unit != unit:
+                job = self.jobs[item] = JobProgress(item, title, unit, done, now)
+            job.done = done
+            job.total = total
+            job.updated = now
+            self.updates += 1
+            if now - self.last_draw >= self.interval:
+                self.draw(now)
+
+    def finish(self, item):
+        with self.lock:
+            if self.jobs.pop(item, None) is not None and self.interactive:
+                self.draw(self.clock())
+
+    def status(self):
+        jobs = list(self.jobs.values())
+        parts = [job.describe() for job in jobs]
+        transfers = [job for job in jobs if job.rate()]
+        if len(transfers) > 1:
+            total = "total " + format_bytes(sum(job.rate() for job in transfers)) + "/s"
+            if all(job.remaining() is not None for job in transfers):
+                # the run is done when the slowest transfer is done
+                total += " ETA " + format_duration(max(job.remaining() / job.rate() for job in transfers))
+            parts.append(total)
+        return " | ".join(parts)
+
+    def draw(self, now):
+        self.last_draw = now
+        self.draws += 1
+        line = self.status()
+        if not self.interactive:
+            if line:
+                self.stream.write("Progress: " + line + "\n")
+                self.stream.flush()
+            return
+
+        width = shutil.get_terminal_size((120, 20)).columns - 1
+        line = line[:width]
+        # overwrite the previous status line
+        self.stream.write("\r" + line + " " * max(0, self.drawn - len(line)) + ("\r" if not line else ""))
+        self.stream.flush()
+        self.drawn = len(line)
+
+    def close(self):
+        with self.lock:
+            self.jobs.clear()
+            if self.interactive and self.drawn:
+                self.stream.write("\r" + " " * self.drawn + "\r")
+                self.stream.flush()
+                self.drawn = 0
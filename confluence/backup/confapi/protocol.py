@@ -0,0 +1,71 @@
+import json
+
+from . import polling
+from . import scheduler
+
+# constant variables
+EXPORT_RESOURCE = "rest/confapi/1/backup/export"
+IMPORT_RESOURCE = "rest/confapi/1/backup/import"
+CONTENT_SEARCH_RESOURCE = "rest/api/content/search"
+SPACE_RESOURCE = "rest/api/space"
+EXPORT_FILE_PREFIX = "Confluence-space-export-"
+EXPORT_FILE_SUFFIX = ".xml.zip"
+SPACE_TYPES = ["global", "personal"]
+DEFAULT_PAGE_SIZE = 100
+
+
+def resource_url(host, resource):
+    url_infix = "/" if host[-1] != "/" else ""
+    return "{}{}{}".format(host, url_infix, resource)
+
+
+def export_url(host, key):
+    return resource_url(host, EXPORT_RESOURCE) + "/" + key
+
+
+def import_url(host):
+    return resource_url(host, IMPORT_RESOURCE)
+
+
+def export_file_name(key):
+    return EXPORT_FILE_PREFIX + key + EXPORT_FILE_SUFFIX
+
+
+def parse_json(content):
+    try:
+        content = content.decode("utf-8")
+        result = json.loads(content)
+    except:
+        result = {}
+    return result
+
+
+def error_messages(response):
+    content = parse_json(response.content)
+    if not isinstance(content, dict):
+        return []
+    return content.get("errorMessages") or []
+
+
+def submission_state(response):
+    # answer to an export or import: (QUEUED, queue url) while the server is
+    # busy with it, (READY, location) if it is finished right away, which is
+    # the download of an export or the new space of an import
+    if not response.ok:
+        return scheduler.FAILED, None
+    if response.status_code == 202:
+        return scheduler.QUEUED, response.headers.get("Location")
+    return scheduler.READY, response.headers.get("Location")
+
+
+def queue_state(response):
+    # answer to a status request: (RUNNING, percentage or None) while the job
+    # runs, (READY, location) once it is finished
+    if response.status_code in polling.RETRY_STATUS_CODES:
+        return scheduler.RUNNING, None
+    if not response.ok:
+        return scheduler.FAILED, None
+    if response.status_code == 200:
+        content = parse_json(response.content)
+        return scheduler.RUNNING, content.get("percentageComplete") if isinstance(content, dict) else None
+    return scheduler.READY, response.headers.get("Location")
@@ -0,0 +1,197 @@
+import collections
+import collections.abc
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# states of a job, as returned by the submit and poll callbacks
+PENDING = "pending"
+QUEUED = "queued"
+RUNNING = "running"
+READY = "ready"
+DONE = "done"
+FAILED = "failed"
+
+# job currently processed by a callback in this thread
+_context = threading.local()
+# marks the end of the items
+_end = object()
+
+
+def current_job():
+    return getattr(_context, "job", None)
+
+
+class Job:
+
+    def __init__(self, item, index):
+        self.item = item
+        self.index = index
+        self.state = PENDING
+        self.queue_url = None
+        self.poller = None
+        self.next_poll = 0.0
+        self.exit_response = 0
+        self.errors = []
+
+
+class JobScheduler:
+    # Submits several server-side tasks up front, polls all of their queue
+    # URLs in one loop and starts the completion (e.g. the download) of each
+    # job as soon as the server has finished it.
+    #
+    # The callbacks return a (state, value) tuple:
+    #   submit(job) -> (QUEUED, queue_url), (READY, location), (DONE, None) or (FAILED, exit_response)
+    #   poll(job)   -> (RUNNING, seconds until the next poll), (READY, location), (DONE, None) or (FAILED, ...)
+    #   complete(job, location) -> exit_response
+    # A non-zero exit_response stops the submission of further jobs. An
+    # optional limiter.AdaptiveLimiter lowers max_jobs while the server is
+    # overloaded. The optional finished(job) is called once for every job
+    # that has reached DONE or FAILED, whichever path it has taken.
+
+    def __init__(self, submit, poll, complete=None, max_jobs=1, max_submits=None, max_completions=1,
+                 poller_factory=None, clock=time.monotonic, limiter=None, finished=None):
+        self.submit = submit
+        self.poll = poll
+        self.complete = complete
+        self.finished = finished
+        self.max_jobs = max(1, max_jobs)
+        self.max_submits = max(1, min(max_submits or self.max_jobs, self.max_jobs))
+        self.max_completions = max(1, max_completions)
+        self.poller_factory = poller_factory
+        self.clock = clock
+        self.limiter = limiter
+        self.stopped = False
+
+    def job_limit(self):
+        if self.limiter is None:
+            return self.max_jobs
+        return max(1, min(self.max_jobs, self.limiter.current()))
+
+    def run(self, items):
+        # items may also be an iterator, e.g. of keys that are still being
+        # discovered; it is only advanced when another job can be submitted
+        lazy = isinstance(items, collections.abc.Iterator)
+        items = iter(items)
+        exhausted = False
+        jobs = []
+        polled = []
+        ready = collections.deque()
+        events = queue.Queue()
+        # jobs being submitted or processed by the server
+        active_jobs = 0
+        active_submits = 0
+        active_completions = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_submits) as submit_executor, \
+                ThreadPoolExecutor(max_workers=self.max_completions) as complete_executor:
+            while True:
+                while not exhausted and not self.stopped and active_jobs < self.job_limit() \
+                        and active_submits < self.max_submits:
+                    item = next(items, _end)
+                    if item is _end:
+                        exhausted = True
+                        break
+                    job = Job(item, len(jobs))
+                    jobs.append(job)
+                    active_jobs += 1
+                    active_submits += 1
+                    submit_executor.submit(self.call_async, events, "submit", job, self.submit, job)
+
+                while ready and active_completions < self.max_completions:
+                    job, location = ready.popleft()
+                    active_completions += 1
+                    complete_executor.submit(self.call_async, events, "complete", job, self.complete, job,
+                                             location)
+
+                if active_jobs == 0 and active_completions == 0 and not ready \
+                        and (self.stopped or exhausted):
+                    break
+
+                for job in [job for job in polled if job.next_poll <= self.clock()]:
+                    state, value = self.call(job, self.poll, job)
+                    if state != RUNNING:
+                        polled.remove(job)
+                        active_jobs -= 1
+                    self.update(job, state, value, polled, ready)
+
+                if ready and active_completions < self.max_completions \
+                        or not (polled or active_submits or active_completions):
+                    continue
+
+                # wait for a submission or completion, or until the next poll is due
+                timeout = None
+                if polled:
+                    timeout = max(0.0, min(job.next_poll for job in polled) - self.clock())
+                try:
+                    event = events.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+
+                while event is not None:
+                    kind, job, result, error = event
+                    if error is not None:
+                        self.stopped = True
+                        raise error
+                    if kind == "submit":
+                        active_submits -= 1
+                        state, value = result
+                        if state not in (QUEUED, RUNNING):
+                            active_jobs -= 1
+                        self.update(job, state, value, polled, ready)
+                    else:
+                        active_completions -= 1
+                        self.finish(job, DONE if not result else FAILED, result)
+                    try:
+                        event = events.get_nowait()
+                    except queue.Empty:
+                        event = None
+
+        if not lazy:
+            # the jobs that have not been submitted after a fatal error
+            for item in items:
+                jobs.append(Job(item, len(jobs)))
+        return jobs
+
+    def update(self, job, state, value, polled, ready):
+        if state == QUEUED:
+            job.state = QUEUED
+            job.queue_url = value
+            job.poller = self.poller_factory() if self.poller_factory is not None else None
+            job.next_poll = self.clock()
+            polled.append(job)
+        elif state == RUNNING:
+            job.state = RUNNING
+            job.next_poll = self.clock() + value
+        elif state == READY:
+            if self.complete is None:
+                self.finish(job, DONE, 0)
+            else:
+                job.state = READY
+                ready.append((job, value))
+        elif state == DONE:
+            self.finish(job, DONE, 0)
+        else:
+            self.finish(job, FAILED, value)
+
+    def finish(self, job, state, exit_response):
+        job.state = state
+        job.exit_response = exit_response or 0
+        if job.exit_response:
+            self.stopped = True
+        if self.finished is not None:
+            self.finished(job)
+
+    def call(self, job, function, *args):
+        _context.job = job
+        try:
+            return function(*args)
+        finally:
+            _context.job = None
+
+    def call_async(self, events, kind, job, function, *args):
+        try:
+            events.put((kind, job, self.call(job, function, *args), None))
+        except BaseException as e:
+            events.put((kind, job, None, e))
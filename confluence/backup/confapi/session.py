@@ -0,0 +1,85 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# constant variables
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 30
+DEFAULT_READ_TIMEOUT = 300
+
+
+class ConfapiSession(requests.Session):
+    # One session per run: keeps connections alive and pools them per host,
+    # so that polling loops and downloads do not pay a new TCP/TLS handshake
+    # for every request.
+
+    def __init__(self, auth=(), pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, verify=False, metrics=None, adaptive_limiter=None,
+                 token_bucket=None):
+        super().__init__()
+        self.auth = auth
+        self.verify = verify
+        self.timeout = (connect_timeout, read_timeout)
+        # optional metrics.RunMetrics that counts every request, limiter.AdaptiveLimiter
+        # that is told about the latency and overload of the server and
+        # limiter.TokenBucket that caps the requests per second
+        self.metrics = metrics
+        self.adaptive_limiter = adaptive_limiter
+        self.token_bucket = token_bucket
+
+        # statistics of connection pools that have already been discarded
+        self._stats_lock = threading.Lock()
+        self._closed_connections = 0
+        self._closed_requests = 0
+
+        for prefix in ("https://", "http://"):
+            adapter = HTTPAdapter(pool_maxsize=pool_size)
+            adapter.poolmanager.pools.dispose_func = self._dispose_pool
+            self.mount(prefix, adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        if self.token_bucket is not None:
+            self.token_bucket.acquire()
+
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self.observe(method, None, e)
+            raise
+        self.observe(method, response, None)
+        return response
+
+    def observe(self, method, response, error):
+        if self.metrics is not None:
+            self.metrics.count_request(response.status_code if response is not None else None)
+        if self.adaptive_limiter is not None:
+            self.adaptive_limiter.observe(method, response, error)
+
+    def _dispose_pool(self, pool):
+        with self._stats_lock:
+            self._closed_connections += pool.num_connections
+            self._closed_requests += pool.num_requests
+        pool.close()
+
+    def connection_stats(self):
+        with self._stats_lock:
+            connections = self._closed_connections
+            requests_sent = self._closed_requests
+        for adapter in self.adapters.values():
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    requests_sent += pool.num_requests
+        return connections, requests_sent
+
+    def summary(self):
+        connections, requests_sent = self.connection_stats()
+        reused = max(0, requests_sent - connections)
+        ratio = 100.0 * reused / requests_sent if requests_sent else 0.0
+        return "Requests: {}, connections opened: {}, reused: {} ({:.1f}%)".format(
+            requests_sent, connections, reused, ratio)
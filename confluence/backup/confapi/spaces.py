@@ -0,0 +1,45 @@
+import fnmatch
+
+from . import protocol
+
+
+def iter_spaces(session, host, space_type=None, page_size=protocol.DEFAULT_PAGE_SIZE):
+    # Pages through the space list and yields every space as soon as its page
+    # has arrived. The next page is only requested once the spaces of the
+    # current one have been taken, so a caller can start working on the
+    # first spaces of a large instance right away. A failed page raises
+    # requests.HTTPError.
+    url = protocol.resource_url(host, protocol.SPACE_RESOURCE)
+    params = {"limit": page_size}
+    if space_type is not None:
+        params["type"] = space_type
+
+    while url:
+        response = session.get(url, params=params)
+        response.raise_for_status()
+        content = protocol.parse_json(response.content)
+        for space in content.get("results") or []:
+            yield space
+
+        links = content.get("_links") or {}
+        url = next_page_url(host, links)
+        # the link to the next page carries the parameters
+        params = None
+
+
+def next_page_url(host, links):
+    next_link = links.get("next")
+    if not next_link or "://" in next_link:
+        return next_link
+    # relative to the host, which includes the context path; _links.base is
+    # the public base URL, which may lead to another node of a cluster
+    return protocol.resource_url(host, next_link.lstrip("/"))
+
+
+def matches(key, include=None, exclude=None):
+    # shell-style patterns like "DEV*" or "~*" for personal spaces, matched
+    # regardless of case; without include patterns every key is included
+    key = key.upper()
+    if include and not any(fnmatch.fnmatchcase(key, pattern.upper()) for pattern in include):
+        return False
+    return not any(fnmatch.fnmatchcase(key, pattern.upper()) for pattern in exclude or [])
@@ -0,0 +1,231 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+# constant variables
+CHUNKS_DIRECTORY = "chunks"
+SNAPSHOTS_DIRECTORY = "snapshots"
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+READ_BUFFER_SIZE = 8 * 1024 * 1024
+# local file header and central directory header of a zip archive
+BOUNDARY_PATTERN = re.compile(b"PK(?:\x03\x04|\x01\x02)")
+HEADER_SIZE = 4
+
+
+class ChecksumMismatchError(IOError):
+    pass
+
+
+def iter_chunks(fd, min_size=MIN_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+    # Splits a stream at content-defined boundaries: the next zip header that
+    # is at least min_size bytes after the start of the chunk or that starts
+    # an entry of at least min_size bytes, so small entries are grouped and
+    # large ones get chunks of their own. The entries of an export are stored
+    # in the same way every night, so an unchanged attachment gives the same
+    # chunks, no matter how much the entries in front of it have changed.
+    # Entries larger than max_size are cut into max_size pieces counted from
+    # their header.
+    buffer = b""
+    start = 0
+    eof = False
+    while start < len(buffer) or not eof:
+        if not eof and len(buffer) - start < max_size + HEADER_SIZE:
+            block = fd.read(READ_BUFFER_SIZE)
+            eof = not block
+            buffer = buffer[start:] + block
+            start = 0
+            continue
+
+        end = min(len(buffer), start + max_size)
+        window = start + max_size + HEADER_SIZE
+        # a header qualifies once the following one is known, so the scan
+        # stops at the first boundary instead of collecting the whole window
+        previous = None
+        for match in BOUNDARY_PATTERN.finditer(buffer, start + 1, window):
+            position = match.start()
+            if previous is not None and position - previous >= min_size:
+                end = previous
+                break
+            if position - start >= min_size:
+                end = position
+                break
+            previous = position
+        else:
+            if previous is not None and min(len(buffer), window) - previous >= min_size:
+                end = previous
+        yield buffer[start:end]
+        start = end
+
+
+def snapshot_id(existing):
+    snapshot = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    candidate = snapshot
+    counter = 1
+    while candidate in existing:
+        counter += 1
+        candidate = "{}-{}".format(snapshot, counter)
+    return candidate
+
+
+class ChunkStore:
+    # Content-addressed store for export archives. Every chunk is saved once
+    # under its SHA-256 hash in chunks/ab/abcdef..., and every stored archive
+    # gets a snapshot manifest in snapshots/<file name>/<snapshot>.json that
+    # lists its chunks in order.
+
+    def __init__(self, directory, min_chunk_size=MIN_CHUNK_SIZE, max_chunk_size=MAX_CHUNK_SIZE):
+        self.directory = directory
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(directory, CHUNKS_DIRECTORY), exist_ok=True)
+        os.makedirs(os.path.join(directory, SNAPSHOTS_DIRECTORY), exist_ok=True)
+
+    def chunk_path(self, digest):
+        return os.path.join(self.directory, CHUNKS_DIRECTORY, digest[:2], digest)
+
+    def snapshot_path(self, name, snapshot):
+        return os.path.join(self.directory, SNAPSHOTS_DIRECTORY, name, snapshot + ".json")
+
+    def put_chunk(self, data):
+        # -> (digest, True if the chunk was not in the store yet)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            return digest, False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_file = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(temp_file, "wb") as fd:
+            fd.write(data)
+        os.replace(temp_file, path)
+        return digest, True
+
+    def add(self, path, name=None, sha256=None):
+        # with sha256 no snapshot is written if the archive does not match it;
+        # its new chunks are left to prune
+        name = name or os.path.basename(path)
+        digest = hashlib.sha256()
+        chunks = []
+        new_chunks = 0
+        new_bytes = 0
+        with open(path, "rb") as fd:
+            for data in iter_chunks(fd, self.min_chunk_size, self.max_chunk_size):
+                digest.update(data)
+                chunk_digest, new = self.put_chunk(data)
+                chunks.append([chunk_digest, len(data)])
+                if new:
+                    new_chunks += 1
+                    new_bytes += len(data)
+        if sha256 is not None and digest.hexdigest() != sha256:
+            raise ChecksumMismatchError("checksum mismatch while storing {}".format(name))
+
+        snapshot = {
+            "name": name,
+            "created": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "size": sum(size for _, size in chunks),
+            "sha256": digest.hexdigest(),
+            "chunks": chunks,
+        }
+        with self.lock:
+            os.makedirs(os.path.join(self.directory, SNAPSHOTS_DIRECTORY, name), exist_ok=True)
+            snapshot["snapshot"] = snapshot_id(self.snapshots(name))
+            temp_file = self.snapshot_path(name, snapshot["snapshot"]) + ".tmp"
+            with open(temp_file, "w") as fd:
+                json.dump(snapshot, fd)
+            os.replace(temp_file, self.snapshot_path(name, snapshot["snapshot"]))
+
+        snapshot["new_chunks"] = new_chunks
+        snapshot["new_bytes"] = new_bytes
+        return snapshot
+
+    def names(self):
+        return sorted(os.listdir(os.path.join(self.directory, SNAPSHOTS_DIRECTORY)))
+
+    def snapshots(self, name):
+        directory = os.path.join(self.directory, SNAPSHOTS_DIRECTORY, name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(file_name[:-len(".json")] for file_name in os.listdir(directory)
+                      if file_name.endswith(".json"))
+
+    def load(self, name, snapshot=None):
+        # the latest snapshot if none is given, None if there is none
+        if snapshot is None:
+            snapshots = self.snapshots(name)
+            if not snapshots:
+                return None
+            snapshot = snapshots[-1]
+        path = self.snapshot_path(name, snapshot)
+        if not os.path.exists(path):
+            return None
+        with open(path) as fd:
+            return json.load(fd)
+
+    def restore(self, name, target, snapshot=None):
+        manifest = self.load(name, snapshot)
+        if manifest is None:
+            raise IOError("no snapshot of {} in {}".format(name, self.directory))
+
+        digest = hashlib.sha256()
+        temp_file = target + ".part"
+        with open(temp_file, "wb") as output:
+            for chunk_digest, size in manifest["chunks"]:
+                path = self.chunk_path(chunk_digest)
+                if not os.path.exists(path):
+                    raise IOError("chunk {} of {} is missing".format(chunk_digest, name))
+                with open(path, "rb") as fd:
+                    data = fd.read()
+                if len(data) != size:
+                    raise IOError("chunk {} of {} is damaged".format(chunk_digest, name))
+                digest.update(data)
+                output.write(data)
+
+        if digest.hexdigest() != manifest["sha256"]:
+            os.remove(temp_file)
+            raise ChecksumMismatchError("checksum mismatch while restoring {}".format(name))
+        os.replace(temp_file, target)
+        return manifest
+
+    def verify(self, name, snapshot=None):
+        # -> None if every chunk of the snapshot is intact, the reason otherwise
+        manifest = self.load(name, snapshot)
+        if manifest is None:
+            return "snapshot missing"
+        for chunk_digest, size in manifest["chunks"]:
+            path = self.chunk_path(chunk_digest)
+            if not os.path.exists(path):
+                return "chunk missing"
+            with open(path, "rb") as fd:
+                if hashlib.sha256(fd.read()).hexdigest() != chunk_digest:
+                    return "chunk damaged"
+        return None
+
+    def prune(self, keep):
+        # keeps the latest snapshots of every archive and removes the chunks
+        # that none of them refers to -> (snapshots removed, chunks removed)
+        removed_snapshots = 0
+        referenced = set()
+        for name in self.names():
+            snapshots = self.snapshots(name)
+            for snapshot in snapshots[:max(0, len(snapshots) - keep)]:
+                os.remove(self.snapshot_path(name, snapshot))
+                removed_snapshots += 1
+            for snapshot in snapshots[max(0, len(snapshots) - keep):]:
+                referenced.update(chunk_digest for chunk_digest, _ in self.load(name, snapshot)["chunks"])
+            if not self.snapshots(name):
+                shutil.rmtree(os.path.join(self.directory, SNAPSHOTS_DIRECTORY, name))
+
+        removed_chunks = 0
+        chunks_directory = os.path.join(self.directory, CHUNKS_DIRECTORY)
+        for prefix in os.listdir(chunks_directory):
+            for chunk_digest in os.listdir(os.path.join(chunks_directory, prefix)):
+                if chunk_digest not in referenced:
+                    os.remove(os.path.join(chunks_directory, prefix, chunk_digest))
+                    removed_chunks += 1
+        return removed_snapshots, removed_chunks
@@ -0,0 +1,148 @@
+import mmap
+import os
+import struct
+import zlib
+
+# constant variables
+EOCD_SIGNATURE = b"PK\x05\x06"
+EOCD_FORMAT = "<4s4H2LH"
+EOCD_SIZE = struct.calcsize(EOCD_FORMAT)
+ZIP64_LOCATOR_SIGNATURE = b"PK\x06\x07"
+ZIP64_LOCATOR_FORMAT = "<4sLQL"
+ZIP64_LOCATOR_SIZE = struct.calcsize(ZIP64_LOCATOR_FORMAT)
+ZIP64_EOCD_SIGNATURE = b"PK\x06\x06"
+ZIP64_EOCD_FORMAT = "<4sQ2H2L4Q"
+ZIP64_EOCD_SIZE = struct.calcsize(ZIP64_EOCD_FORMAT)
+CENTRAL_HEADER_SIGNATURE = b"PK\x01\x02"
+CENTRAL_HEADER_FORMAT = "<4s6H3L5H2L"
+CENTRAL_HEADER_SIZE = struct.calcsize(CENTRAL_HEADER_FORMAT)
+ZIP64_EXTRA_ID = 0x0001
+UTF8_FLAG = 0x800
+MAX_COMMENT_SIZE = 0xFFFF
+# entries every Confluence space export contains
+REQUIRED_ENTRIES = ["entities.xml", "exportDescriptor.properties"]
+
+
+class InvalidArchiveError(IOError):
+    pass
+
+
+def end_of_central_directory(data):
+    # -> (number of entries, offset, size) of the central directory of the
+    # archive in data (bytes or an mmap); only the end of data is looked at
+    size = len(data)
+    end = size
+    while True:
+        start = data.rfind(EOCD_SIGNATURE, max(0, size - EOCD_SIZE - MAX_COMMENT_SIZE), end)
+        if start < 0 or size - start < EOCD_SIZE:
+            raise InvalidArchiveError("end of central directory not found, the archive is truncated or not a zip")
+        _, disk, _, _, entries, directory_size, directory_offset, comment_size = \
+            struct.unpack(EOCD_FORMAT, data[start:start + EOCD_SIZE])
+        # the signature may also appear in the comment
+        if start + EOCD_SIZE + comment_size == size:
+            break
+        end = start + len(EOCD_SIGNATURE) - 1
+
+    if entries == 0xFFFF or directory_size == 0xFFFFFFFF or directory_offset == 0xFFFFFFFF:
+        entries, directory_offset, directory_size = zip64_end_of_central_directory(data, start)
+    elif disk != 0:
+        raise InvalidArchiveError("multi-disk archives are not supported")
+
+    if directory_offset + directory_size > start:
+        raise InvalidArchiveError("central directory lies outside of the archive, the archive is truncated")
+    return entries, directory_offset, directory_size
+
+
+def zip64_end_of_central_directory(data, eocd_start):
+    locator_start = eocd_start - ZIP64_LOCATOR_SIZE
+    if locator_start < 0 or data[locator_start:locator_start + 4] != ZIP64_LOCATOR_SIGNATURE:
+        raise InvalidArchiveError("zip64 end of central directory locator not found")
+    _, _, record_start, _ = struct.unpack(ZIP64_LOCATOR_FORMAT, data[locator_start:eocd_start])
+    if record_start + ZIP64_EOCD_SIZE > locator_start \
+            or data[record_start:record_start + 4] != ZIP64_EOCD_SIGNATURE:
+        raise InvalidArchiveError("zip64 end of central directory not found")
+    record = struct.unpack(ZIP64_EOCD_FORMAT, data[record_start:record_start + ZIP64_EOCD_SIZE])
+    return record[7], record[9], record[8]
+
+
+def central_directory_entries(data, offset, size):
+    # yields (name, compressed size, file size, offset of the local header)
+    # for every entry of the central directory in data[offset:offset + size]
+    position = offset
+    end = offset + size
+    while position < end:
+        if position + CENTRAL_HEADER_SIZE > end \
+                or data[position:position + 4] != CENTRAL_HEADER_SIGNATURE:
+            raise InvalidArchiveError("central directory damaged")
+        header = struct.unpack(CENTRAL_HEADER_FORMAT, data[position:position + CENTRAL_HEADER_SIZE])
+        flags, compressed_size, file_size = header[3], header[8], header[9]
+        name_size, extra_size, comment_size, header_offset = header[10], header[11], header[12], header[16]
+        name_start = position + CENTRAL_HEADER_SIZE
+        extra_start = name_start + name_size
+        name = data[name_start:extra_start].decode("utf-8" if flags & UTF8_FLAG else "cp437", "replace")
+
+        if 0xFFFFFFFF in (compressed_size, file_size, header_offset):
+            file_size, compressed_size, header_offset = zip64_extra(
+                data[extra_start:extra_start + extra_size], file_size, compressed_size, header_offset)
+
+        yield name, compressed_size, file_size, header_offset
+        position = extra_start + extra_size + comment_size
+
+    if position != end:
+        raise InvalidArchiveError("central directory damaged")
+
+
+def zip64_extra(extra, file_size, compressed_size, header_offset):
+    # the 64 bit values follow in this order, but only for the fields set to 0xFFFFFFFF
+    position = 0
+    while position + 4 <= len(extra):
+        extra_id, size = struct.unpack("<2H", extra[position:position + 4])
+        if extra_id == ZIP64_EXTRA_ID:
+            values = list(struct.unpack("<{}Q".format(size // 8), extra[position + 4:position + 4 + size // 8 * 8]))
+            fields = [file_size, compressed_size, header_offset]
+            for index, field in enumerate(fields):
+                if field == 0xFFFFFFFF and values:
+                    fields[index] = values.pop(0)
+            return tuple(fields)
+        position += 4 + size
+    raise InvalidArchiveError("zip64 extra field missing")
+
+
+def check_export_archive(path):
+    # -> None if path looks like a complete Confluence space export, the
+    # reason otherwise; only the central directory at the end is read
+    names = set()
+    try:
+        with open(path, "rb") as fd, map_file(fd) as data:
+            count, offset, size = end_of_central_directory(data)
+            found = 0
+            for name, compressed_size, _, header_offset in central_directory_entries(data, offset, size):
+                if header_offset + compressed_size > offset:
+                    return "entry {} lies outside of the archive, the archive is truncated".format(name)
+                names.add(name)
+                found += 1
+    except InvalidArchiveError as e:
+        return str(e)
+    except (IOError, ValueError) as e:
+        return "cannot read archive: {}".format(e)
+
+    if found != count:
+        return "central directory damaged"
+    missing = [name for name in REQUIRED_ENTRIES if name not in names]
+    if missing:
+        return "not a Confluence space export, {} missing".format(" and ".join(missing))
+    return None
+
+
+def map_file(fd):
+    # read-only memory map of a whole file, the page cache is shared with other readers
+    if os.fstat(fd.fileno()).st_size == 0:
+        raise InvalidArchiveError("empty file")
+    return mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def central_directory_crc32(path):
+    with open(path, "rb") as fd, map_file(fd) as data:
+        _, offset, size = end_of_central_directory(data)
+        with memoryview(data)[offset:offset + size] as directory:
+            return zlib.crc32(directory)
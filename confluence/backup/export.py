@@ -1,36 +1,111 @@
 #!/usr/bin/env python3
 
 import argparse
+import functools
 import getpass
-import json
+import importlib
 import logging
 import os
 import requests
 import sys
+import threading
 import time
 import urllib3
 
+try:
+    from .confapi import download as confapi_download
+    from .confapi import integrity as confapi_integrity
+    from .confapi import journal as confapi_journal
+    from .confapi import limiter as confapi_limiter
+    from .confapi import manifest as confapi_manifest
+    from .confapi import metrics as confapi_metrics
+    from .confapi import nodes as confapi_nodes
+    from .confapi import pipe as confapi_pipe
+    from .confapi import polling as confapi_polling
+    from .confapi import preflight as confapi_preflight
+    from .confapi import protocol as confapi_protocol
+    from .confapi import progress as confapi_progress
+    from .confapi import scheduler as confapi_scheduler
+    from .confapi import session as confapi_session
+    from .confapi import ziputil as confapi_ziputil
+except ImportError:
+    from confapi import download as confapi_download
+    from confapi import integrity as confapi_integrity
+    from confapi import journal as confapi_journal
+    from confapi import limiter as confapi_limiter
+    from confapi import manifest as confapi_manifest
+    from confapi import metrics as confapi_metrics
+    from confapi import nodes as confapi_nodes
+    from confapi import pipe as confapi_pipe
+    from confapi import polling as confapi_polling
+    from confapi import preflight as confapi_preflight
+    from confapi import protocol as confapi_protocol
+    from confapi import progress as confapi_progress
+    from confapi import scheduler as confapi_scheduler
+    from confapi import session as confapi_session
+    from confapi import ziputil as confapi_ziputil
+
 urllib3.disable_warnings()
 
 # constant variables
-EXPORT_RESOURCE = "rest/confapi/1/backup/export"
 terminate_script = [401, 403, 444]
 
 # global variables
 batch_mode = False
+parallel_mode = False
 authentication_tuple = ()
 error_collection = []
+session = None
+polling_strategy = confapi_polling.AdaptivePolling
+download_retries = confapi_download.DEFAULT_RETRIES
+download_segments = confapi_download.DEFAULT_SEGMENTS
+download_chunk_size = confapi_download.DEFAULT_CHUNK_SIZE
+export_manifest = None
+last_modified_markers = {}
+archive_store = None
+central_directory_crc = False
+inventory_mode = False
+preflight_cache = None
+migrate_host = None
+migrate_buffer_size = confapi_pipe.DEFAULT_BUFFER_SIZE
+target_session = None
+job_journal = None
+resume_mode = False
+run_metrics = None
+progress_renderer = None
+adaptive_limiter = None
+token_bucket = None
+overload_retries = confapi_limiter.DEFAULT_OVERLOAD_RETRIES
+node_pool = None
+
+
+def import_feature(name):
+    # the modules of optional features are only imported once they are enabled
+    package = __package__ + ".confapi" if __package__ else "confapi"
+    return importlib.import_module(package + "." + name)
 
 
 def collect_error(error_code, value):
     global error_collection
     global terminate_script
     message = str(error_code) + ": " + value
-    error_collection.append(message)
+    # in parallel mode every space collects its own errors
+    job = confapi_scheduler.current_job()
+    errors = job.errors if job is not None else error_collection
+    errors.append(message)
+    # the strings are kept for compatibility, the metrics hold the structured result
+    if run_metrics is not None:
+        run_metrics.finish(confapi_metrics.current_item(), error_code, value)
+    if progress_renderer is not None:
+        progress_renderer.finish(confapi_metrics.current_item())
+    if node_pool is not None:
+        node_pool.release(confapi_metrics.current_item(), failed=error_code != 0)
     if error_code == 401:
         print("HINT: After multiple failed login attempts it might be required to solve a CAPTCHA")
+    if error_code in confapi_polling.RETRY_STATUS_CODES:
+        print("HINT: The server is overloaded, try --adaptive-concurrency, --max-rps or a lower --parallel")
     if error_code in terminate_script:
-        print(error_collection)
+        print(errors)
         return 1
     return 0
 
@@ -46,13 +121,107 @@ def parse_args(args):
 
     # positional arguments
     parser.add_argument("host", help="provide host url e.g. http://localhost:1990/confluence")
-    parser.add_argument("key", help="provide key e.g. KEY")
+    parser.add_argument("key", nargs="?", help="provide key e.g. KEY; omitted with --all")
 
     # optional arguments
     parser.add_argument("-v", "--verbose", action="store_true",
                         help="increase output verbosity.")
+    parser.add_argument("-a", "--all", action="store_true",
+                        help="export all spaces the user can see; they are listed page by page and every\n"
+                             "space is exported as soon as its page has arrived.")
+    parser.add_argument("--include", action="append", metavar="PATTERN",
+                        help="with --all, export only spaces with a key matching one of these patterns,\n"
+                             "e.g. 'DEV*'; may be given several times.")
+    parser.add_argument("--exclude", action="append", metavar="PATTERN",
+                        help="with --all, skip spaces with a key matching one of these patterns,\n"
+                             "e.g. '~*' for personal spaces; may be given several times.")
+    parser.add_argument("--space-type", choices=confapi_protocol.SPACE_TYPES,
+                        help="with --all, export only spaces of this type.")
+    parser.add_argument("--page-size", type=int, default=confapi_protocol.DEFAULT_PAGE_SIZE,
+                        help="number of spaces listed per request with --all (default: %(default)s).")
     parser.add_argument("-b", "--batch", action="store_true",
                         help="run in batch mode.")
+    parser.add_argument("-p", "--parallel", type=int, default=1,
+                        help="number of spaces exported at once (default: 1);\n"
+                             "exports are submitted up front and their status is polled in one loop.")
+    parser.add_argument("--max-jobs", type=int,
+                        help="maximum number of server-side exports in flight;\n"
+                             "defaults to the value of --parallel.")
+    parser.add_argument("--max-downloads", type=int,
+                        help="maximum number of concurrent downloads;\n"
+                             "defaults to the value of --parallel.")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="skip spaces that have not changed since their last export.")
+    parser.add_argument("--manifest",
+                        help="file that keeps track of the exported spaces in incremental mode;\n"
+                             "defaults to .confapi-export-<host>.json in the current directory.")
+    parser.add_argument("--store",
+                        help="keep the archives in a deduplicating chunk store in this directory\n"
+                             "instead of the current directory; restore them with archive.py.")
+    parser.add_argument("--verify", action="store_true",
+                        help="check the archives of the given keys against their checksum manifests\n"
+                             "instead of exporting them; nothing is downloaded.")
+    parser.add_argument("--central-directory-crc", action="store_true",
+                        help="also record the CRC32 of the zip central directory of each archive.")
+    parser.add_argument("--inventory", action="store_true",
+                        help="count the pages, blog posts and attachments of each downloaded archive\n"
+                             "and check that it contains the requested space.")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run: re-attach to the exports still running on the server,\n"
+                             "skip the spaces finished before and resume partial downloads.")
+    parser.add_argument("--journal",
+                        help="file of the job journal used by --resume;\n"
+                             "defaults to .confapi-export-<host>.db in the current directory.")
+    parser.add_argument("--event-log",
+                        help="append the timings, request and byte counts of every job and phase\n"
+                             "as JSON lines to this file.")
+    parser.add_argument("--metrics-file",
+                        help="write the metrics of the run to this file in the Prometheus text format,\n"
+                             "e.g. for the textfile collector of the node exporter.")
+    parser.add_argument("--node", action="append", metavar="NODE_URL",
+                        help="base URL of a node of a Data Center cluster, may be given several times;\n"
+                             "every export goes to the node with the fewest exports in flight and is polled\n"
+                             "and downloaded there. The host stays the base URL of the cluster.")
+    parser.add_argument("--migrate-to", metavar="TARGET_HOST",
+                        help="import every exported space into this host instead of saving it;\n"
+                             "the archive is streamed from the download into the upload without touching the disk.")
+    parser.add_argument("--target-username",
+                        help="username for the target host of --migrate-to; defaults to --username.")
+    parser.add_argument("--target-password",
+                        help="password for the target host of --migrate-to; defaults to --password.")
+    parser.add_argument("--buffer-size", type=int, default=confapi_pipe.DEFAULT_BUFFER_SIZE,
+                        help="maximum number of bytes of an archive held in memory while it is migrated\n"
+                             "(default: %(default)s); a slow target slows the download down.")
+    parser.add_argument("--download-retries", type=int, default=confapi_download.DEFAULT_RETRIES,
+                        help="number of times an interrupted download is resumed (default: %(default)s).")
+    parser.add_argument("--segments", type=int, default=confapi_download.DEFAULT_SEGMENTS,
+                        help="download each archive as N byte-range segments over parallel connections,\n"
+                             "if the server supports it (default: %(default)s).")
+    parser.add_argument("--chunk-size", type=int, default=confapi_download.DEFAULT_CHUNK_SIZE,
+                        help="size of the download buffer in bytes (default: %(default)s).")
+    parser.add_argument("--pool-size", type=int, default=confapi_session.DEFAULT_POOL_SIZE,
+                        help="maximum number of pooled connections per host (default: %(default)s).")
+    parser.add_argument("--connect-timeout", type=float, default=confapi_session.DEFAULT_CONNECT_TIMEOUT,
+                        help="connect timeout in seconds (default: %(default)s).")
+    parser.add_argument("--read-timeout", type=float, default=confapi_session.DEFAULT_READ_TIMEOUT,
+                        help="read timeout in seconds (default: %(default)s).")
+    parser.add_argument("--preflight-ttl", type=float, default=confapi_preflight.DEFAULT_TTL,
+                        help="seconds a successful check of the credentials is reused (default: %(default)s).")
+    parser.add_argument("--adaptive-concurrency", action="store_true",
+                        help="adapt the number of exports in flight to the server: start with one and add more\n"
+                             "while its latency stays stable, back off on 429/503 responses, timeouts or\n"
+                             "rising latency; --max-jobs or --parallel is the upper limit.")
+    parser.add_argument("--max-rps", type=float,
+                        help="maximum number of requests per second sent to the server.")
+    parser.add_argument("--overload-retries", type=int, default=confapi_limiter.DEFAULT_OVERLOAD_RETRIES,
+                        help="number of times an export answered with 429 or 503 is submitted again,\n"
+                             "after the delay the server asks for (default: %(default)s).")
+    parser.add_argument("--poll-strategy", choices=sorted(confapi_polling.POLLING_STRATEGIES), default="adaptive",
+                        help="strategy for polling the status of server-side jobs (default: %(default)s).")
+    parser.add_argument("--poll-min", type=float, default=confapi_polling.DEFAULT_MIN_INTERVAL,
+                        help="minimum seconds between two status requests (default: %(default)s).")
+    parser.add_argument("--poll-max", type=float, default=confapi_polling.DEFAULT_MAX_INTERVAL,
+                        help="maximum seconds between two status requests (default: %(default)s).")
     parser.add_argument("-U", "--username",
                         help="provide username e.g. admin;\n"
                              "if not provided the user will be prompted to enter a username and a password.")
@@ -60,7 +229,16 @@ def parse_args(args):
                         help="provide password e.g. admin;\n"
                              "if not provided the user will be prompted to enter a password.")
 
-    return parser.parse_args(args[1:])
+    parsed_args = parser.parse_args(args[1:])
+    if parsed_args.migrate_to and (parsed_args.incremental or parsed_args.store or parsed_args.verify):
+        parser.error("--migrate-to cannot be combined with --incremental, --store or --verify")
+    if parsed_args.all == bool(parsed_args.key):
+        parser.error("either a key or --all is required")
+    if not parsed_args.all and (parsed_args.include or parsed_args.exclude or parsed_args.space_type):
+        parser.error("--include, --exclude and --space-type require --all")
+    if parsed_args.all and parsed_args.verify:
+        parser.error("--verify needs the keys of the spaces")
+    return parsed_args
 
 
 def print_url_unreachable(error):
@@ -69,103 +247,477 @@ def print_url_unreachable(error):
     return collect_error(444, "url not reachable")
 
 
+def print_overload(response, delay):
+    print("\nThe server is overloaded (" + str(response.status_code) + "), submitting again in {:.1f}s".format(delay))
+
+
+def print_server_error(http_response):
+    # the error messages of the server, if it has sent any, and the status code
+    error_messages = confapi_protocol.error_messages(http_response)
+    if error_messages:
+        print(error_messages)
+    return print_http_error(http_response)
+
+
 def print_http_error(http_response):
     print("An error occurred: " + str(http_response.status_code) + "\n" +
           requests.status_codes._codes[http_response.status_code][0])
     return collect_error(http_response.status_code, requests.status_codes._codes[http_response.status_code][0])
 
 
-def parse_json(content):
-    try:
-        content = content.decode("utf-8")
-        result = json.loads(content)
-    except:
-        result = {}
-    return result
-
+def print_progress(title, percentage, key=None):
+    progress_renderer.update(key if key is not None else confapi_metrics.current_item(), title, percentage)
 
-def print_progress(title, percentage):
-    if not batch_mode:
-        sys.stdout.write("\r%s: %d%%" % (title, percentage))
-        sys.stdout.flush()
 
-        if percentage == 100:
-            print()
+def print_transfer_progress(title, bytes_transferred, total_bytes, key=None):
+    progress_renderer.update(key if key is not None else confapi_metrics.current_item(), title, bytes_transferred,
+                             total_bytes, unit=confapi_progress.BYTES)
 
 
-def export_start(host, key):
+def export_start(key):
     exit_response = 0
+    state, value = export_submit(node_pool.acquire(key).base_url, key)
+
+    if state == confapi_scheduler.READY:
+        export_download(value, key)
+
+    if state == confapi_scheduler.QUEUED:
+        exit_response = export_queue(value, key)
+
+    if state == confapi_scheduler.FAILED:
+        exit_response = value
+
+    # frees the node on the paths that have not reported a result
+    node_pool.release(key, failed=state == confapi_scheduler.FAILED or bool(exit_response))
+    return exit_response
+
+
+def export_submit(host, key):
+    run_metrics.phase(key, "submit")
+
+    # Ping server to verify the credentials, once per host and TTL
+    exit_response = ping_server(host)
+    if exit_response:
+        return confapi_scheduler.FAILED, exit_response
+
+    if resume_mode:
+        state, value = export_resume(key)
+        if state is not None:
+            return state, value
+
+    if export_manifest is not None and export_unchanged(host, key):
+        print("\nSkip exporting space using key " + key + ", nothing has changed since the last export")
+        return confapi_scheduler.DONE, collect_error(0, "Unchanged")
+
     print("\nStart exporting space using key " + key)
 
-    url_infix = "/" if host[-1] != "/" else ""
-    url = "{}{}{}/{}".format(host, url_infix, EXPORT_RESOURCE, key)
+    url = confapi_protocol.export_url(host, key)
 
     try:
-        export_response = requests.get(url, auth=authentication_tuple, verify=False)
+        export_response = confapi_limiter.send_submission(session, "GET", url, overload_retries, print_overload)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        return confapi_scheduler.FAILED, print_url_unreachable(e)
+
+    state, location = confapi_protocol.submission_state(export_response)
+    if state == confapi_scheduler.FAILED:
+        return state, print_server_error(export_response)
+
+    # the job is only known to the node that has accepted it
+    location = node_pool.pin(key, location)
+    if state == confapi_scheduler.QUEUED:
+        run_metrics.phase(key, "queue")
+        job_journal.record(key, confapi_journal.QUEUED, queue_url=location)
+        return state, location
+    return export_ready(key, location)
+
+
+def export_ready(key, location):
+    if not location:
+        return confapi_scheduler.FAILED, collect_error(1, "no download location")
+    job_journal.record(key, confapi_journal.READY, location=location)
+    return confapi_scheduler.READY, location
+
+
+def export_resume(key):
+    # re-attaches to the job of an interrupted run, if it is still known to the server
+    entry = job_journal.get(key)
+    if entry is None:
+        return None, None
+
+    if entry["state"] == confapi_journal.DONE and (migrate_host is not None or export_size(key) is not None):
+        print("\nSkip exporting space using key " + key + ", it has been finished before")
+        return confapi_scheduler.DONE, collect_error(0, "Success")
+
+    if entry["state"] == confapi_journal.QUEUED and job_available(entry["queue_url"]):
+        print("\nResume exporting space using key " + key)
+        node_pool.attach(key, entry["queue_url"])
+        run_metrics.phase(key, "queue")
+        return confapi_scheduler.QUEUED, entry["queue_url"]
+
+    if entry["state"] == confapi_journal.READY and job_available(entry["location"]):
+        print("\nResume downloading space using key " + key)
+        node_pool.attach(key, entry["location"])
+        return confapi_scheduler.READY, entry["location"]
+
+    return None, None
+
+
+def job_available(url):
+    # the server forgets its jobs when it is restarted
+    if not url:
+        return False
+    try:
+        response = session.get(url, stream=True)
+        response.close()
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        return False
+    return response.status_code not in (404, 410)
 
-        if not export_response.ok:
-            exit_response = print_http_error(export_response)
 
-            content = parse_json(export_response.content)
-            if "errorMessages" in content:
-                print(content["errorMessages"])
+def ping_server(host):
+    result = preflight_cache.check(session, host)
+    if result.error is not None:
+        return print_url_unreachable(result.error)
 
-        else:
-            location = export_response.headers['Location']
+    if not result.ok:
+        return print_http_error(result.response)
+    return 0
 
-            if export_response.status_code == 201:
-                export_download(location, key)
 
-            if export_response.status_code == 202:
-                exit_response = export_queue(location, key)
+def export_unchanged(host, key):
+    last_modified = space_last_modified(host, key)
+    last_modified_markers[key] = last_modified
+    return export_manifest.unchanged(key, last_modified, export_size(key))
 
-    except requests.exceptions.ConnectionError as e:
-        exit_response = print_url_unreachable(e)
 
-    return exit_response
+def export_size(key):
+    # size of the archive of the last export, None if it is gone
+    if archive_store is not None:
+        snapshot = archive_store.load(os.path.basename(export_file(key)))
+        return snapshot["size"] if snapshot is not None else None
+    if os.path.exists(export_file(key)):
+        return os.path.getsize(export_file(key))
+    return None
+
+
+def space_last_modified(host, key):
+    # the most recent modification of any content in the space plus the amount
+    # of content, so that deleted pages count as a change as well
+    url = confapi_protocol.resource_url(host, confapi_protocol.CONTENT_SEARCH_RESOURCE)
+    params = {"cql": 'space="{}" order by lastmodified desc'.format(key), "limit": 1, "expand": "version"}
+
+    try:
+        search_response = session.get(url, params=params)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        return None
+
+    content = confapi_protocol.parse_json(search_response.content) if search_response.ok else {}
+    results = content.get("results") or []
+    if not results or "when" not in results[0].get("version", {}):
+        return None
+    return "{}/{}".format(results[0]["version"]["when"], content.get("totalSize", content.get("size")))
 
 
 def export_queue(queue_url, key):
+    poller = polling_strategy()
     while True:
-        queue_response = requests.get(queue_url, auth=authentication_tuple, verify=False)
-
-        if queue_response.status_code != 200:
-            if queue_response.status_code == 201:
-                location = queue_response.headers['Location']
-                return export_download(location, key)
-            elif not queue_response.ok:
-                content = parse_json(queue_response.content)
-                print(content["errorMessages"])
-                return collect_error(str(queue_response.status_code) + ": "
-                                     + requests.status_codes._codes[queue_response.status_code][0])
-            break
-
-        content = parse_json(queue_response.content)
-        percentage = content["percentageComplete"]
-        print_progress("Export", percentage)
-        time.sleep(1)
-    return 1
+        state, value = export_poll(queue_url, key, poller)
+
+        if state == confapi_scheduler.RUNNING:
+            time.sleep(value)
+            continue
+
+        if state == confapi_scheduler.READY:
+            return export_download(value, key)
+
+        return value
+
+
+def export_poll(queue_url, key, poller):
+    try:
+        queue_response = session.get(queue_url)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        return confapi_scheduler.FAILED, print_url_unreachable(e)
+
+    # a busy server (429, 503) is asked again when it tells us to
+    state, value = confapi_protocol.queue_state(queue_response)
+    if state == confapi_scheduler.FAILED:
+        return state, print_server_error(queue_response)
+
+    if state == confapi_scheduler.READY:
+        # until a download slot is free
+        run_metrics.phase(key, "waiting")
+        return export_ready(key, node_pool.pin(key, value))
+
+    if value is not None:
+        print_progress("Export", value)
+    if value:
+        run_metrics.phase(key, "processing")
+    return confapi_scheduler.RUNNING, poller.next_interval(value, queue_response)
 
 
 def export_download(download_url, key):
     print_progress("Export", 100)
 
-    download_file = os.getcwd() + "/Confluence-space-export-" + key + ".xml.zip"
-    with open(download_file, 'wb') as fd:
-        download_response = requests.get(download_url, stream=True, auth=authentication_tuple, verify=False)
-        download_size = download_response.headers['Content-Length']
-        download_progress = 0.0
+    if migrate_host is not None:
+        return migrate_space(download_url, key)
+
+    run_metrics.phase(key, "download")
+    download_file = export_file(key)
+    checksum = confapi_integrity.StreamChecksum()
+    started = confapi_manifest.utc_now()
+    start_time = time.monotonic()
+    try:
+        # the download goes to a .part file and is resumed if the connection drops
+        if download_segments > 1:
+            confapi_download.download_segmented(session, download_url, download_file, download_segments,
+                                                retries=download_retries, chunk_size=download_chunk_size,
+                                                callback=functools.partial(print_download_progress, key=key),
+                                                checksum=checksum,
+                                                retry_callback=functools.partial(count_download_retry, key))
+        else:
+            confapi_download.download(session, download_url, download_file, retries=download_retries,
+                                      chunk_size=download_chunk_size,
+                                      callback=functools.partial(print_download_progress, key=key),
+                                      checksum=checksum,
+                                      retry_callback=functools.partial(count_download_retry, key))
+
+    except requests.exceptions.HTTPError as e:
+        return print_http_error(e.response)
+
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+            confapi_download.IncompleteDownloadError) as e:
+        return print_url_unreachable(e)
+
+    duration = time.monotonic() - start_time
+    size = os.path.getsize(download_file)
+    sha256 = checksum.hexdigest()
+    run_metrics.add_bytes(key, size)
+    node_pool.add_transfer(key, size, duration)
+    run_metrics.phase(key, "check")
+    crc = None
+    if central_directory_crc:
+        try:
+            crc = confapi_ziputil.central_directory_crc32(download_file)
+        except confapi_ziputil.InvalidArchiveError as e:
+            print("\nThe archive of space " + key + " is damaged: " + str(e))
+            return reject_archive(key, "invalid archive")
+
+    inventory = None
+    if inventory_mode:
+        confapi_inventory = import_feature("inventory")
+        try:
+            inventory = confapi_inventory.space_inventory(download_file)
+        except confapi_inventory.InventoryError as e:
+            print("\nThe archive of space " + key + " is damaged: " + str(e))
+            return reject_archive(key, "invalid archive")
+        print("Space {}: {} pages, {} blog posts, {} attachments ({} bytes)".format(
+            inventory["space_key"], inventory["pages"], inventory["blog_posts"], inventory["attachments"],
+            inventory["attachment_bytes"]))
+        if inventory["space_key"] != key:
+            print("\nThe archive of space " + key + " contains space " + str(inventory["space_key"]))
+            return reject_archive(key, "space key mismatch")
+
+    if archive_store is not None:
+        # the store reads the archive once more, which double-checks the download
+        confapi_store = import_feature("store")
+        try:
+            store_archive(download_file, sha256)
+        except confapi_store.ChecksumMismatchError as e:
+            print("\nThe archive of space " + key + " is damaged: " + str(e))
+            return reject_archive(key, "checksum mismatch")
+    else:
+        confapi_integrity.write_sidecar(download_file, key=key, size=size, sha256=sha256,
+                                        central_directory_crc32=crc, inventory=inventory, started=started,
+                                        duration=round(duration, 3),
+                                        bytes_per_second=int(size / duration) if duration > 0 else None)
+
+    if export_manifest is not None:
+        export_manifest.update(key, last_export=confapi_manifest.utc_now(),
+                               last_modified=last_modified_markers.get(key), sha256=sha256,
+                               size=size, file=os.path.basename(download_file))
+
+    job_journal.record(key, confapi_journal.DONE, bytes=size, sha256=sha256)
+    return collect_error(0, "Success")
+
+
+def reject_archive(key, value):
+    # a damaged archive is exported again on --resume instead of being downloaded again
+    job_journal.record(key, confapi_journal.FAILED)
+    return collect_error(1, value)
 
-        for chunk in download_response.iter_content(chunk_size=4096):
-            fd.write(chunk)
 
-            if download_size is not None:
-                download_progress += len(chunk)
-                print_progress("Download", int(100 * download_progress / int(download_size)))
+def migrate_space(download_url, key):
+    # Streams the archive from the download on the source host into an import
+    # on the target host. A thread reads the download into a bounded pipe and
+    # the upload reads from the pipe, so at most migrate_buffer_size bytes are
+    # held in memory and a slow target slows the download down.
+    exit_response = ping_target(migrate_host)
+    if exit_response:
+        return exit_response
 
+    print("\nStart migrating space using key " + key + " to " + migrate_host)
+    run_metrics.phase(key, "transfer")
+    start_time = time.monotonic()
+    try:
+        download_response = session.get(download_url, stream=True)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        return print_url_unreachable(e)
+
+    if not download_response.ok:
+        download_response.close()
+        return print_http_error(download_response)
+
+    size = confapi_download.content_length(download_response.headers)
+    pipe = confapi_pipe.StreamPipe(migrate_buffer_size)
+    checksum = confapi_integrity.StreamChecksum()
+    transfer = threading.Thread(target=migrate_transfer, args=(download_response, pipe, checksum, key),
+                                name="migrate-" + key, daemon=True)
+
+    confapi_multipart = import_feature("multipart")
+    encoder = confapi_multipart.MultipartFileEncoder(os.path.basename(export_file(key)), size, lambda: pipe,
+                                                     content_type="application/zip", chunk_size=download_chunk_size,
+                                                     callback=print_migrate_progress)
+    url = confapi_protocol.import_url(migrate_host)
+
+    upload_error = None
+    transfer.start()
+    try:
+        # without a Content-Length from the source the upload is sent chunked
+        import_response = target_session.post(url, data=encoder if size is not None else iter(encoder),
+                                              headers={'Content-Type': encoder.content_type})
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, IOError) as e:
+        upload_error = e
+    finally:
+        # stops the download if the upload has ended before reading all of it
+        pipe.abort()
+        transfer.join()
+
+    run_metrics.add_bytes(key, pipe.bytes_written)
+    node_pool.add_transfer(key, pipe.bytes_written, time.monotonic() - start_time)
+    if pipe.error is not None or upload_error is not None:
+        return print_url_unreachable(pipe.error or upload_error)
+
+    state, queue_url = confapi_protocol.submission_state(import_response)
+    if state == confapi_scheduler.FAILED:
+        return print_server_error(import_response)
+
+    if state == confapi_scheduler.QUEUED:
+        run_metrics.phase(key, "import")
+        exit_response = migrate_queue(queue_url)
+        if exit_response:
+            return exit_response
+    print_progress("Import", 100)
+
+    duration = time.monotonic() - start_time
+    print("Migrated space {} to {}: {} bytes in {:.1f}s, sha256 {}, download waited {} times for the upload".format(
+        key, migrate_host, pipe.bytes_written, duration, checksum.hexdigest(), pipe.writer_waits))
+    job_journal.record(key, confapi_journal.DONE, bytes=pipe.bytes_written, sha256=checksum.hexdigest())
     return collect_error(0, "Success")
 
 
+def migrate_transfer(download_response, pipe, checksum, key):
+    # runs in its own thread and feeds the download into the pipe
+    error = None
+    with confapi_metrics.bind(key):
+        try:
+            for chunk in confapi_download.read_chunks(download_response, download_chunk_size):
+                checksum.update(chunk)
+                pipe.write(chunk)
+        except BrokenPipeError:
+            # the upload has failed, which is reported by the uploading thread
+            pass
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+        finally:
+            download_response.close()
+            pipe.close(error)
+
+
+def migrate_queue(queue_url):
+    # waits for the import on the target host
+    poller = polling_strategy()
+    while True:
+        try:
+            queue_response = target_session.get(queue_url)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            return print_url_unreachable(e)
+
+        state, percentage = confapi_protocol.queue_state(queue_response)
+        if state == confapi_scheduler.FAILED:
+            return print_server_error(queue_response)
+
+        if state == confapi_scheduler.READY:
+            return 0
+
+        if percentage is not None:
+            print_progress("Import", percentage)
+        time.sleep(poller.next_interval(percentage, queue_response))
+
+
+def ping_target(host):
+    result = preflight_cache.check(target_session, host, confapi_protocol.IMPORT_RESOURCE)
+    if result.error is not None:
+        return print_url_unreachable(result.error)
+
+    if not result.ok:
+        return print_http_error(result.response)
+    return 0
+
+
+def print_migrate_progress(bytes_sent, total_bytes):
+    print_transfer_progress("Migrate", bytes_sent, total_bytes)
+
+
+def store_archive(download_file, sha256):
+    try:
+        snapshot = archive_store.add(download_file, sha256=sha256)
+    finally:
+        os.remove(download_file)
+    print("Stored {} as snapshot {}: {} of {} chunks new, {} of {} bytes written".format(
+        snapshot["name"], snapshot["snapshot"], snapshot["new_chunks"], len(snapshot["chunks"]),
+        snapshot["new_bytes"], snapshot["size"]))
+
+
+def export_file(key):
+    return os.getcwd() + "/" + confapi_protocol.export_file_name(key)
+
+
+def count_download_retry(key, error):
+    print("\nDownload of space " + key + " interrupted, resuming: " + str(error))
+    run_metrics.count_retry(key)
+
+
+def print_download_progress(bytes_received, total_bytes, key=None):
+    if key is not None:
+        job_journal.progress(key, bytes_received)
+    print_transfer_progress("Download", bytes_received, total_bytes, key)
+
+
+def export_parallel(keys, max_jobs, max_downloads):
+    global error_collection
+    scheduler = confapi_scheduler.JobScheduler(
+        submit=lambda job: export_submit(node_pool.acquire(job.item).base_url, job.item),
+        poll=lambda job: export_poll(job.queue_url, job.item, job.poller),
+        complete=lambda job, location: export_download(location, job.item),
+        max_jobs=max_jobs, max_completions=max_downloads, poller_factory=polling_strategy, limiter=adaptive_limiter,
+        finished=lambda job: node_pool.release(job.item, failed=job.state == confapi_scheduler.FAILED))
+    if isinstance(keys, list):
+        # the jobs of a key given twice would write the same download file at once
+        keys = list(dict.fromkeys(keys))
+    jobs = scheduler.run(keys)
+
+    # report the errors per space and in the order the keys were given
+    exit_response = 0
+    print("\nResults:")
+    for job in jobs:
+        print("- " + job.item + ": " + (", ".join(job.errors) if job.errors else "skipped"))
+        error_collection.extend(job.errors)
+        exit_response = exit_response or job.exit_response
+
+    return exit_response
+
+
 def init_logging_mode(args):
     if args.verbose:
         logging.basicConfig(level=logging.DEBUG)
@@ -176,6 +728,50 @@ def init_batch_mode(args):
     batch_mode = args.batch
 
 
+def init_parallel_mode(args):
+    global parallel_mode
+    parallel_mode = args.parallel > 1
+
+
+def init_download_options(args):
+    global download_retries
+    global download_segments
+    global download_chunk_size
+    download_retries = args.download_retries
+    download_segments = args.segments
+    download_chunk_size = args.chunk_size
+
+
+def init_incremental_mode(args):
+    global export_manifest
+    global last_modified_markers
+    export_manifest = None
+    last_modified_markers = {}
+    if args.incremental:
+        export_manifest = confapi_manifest.ExportManifest(args.manifest or confapi_manifest.manifest_path(args.host))
+
+
+def init_integrity_options(args):
+    global central_directory_crc
+    global inventory_mode
+    central_directory_crc = args.central_directory_crc
+    inventory_mode = args.inventory
+
+
+def init_archive_store(args):
+    global archive_store
+    archive_store = None
+    if args.store:
+        archive_store = import_feature("store").ChunkStore(args.store)
+
+
+def init_migrate_mode(args):
+    global migrate_host
+    global migrate_buffer_size
+    migrate_host = args.migrate_to
+    migrate_buffer_size = args.buffer_size
+
+
 def init_authentication_tuple(args):
     global authentication_tuple
 
@@ -190,6 +786,114 @@ def init_authentication_tuple(args):
     authentication_tuple = (username, password)
 
 
+def init_polling_strategy(args):
+    global polling_strategy
+    polling_strategy = functools.partial(confapi_polling.POLLING_STRATEGIES[args.poll_strategy],
+                                         min_interval=args.poll_min, max_interval=args.poll_max)
+
+
+def init_session(args):
+    global session
+    session = confapi_session.ConfapiSession(auth=authentication_tuple,
+                                             pool_size=max(args.pool_size, args.parallel,
+                                                           (args.max_downloads or args.parallel) * args.segments),
+                                             connect_timeout=args.connect_timeout,
+                                             read_timeout=args.read_timeout, metrics=run_metrics,
+                                             adaptive_limiter=adaptive_limiter, token_bucket=token_bucket)
+
+
+def init_target_session(args):
+    global target_session
+    target_session = None
+    if not args.migrate_to:
+        return
+
+    username = args.target_username or authentication_tuple[0]
+    password = args.target_password
+    if password is None:
+        if args.target_username is None:
+            password = authentication_tuple[1]
+        else:
+            password = getpass.getpass(prompt='Password for ' + args.migrate_to + ': ', stream=None)
+
+    target_session = confapi_session.ConfapiSession(auth=(username, password),
+                                                    pool_size=max(args.pool_size, args.parallel),
+                                                    connect_timeout=args.connect_timeout,
+                                                    read_timeout=args.read_timeout, metrics=run_metrics)
+
+
+def init_progress_renderer(args):
+    global progress_renderer
+    # without a terminal the renderer writes log lines instead
+    progress_renderer = confapi_progress.ProgressRenderer(interactive=False if batch_mode else None)
+
+
+def close_progress_renderer():
+    global progress_renderer
+    progress_renderer.close()
+    progress_renderer = None
+
+
+def init_limiters(args):
+    global adaptive_limiter
+    global token_bucket
+    global overload_retries
+    adaptive_limiter, token_bucket = confapi_limiter.create_limiters(
+        args.max_jobs or args.parallel if args.adaptive_concurrency else None, args.max_rps)
+    overload_retries = args.overload_retries
+
+
+def init_metrics(args):
+    global run_metrics
+    run_metrics = confapi_metrics.RunMetrics("export", event_log=args.event_log)
+
+
+def close_metrics(args):
+    global run_metrics
+    print(run_metrics.summary())
+    run_metrics.close(args.metrics_file)
+    run_metrics = None
+
+
+def init_job_journal(args):
+    global job_journal
+    global resume_mode
+    job_journal = confapi_journal.JobJournal(args.journal or confapi_journal.journal_path(args.host, "export"))
+    resume_mode = args.resume
+
+
+def close_job_journal():
+    global job_journal
+    job_journal.close()
+    job_journal = None
+
+
+def init_node_pool(args):
+    global node_pool
+    node_pool = confapi_nodes.NodePool(args.node or [args.host], cluster_url=args.host)
+
+
+def init_preflight_cache(args):
+    global preflight_cache
+    preflight_cache = confapi_preflight.PreflightCache(ttl=args.preflight_ttl)
+
+
+def close_session():
+    global session
+    global target_session
+    print(session.summary())
+    if adaptive_limiter is not None:
+        print(adaptive_limiter.summary())
+    if node_pool is not None and len(node_pool.nodes) > 1:
+        print(node_pool.summary())
+    session.close()
+    session = None
+    if target_session is not None:
+        print("Target: " + target_session.summary())
+        target_session.close()
+        target_session = None
+
+
 def main(argv):
     global error_collection
     error_collection = []
@@ -198,22 +902,118 @@ def main(argv):
 
     init_logging_mode(args)
     init_batch_mode(args)
+    init_parallel_mode(args)
+    init_download_options(args)
+    init_incremental_mode(args)
+    init_archive_store(args)
+    init_integrity_options(args)
+    init_migrate_mode(args)
+
+    if args.verify:
+        return verify_keys(args)
+
+    init_polling_strategy(args)
     init_authentication_tuple(args)
+    init_metrics(args)
+    init_limiters(args)
+    init_progress_renderer(args)
+    init_session(args)
+    init_target_session(args)
+    init_preflight_cache(args)
+    init_node_pool(args)
+    init_job_journal(args)
+
+    try:
+        return export_keys(args)
+    finally:
+        close_progress_renderer()
+        close_session()
+        close_job_journal()
+        close_metrics(args)
 
-    print("\nExporting spaces using the following keys:")
-    for key in args.key.split(','):
-        print("- " + key)
 
-    for key in args.key.split(','):
-        exit_response = export_start(args.host, key)
+def verify_keys(args):
+    keys = args.key.split(',')
+
+    print("\nVerifying archives of the following keys:")
+    for key in keys:
+        if archive_store is not None:
+            problem = archive_store.verify(os.path.basename(export_file(key)))
+        else:
+            problem = confapi_integrity.verify_archive(export_file(key))
+        print("- " + key + ": " + (problem or "ok"))
+        if problem:
+            collect_error(1, problem)
+        else:
+            collect_error(0, "Success")
+
+    if any(error != '0: Success' for error in error_collection):
+        print(error_collection)
+    return error_collection
+
+
+def export_keys(args):
+    # Ping server to verify the credentials before anything is submitted
+    exit_response = ping_server(args.host)
+    if not exit_response and migrate_host is not None:
+        exit_response = ping_target(migrate_host)
+    if exit_response:
+        return error_collection
+
+    if args.all:
+        print("\nExporting all spaces" + (" of type " + args.space_type if args.space_type else ""))
+        keys = discover_keys(args)
+    else:
+        keys = args.key.split(',')
+        # without --resume the jobs of an earlier run are not picked up again
+        if not resume_mode:
+            job_journal.forget(keys)
+
+        print("\nExporting spaces using the following keys:")
+        for key in keys:
+            print("- " + key)
+
+    if parallel_mode:
+        exit_response = export_parallel(keys, args.max_jobs or args.parallel, args.max_downloads or args.parallel)
 
         if exit_response:
             return error_collection
+    else:
+        for key in keys:
+            with confapi_metrics.bind(key):
+                exit_response = export_start(key)
 
-    if any(error != '0: Success' for error in error_collection):
+            if exit_response:
+                return error_collection
+
+    if any(error not in ('0: Success', '0: Unchanged') for error in error_collection):
         print(error_collection)
     return error_collection
 
 
+def discover_keys(args):
+    # the keys are handed out while the space list is still being paged through
+    confapi_spaces = import_feature("spaces")
+    found = 0
+    selected = 0
+    try:
+        for space in confapi_spaces.iter_spaces(session, args.host, args.space_type, args.page_size):
+            found += 1
+            if not confapi_spaces.matches(space["key"], args.include, args.exclude):
+                continue
+            selected += 1
+            if not resume_mode:
+                job_journal.forget([space["key"]])
+            yield space["key"]
+
+    except requests.exceptions.HTTPError as e:
+        print("\nThe spaces could not be listed")
+        print_http_error(e.response)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        print_url_unreachable(e)
+
+    print("\nFound {} spaces, {} of them selected".format(found, selected))
+
+
 if __name__ == "__main__":
     main(argv=sys.argv)
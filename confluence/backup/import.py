@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
 
 import argparse
-import fnmatch
+import functools
 import getpass
-import json
 import logging
 import os
 import requests
@@ -11,27 +10,75 @@ import sys
 import time
 import urllib3
 
+try:
+    from .confapi import discovery as confapi_discovery
+    from .confapi import journal as confapi_journal
+    from .confapi import limiter as confapi_limiter
+    from .confapi import metrics as confapi_metrics
+    from .confapi import multipart as confapi_multipart
+    from .confapi import polling as confapi_polling
+    from .confapi import preflight as confapi_preflight
+    from .confapi import protocol as confapi_protocol
+    from .confapi import progress as confapi_progress
+    from .confapi import scheduler as confapi_scheduler
+    from .confapi import session as confapi_session
+    from .confapi import ziputil as confapi_ziputil
+except ImportError:
+    from confapi import discovery as confapi_discovery
+    from confapi import journal as confapi_journal
+    from confapi import limiter as confapi_limiter
+    from confapi import metrics as confapi_metrics
+    from confapi import multipart as confapi_multipart
+    from confapi import polling as confapi_polling
+    from confapi import preflight as confapi_preflight
+    from confapi import protocol as confapi_protocol
+    from confapi import progress as confapi_progress
+    from confapi import scheduler as confapi_scheduler
+    from confapi import session as confapi_session
+    from confapi import ziputil as confapi_ziputil
+
 urllib3.disable_warnings()
 
 # constant variables
-IMPORT_RESOURCE = "rest/confapi/1/backup/import"
 terminate_script = [444, 403, 401]
 
 # global variables
 batch_mode = False
+parallel_mode = False
 authentication_tuple = ()
 error_collection = []
+session = None
+polling_strategy = confapi_polling.AdaptivePolling
+preflight_mode = True
+preflight_cache = None
+job_journal = None
+resume_mode = False
+run_metrics = None
+progress_renderer = None
+adaptive_limiter = None
+token_bucket = None
+overload_retries = confapi_limiter.DEFAULT_OVERLOAD_RETRIES
 
 
 def collect_error(error_code, value):
     global error_collection
     global terminate_script
     message = str(error_code) + ": " + value
-    error_collection.append(message)
+    # in parallel mode every file collects its own errors
+    job = confapi_scheduler.current_job()
+    errors = job.errors if job is not None else error_collection
+    errors.append(message)
+    # the strings are kept for compatibility, the metrics hold the structured result
+    if run_metrics is not None:
+        run_metrics.finish(confapi_metrics.current_item(), error_code, value)
+    if progress_renderer is not None:
+        progress_renderer.finish(confapi_metrics.current_item())
     if error_code == 401:
         print("HINT: After multiple failed login attempts it might be required to solve a CAPTCHA")
+    if error_code in confapi_polling.RETRY_STATUS_CODES:
+        print("HINT: The server is overloaded, try --adaptive-concurrency, --max-rps or a lower --parallel")
     if error_code in terminate_script:
-        print(error_collection)
+        print(errors)
         return 1
     return 0
 
@@ -47,13 +94,63 @@ def parse_args(args):
 
     # positional arguments
     parser.add_argument("host", help="provide host url e.g. http://localhost:1990/confluence")
-    parser.add_argument('vars', nargs='*', help="provide list of unix wildcards e.g. *.zip *.xml")
+    parser.add_argument('vars', nargs='*', help="provide list of unix wildcards e.g. *.zip *.xml or exports/**/*.zip")
 
     # optional arguments
     parser.add_argument("-v", "--verbose", action="store_true",
                         help="increase output verbosity.")
     parser.add_argument("-b", "--batch", action="store_true",
                         help="run in batch mode.")
+    parser.add_argument("--pool-size", type=int, default=confapi_session.DEFAULT_POOL_SIZE,
+                        help="maximum number of pooled connections per host (default: %(default)s).")
+    parser.add_argument("--connect-timeout", type=float, default=confapi_session.DEFAULT_CONNECT_TIMEOUT,
+                        help="connect timeout in seconds (default: %(default)s).")
+    parser.add_argument("--read-timeout", type=float, default=confapi_session.DEFAULT_READ_TIMEOUT,
+                        help="read timeout in seconds (default: %(default)s).")
+    parser.add_argument("-p", "--parallel", type=int, default=1,
+                        help="number of archives imported at once (default: 1);\n"
+                             "the next archive is uploaded while the server imports the previous ones.")
+    parser.add_argument("--max-jobs", type=int,
+                        help="maximum number of server-side imports in flight, including the ones being uploaded;\n"
+                             "defaults to the value of --parallel.")
+    parser.add_argument("--max-uploads", type=int, default=1,
+                        help="maximum number of concurrent uploads (default: %(default)s).")
+    parser.add_argument("--order", choices=confapi_discovery.ORDERS, default="size",
+                        help="order of the imports (default: %(default)s);\n"
+                             "size and inventory import the largest archives first, by file size or by the\n"
+                             "uncompressed size of their content, name in the order the files were found.")
+    parser.add_argument("--skip-preflight", action="store_true",
+                        help="upload archives without checking their zip central directory first.")
+    parser.add_argument("--preflight-ttl", type=float, default=confapi_preflight.DEFAULT_TTL,
+                        help="seconds a successful check of credentials and permissions is reused\n"
+                             "(default: %(default)s).")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run: re-attach to the imports still running on the server\n"
+                             "and skip the files imported before.")
+    parser.add_argument("--journal",
+                        help="file of the job journal used by --resume;\n"
+                             "defaults to .confapi-import-<host>.db in the current directory.")
+    parser.add_argument("--event-log",
+                        help="append the timings, request and byte counts of every job and phase\n"
+                             "as JSON lines to this file.")
+    parser.add_argument("--metrics-file",
+                        help="write the metrics of the run to this file in the Prometheus text format,\n"
+                             "e.g. for the textfile collector of the node exporter.")
+    parser.add_argument("--adaptive-concurrency", action="store_true",
+                        help="adapt the number of imports in flight to the server: start with one and add more\n"
+                             "while its latency stays stable, back off on 429/503 responses, timeouts or\n"
+                             "rising latency; --max-jobs or --parallel is the upper limit.")
+    parser.add_argument("--max-rps", type=float,
+                        help="maximum number of requests per second sent to the server.")
+    parser.add_argument("--overload-retries", type=int, default=confapi_limiter.DEFAULT_OVERLOAD_RETRIES,
+                        help="number of times an import answered with 429 or 503 is submitted again,\n"
+                             "after the delay the server asks for (default: %(default)s).")
+    parser.add_argument("--poll-strategy", choices=sorted(confapi_polling.POLLING_STRATEGIES), default="adaptive",
+                        help="strategy for polling the status of server-side jobs (default: %(default)s).")
+    parser.add_argument("--poll-min", type=float, default=confapi_polling.DEFAULT_MIN_INTERVAL,
+                        help="minimum seconds between two status requests (default: %(default)s).")
+    parser.add_argument("--poll-max", type=float, default=confapi_polling.DEFAULT_MAX_INTERVAL,
+                        help="maximum seconds between two status requests (default: %(default)s).")
     parser.add_argument("-U", "--username",
                         help="provide username e.g. admin;\n"
                              "if not provided the user will be prompted to enter a username and a password.")
@@ -70,91 +167,199 @@ def print_url_unreachable(error):
     return collect_error(444, "url not reachable")
 
 
+def print_overload(response, delay):
+    print("\nThe server is overloaded (" + str(response.status_code) + "), submitting again in {:.1f}s".format(delay))
+
+
+def print_server_error(http_response):
+    # the error messages of the server, if it has sent any, and the status code
+    error_messages = confapi_protocol.error_messages(http_response)
+    if error_messages:
+        print(error_messages)
+    return print_http_error(http_response)
+
+
 def print_http_error(http_response):
     print("An error occurred: " + str(http_response.status_code) + "\n" +
           requests.status_codes._codes[http_response.status_code][0])
     return collect_error(http_response.status_code, requests.status_codes._codes[http_response.status_code][0])
 
 
-def parse_json(content):
-    try:
-        content = content.decode("utf-8")
-        result = json.loads(content)
-    except:
-        result = {}
-    return result
-
+def print_progress(title, percentage, key=None):
+    progress_renderer.update(key if key is not None else confapi_metrics.current_item(), title, percentage)
 
-def print_progress(title, percentage):
-    if not batch_mode:
-        sys.stdout.write("\r%s: %d%%" % (title, percentage))
-        sys.stdout.flush()
 
-        if percentage == 100:
-            print()
+def print_transfer_progress(title, bytes_transferred, total_bytes, key=None):
+    progress_renderer.update(key if key is not None else confapi_metrics.current_item(), title, bytes_transferred,
+                             total_bytes, unit=confapi_progress.BYTES)
 
 
 def import_start(host, file):
-    exit_response = 0
+    state, value = import_submit(host, file)
+
+    if state in (confapi_scheduler.FAILED, confapi_scheduler.DONE):
+        return value
+
+    if state == confapi_scheduler.QUEUED:
+        state, value = import_queue(value, file)
+        if state == confapi_scheduler.FAILED:
+            return value
+
+    return import_done(file)
+
+
+def import_done(file):
+    job_journal.record(journal_item(file), confapi_journal.DONE, bytes=os.path.getsize(file))
+    return collect_error(0, "Success")
+
+
+def journal_item(file):
+    # the same file may be found through different paths
+    return os.path.realpath(file)
+
+
+def import_submit(host, file):
     print("\nStart importing space using file " + file)
+    run_metrics.phase(file, "check")
 
-    url_infix = "/" if host[-1] != "/" else ""
-    url = "{}{}{}".format(host, url_infix, IMPORT_RESOURCE)
+    if preflight_mode:
+        # reject broken archives before anything is uploaded
+        problem = confapi_ziputil.check_export_archive(file)
+        if problem is not None:
+            print("Invalid archive " + file + ": " + problem)
+            return confapi_scheduler.FAILED, collect_error(400, "bad_request")
 
-    # Ping server to verify credentials and permissions
-    ping_server(host, url)
+    url = confapi_protocol.import_url(host)
+
+    # Ping server to verify credentials and permissions, once per host and TTL
+    exit_response = ping_server(host)
+    if exit_response:
+        return confapi_scheduler.FAILED, exit_response
 
+    if resume_mode:
+        state, value = import_resume(file)
+        if state is not None:
+            return state, value
+
+    try:
+        encoder = confapi_multipart.MultipartFileEncoder.from_path(file, callback=print_upload_progress)
+        run_metrics.phase(file, "upload")
+        import_response = confapi_limiter.send_submission(session, "POST", url, overload_retries, print_overload,
+                                                          data=encoder, headers={'Content-Type': encoder.content_type})
+        run_metrics.add_bytes(file, encoder.bytes_read)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        return confapi_scheduler.FAILED, print_url_unreachable(e)
+
+    state, queue_url = confapi_protocol.submission_state(import_response)
+    if state == confapi_scheduler.FAILED:
+        return state, print_server_error(import_response)
+
+    if state == confapi_scheduler.QUEUED:
+        run_metrics.phase(file, "queue")
+        job_journal.record(journal_item(file), confapi_journal.QUEUED,
+                           queue_url=queue_url, bytes=os.path.getsize(file))
+        return state, queue_url
+
+    print_progress("Import", 100)
+    return confapi_scheduler.READY, None
+
+
+def import_resume(file):
+    # re-attaches to the import of an interrupted run, if it is still known to the server
+    entry = job_journal.get(journal_item(file))
+    if entry is None or entry["bytes"] != os.path.getsize(file):
+        return None, None
+
+    if entry["state"] == confapi_journal.DONE:
+        print("Skip importing space using file " + file + ", it has been imported before")
+        return confapi_scheduler.DONE, collect_error(0, "Success")
+
+    if entry["state"] == confapi_journal.QUEUED and job_available(entry["queue_url"]):
+        print("Resume importing space using file " + file)
+        run_metrics.phase(file, "queue")
+        return confapi_scheduler.QUEUED, entry["queue_url"]
+
+    return None, None
+
+
+def job_available(url):
+    # the server forgets its jobs when it is restarted
+    if not url:
+        return False
     try:
-        print("Upload: No progress info available (yet)")
-        import_response = requests.post(url, files={'file': open(file, 'rb')}, auth=authentication_tuple, verify=False)
-
-        if not import_response.ok:
-            content = parse_json(import_response.content)
-            if "errorMessages" in content:
-                print(content["errorMessages"])
-            exit_response = print_http_error(import_response)
-        else:
-            if import_response.status_code == 201:
-                print_progress("Import", 100)
-            if import_response.status_code == 202:
-                queue_url = import_response.headers['Location']
-                import_queue(queue_url)
-            collect_error(0, "Success")
-
-    except requests.exceptions.ConnectionError as e:
-        exit_response = print_url_unreachable(e)
+        response = session.get(url)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        return False
+    return response.status_code not in (404, 410)
 
-    return exit_response
 
+def print_upload_progress(bytes_sent, total_bytes):
+    print_transfer_progress("Upload", bytes_sent, total_bytes)
 
-def import_queue(queue_url):
-    while True:
-        queue_response = requests.get(queue_url, auth=authentication_tuple, verify=False)
 
-        if queue_response.ok:
-            content = parse_json(queue_response.content)
-            percentage = content["percentageComplete"]
-            print_progress("Import", percentage)
+def import_queue(queue_url, file):
+    poller = polling_strategy()
+    while True:
+        state, value = import_poll(queue_url, file, poller)
 
-        if queue_response.status_code != 200:
-            break
+        if state != confapi_scheduler.RUNNING:
+            return state, value
 
-        time.sleep(1)
+        time.sleep(value)
 
 
-def ping_server(baseurl, url):
+def import_poll(queue_url, file, poller):
     try:
-        resp_get = requests.get(baseurl, auth=authentication_tuple, verify=False)
-        resp_put = requests.put(url, auth=authentication_tuple, verify=False)
-    except requests.exceptions.ConnectionError as e:
-        return print_url_unreachable(e)
+        queue_response = session.get(queue_url)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        return confapi_scheduler.FAILED, print_url_unreachable(e)
+
+    # a busy server (429, 503) is asked again when it tells us to
+    state, percentage = confapi_protocol.queue_state(queue_response)
+    if state == confapi_scheduler.FAILED:
+        return state, print_server_error(queue_response)
 
-    if not resp_get.ok:
-        return print_http_error(resp_get)
+    if state == confapi_scheduler.READY:
+        print_progress("Import", 100)
+        return state, None
 
-    if not resp_put.ok:
-        if resp_put.status_code == 403:
-            return print_http_error(resp_put)
+    if percentage is not None:
+        print_progress("Import", percentage)
+    if percentage:
+        run_metrics.phase(file, "processing")
+    return confapi_scheduler.RUNNING, poller.next_interval(percentage, queue_response)
+
+
+def import_parallel(host, file_names, max_jobs, max_uploads):
+    global error_collection
+    scheduler = confapi_scheduler.JobScheduler(
+        submit=lambda job: import_submit(host, job.item),
+        poll=lambda job: import_poll(job.queue_url, job.item, job.poller),
+        complete=lambda job, location: import_done(job.item),
+        max_jobs=max_jobs, max_submits=max_uploads, poller_factory=polling_strategy, limiter=adaptive_limiter)
+    jobs = scheduler.run(file_names)
+
+    # report the errors and timings per file and in the order the files were found
+    exit_response = 0
+    print("\nResults:")
+    for job in jobs:
+        timings = run_metrics.jobs[job.item].describe_phases() if job.item in run_metrics.jobs else ""
+        print("- " + job.item + ": " + (", ".join(job.errors) if job.errors else "skipped") +
+              (" (" + timings + ")" if timings else ""))
+        error_collection.extend(job.errors)
+        exit_response = exit_response or job.exit_response
+
+    return exit_response
+
+
+def ping_server(host):
+    result = preflight_cache.check(session, host, confapi_protocol.IMPORT_RESOURCE)
+    if result.error is not None:
+        return print_url_unreachable(result.error)
+
+    if not result.ok:
+        return print_http_error(result.response)
+    return 0
 
 
 def init_logging_mode(args):
@@ -181,6 +386,91 @@ def init_authentication_tuple(args):
     authentication_tuple = (username, password)
 
 
+def init_parallel_mode(args):
+    global parallel_mode
+    parallel_mode = args.parallel > 1
+
+
+def init_preflight_mode(args):
+    global preflight_mode
+    preflight_mode = not args.skip_preflight
+
+
+def init_polling_strategy(args):
+    global polling_strategy
+    polling_strategy = functools.partial(confapi_polling.POLLING_STRATEGIES[args.poll_strategy],
+                                         min_interval=args.poll_min, max_interval=args.poll_max)
+
+
+def init_session(args):
+    global session
+    session = confapi_session.ConfapiSession(auth=authentication_tuple,
+                                             pool_size=max(args.pool_size, args.parallel),
+                                             connect_timeout=args.connect_timeout,
+                                             read_timeout=args.read_timeout, metrics=run_metrics,
+                                             adaptive_limiter=adaptive_limiter, token_bucket=token_bucket)
+
+
+def init_progress_renderer(args):
+    global progress_renderer
+    # without a terminal the renderer writes log lines instead
+    progress_renderer = confapi_progress.ProgressRenderer(interactive=False if batch_mode else None)
+
+
+def close_progress_renderer():
+    global progress_renderer
+    progress_renderer.close()
+    progress_renderer = None
+
+
+def init_limiters(args):
+    global adaptive_limiter
+    global token_bucket
+    global overload_retries
+    adaptive_limiter, token_bucket = confapi_limiter.create_limiters(
+        args.max_jobs or args.parallel if args.adaptive_concurrency else None, args.max_rps)
+    overload_retries = args.overload_retries
+
+
+def init_metrics(args):
+    global run_metrics
+    run_metrics = confapi_metrics.RunMetrics("import", event_log=args.event_log)
+
+
+def close_metrics(args):
+    global run_metrics
+    print(run_metrics.summary())
+    run_metrics.close(args.metrics_file)
+    run_metrics = None
+
+
+def init_job_journal(args):
+    global job_journal
+    global resume_mode
+    job_journal = confapi_journal.JobJournal(args.journal or confapi_journal.journal_path(args.host, "import"))
+    resume_mode = args.resume
+
+
+def close_job_journal():
+    global job_journal
+    job_journal.close()
+    job_journal = None
+
+
+def init_preflight_cache(args):
+    global preflight_cache
+    preflight_cache = confapi_preflight.PreflightCache(ttl=args.preflight_ttl)
+
+
+def close_session():
+    global session
+    print(session.summary())
+    if adaptive_limiter is not None:
+        print(adaptive_limiter.summary())
+    session.close()
+    session = None
+
+
 def main(argv):
     global error_collection
     error_collection = []
@@ -189,37 +479,54 @@ def main(argv):
 
     init_logging_mode(args)
     init_batch_mode(args)
+    init_parallel_mode(args)
+    init_preflight_mode(args)
+    init_polling_strategy(args)
     init_authentication_tuple(args)
+    init_metrics(args)
+    init_limiters(args)
+    init_progress_renderer(args)
+    init_session(args)
+    init_preflight_cache(args)
+    init_job_journal(args)
+
+    try:
+        return import_files(args)
+    finally:
+        close_progress_renderer()
+        close_session()
+        close_job_journal()
+        close_metrics(args)
 
-    file_wildcards = args.vars
-    file_names = []
-    for wildcard in file_wildcards:
-        directory = '.'
-        if "/" in wildcard:
-            pos = wildcard.rfind('/')
-            directory = wildcard[0:pos]
-            wildcard = wildcard[pos + 1:]
-        for file in os.listdir(directory):
-            if fnmatch.fnmatch(file, wildcard):
-                file_names.append(directory + "/" + file)
-
-    url_infix = "/" if args.host[-1] != "/" else ""
-    url = "{}{}{}".format(args.host, url_infix, IMPORT_RESOURCE)
+
+def import_files(args):
+    file_names = confapi_discovery.order_files(confapi_discovery.discover_files(args.vars), args.order)
 
     # Ping server to verify credentials and permissions
-    exit_response = ping_server(args.host, url)
+    exit_response = ping_server(args.host)
     if exit_response:
         return error_collection
 
+    # without --resume the jobs of an earlier run are not picked up again
+    if not resume_mode:
+        job_journal.forget([journal_item(file) for file in file_names])
+
     print("\nImporting spaces using the following files:")
     for file in file_names:
         print("- " + file)
 
-    for file in file_names:
-        import_start(args.host, file)
+    if parallel_mode:
+        exit_response = import_parallel(args.host, file_names, args.max_jobs or args.parallel, args.max_uploads)
 
         if exit_response:
             return error_collection
+    else:
+        for file in file_names:
+            with confapi_metrics.bind(file):
+                exit_response = import_start(args.host, file)
+
+            if exit_response:
+                return error_collection
 
     if any(error != '0: Success' for error in error_collection):
         print(error_collection)
@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+
+# Local stand-in for the ConfAPI backup resources of a Confluence instance.
+# It reproduces the 201/202 flows with Location headers and percentageComplete
+# progress of rest/confapi/1/backup/export and /import, serves real export
+# archives (entities.xml, exportDescriptor.properties, attachments) and can add
+# latency, limit the bandwidth and inject failures.
+#
+# Run standalone with: python3 mock_server.py --port 1990
+
+import argparse
+import base64
+import collections
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# constant variables
+BACKUP_RESOURCE = "/rest/confapi/1/backup"
+USERS = {
+    "admin": {"password": "admin", "admin": True},
+    "user": {"password": "user", "admin": False},
+}
+BUFFER_SIZE = 64 * 1024
+
+
+class MockJob:
+
+    def __init__(self, job_id, kind, key, duration):
+        self.job_id = job_id
+        self.kind = kind
+        self.key = key
+        self.duration = duration
+        self.created = time.monotonic()
+
+    def percentage(self):
+        if self.duration <= 0:
+            return 100
+        return min(100, int(100 * (time.monotonic() - self.created) / self.duration))
+
+
+class MockConfapiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, spaces=None, archive_size=64 * 1024, job_duration=0.5, instant=False,
+                 latency=0.0, bandwidth=None, fail_rate=0.0, retry_after=1, drop_rate=0.0, context="/confluence",
+                 seed=None, capacity=None, public_url=None):
+        super().__init__(("localhost", port), MockConfapiHandler)
+        self.archive_size = archive_size
+        self.job_duration = job_duration
+        self.instant = instant
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.fail_rate = fail_rate
+        self.retry_after = retry_after
+        self.drop_rate = drop_rate
+        # jobs of a kind running at once before new ones are answered with 429
+        self.capacity = capacity
+        # the server forgets its jobs, like after a restart
+        self.forget_jobs = False
+        self.context = context.rstrip("/")
+        # base URL in the Location headers, like the base URL of a cluster behind a load balancer
+        self._public_url = public_url
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.spaces = collections.OrderedDict()
+        self.content = {}
+        for key in (spaces if spaces is not None else ["ds"]):
+            self.add_space(key)
+        self.archives = {}
+        self.jobs = {}
+        self.thread = None
+
+        # statistics of the run
+        self.requests = collections.Counter()
+        self.connections = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.max_running_jobs = collections.Counter()
+
+    @property
+    def base_url(self):
+        return "http://localhost:{}{}".format(self.server_port, self.context)
+
+    @property
+    def public_url(self):
+        return self._public_url or self.base_url
+
+    @public_url.setter
+    def public_url(self, value):
+        self._public_url = value
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_space(self, key, space_type="global", name=None):
+        with self.lock:
+            self.spaces[key] = {"key": key, "name": name or key, "type": space_type}
+            self.content[key] = {"count": 4, "last_modified": "2020-01-01T00:00:00.000Z"}
+
+    def touch_space(self, key, count=None):
+        # simulates an edit (or deletion, if count is given) in the space
+        with self.lock:
+            self.content[key]["last_modified"] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()) \
+                .replace("000Z", "{:03d}Z".format(self.random.randint(0, 999)))
+            if count is not None:
+                self.content[key]["count"] = count
+
+    def create_job(self, kind, key):
+        # returns None if the server already runs as many jobs of the kind as it can
+        with self.lock:
+            running = sum(1 for job in self.jobs.values() if job.kind == kind and job.percentage() < 100)
+            if self.capacity is not None and running >= self.capacity:
+                return None
+            job_id = str(len(self.jobs) + 1)
+            self.jobs[job_id] = MockJob(job_id, kind, key, self.job_duration)
+            self.max_running_jobs[kind] = max(self.max_running_jobs[kind], running + 1)
+            return self.jobs[job_id]
+
+    def archive(self, key):
+        with self.lock:
+            if key not in self.archives:
+                self.archives[key] = build_archive(key, self.archive_size)
+            return self.archives[key]
+
+    def should(self, rate):
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def count(self, method, endpoint, received=0, sent=0):
+        with self.lock:
+            self.requests[(method, endpoint)] += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": sum(self.requests.values()),
+                "requests_by_endpoint": {"{} {}".format(*key): value for key, value in sorted(self.requests.items())},
+                "connections": self.connections,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "max_running_jobs": dict(self.max_running_jobs),
+            }
+
+
+class MockConfapiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockConfluence/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    # request dispatching
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_HEAD(self):
+        self.dispatch("HEAD")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        url = urlsplit(self.path)
+        path = url.path
+        if not path.startswith(self.server.context):
+            return self.reply(method, "other", 404)
+        path = path[len(self.server.context):]
+
+        routes = [
+            ("GET", r"/?$", "base", self.handle_base),
+            ("GET", BACKUP_RESOURCE + r"/export/([^/]+)$", "export", self.handle_export),
+            ("GET", BACKUP_RESOURCE + r"/queue/(\d+)$", "queue", self.handle_queue),
+            ("GET", BACKUP_RESOURCE + r"/download/([^/]+)$", "download", self.handle_download),
+            ("HEAD", BACKUP_RESOURCE + r"/download/([^/]+)$", "download", self.handle_download),
+            ("PUT", BACKUP_RESOURCE + r"/import$", "import", self.handle_import_check),
+            ("POST", BACKUP_RESOURCE + r"/import$", "import", self.handle_import),
+            ("GET", r"/rest/api/space$", "space", self.handle_spaces),
+            ("GET", r"/rest/api/content/search$", "search", self.handle_content_search),
+        ]
+        for route_method, pattern, endpoint, handler in routes:
+            match = re.match(pattern, path)
+            if match and route_method == method:
+                user = self.authenticate()
+                if user is None:
+                    self.discard_body()
+                    return self.reply(method, endpoint, 401, {"errorMessages": ["unauthorized"]})
+                if endpoint not in ("base", "space", "search") and not USERS[user]["admin"]:
+                    self.discard_body()
+                    return self.reply(method, endpoint, 403, {"errorMessages": ["forbidden"]})
+                return handler(method, endpoint, parse_qs(url.query), *match.groups())
+
+        self.discard_body()
+        self.reply(method, "other", 404)
+
+    def authenticate(self):
+        header = self.headers.get("Authorization", "")
+        if not header.startswith("Basic "):
+            return None
+        try:
+            username, password = base64.b64decode(header[6:]).decode("utf-8").split(":", 1)
+        except (ValueError, UnicodeDecodeError):
+            return None
+        if username in USERS and USERS[username]["password"] == password:
+            return username
+        return None
+
+    # resources
+
+    def handle_base(self, method, endpoint, query):
+        self.reply(method, endpoint, 200, body=b"<html>Confluence</html>", content_type="text/html")
+
+    def handle_export(self, method, endpoint, query, key):
+        if key not in self.server.spaces:
+            return self.reply(method, endpoint, 404, {"errorMessages": ["Space with key " + key + " not found"]})
+        job = self.server.create_job("export", key)
+        if job is None:
+            return self.reply(method, endpoint, 429, {"errorMessages": ["Too many running exports"]},
+                              headers={"Retry-After": str(self.server.retry_after)})
+        if self.server.instant:
+            return self.reply(method, endpoint, 201, headers={"Location": self.download_url(key)})
+        self.reply(method, endpoint, 202, headers={"Location": self.queue_url(job)})
+
+    def handle_queue(self, method, endpoint, query, job_id):
+        job = self.server.jobs.get(job_id)
+        if job is None or self.server.forget_jobs:
+            return self.reply(method, endpoint, 404, {"errorMessages": ["Job " + job_id + " not found"]})
+        if self.server.should(self.server.fail_rate):
+            return self.reply(method, endpoint, 503, {"errorMessages": ["Service unavailable"]},
+                              headers={"Retry-After": str(self.server.retry_after)})
+
+        percentage = job.percentage()
+        if percentage < 100:
+            return self.reply(method, endpoint, 200, {"percentageComplete": percentage})
+        if job.kind == "export":
+            return self.reply(method, endpoint, 201, {"percentageComplete": 100},
+                              headers={"Location": self.download_url(job.key)})
+        self.reply(method, endpoint, 201, {"percentageComplete": 100},
+                   headers={"Location": self.server.public_url + "/rest/api/space/" + job.key})
+
+    def handle_download(self, method, endpoint, query, key):
+        if key not in self.server.spaces:
+            return self.reply(method, endpoint, 404)
+        archive = self.server.archive(key)
+        etag = '"' + hashlib.sha1(archive).hexdigest()[:16] + '"'
+        headers = {"ETag": etag, "Accept-Ranges": "bytes", "Content-Type": "application/zip"}
+
+        first, last, status = 0, len(archive) - 1, 200
+        match = re.match(r"bytes=(\d*)-(\d*)$", self.headers.get("Range", ""))
+        if match and self.headers.get("If-Range", etag) == etag:
+            if match.group(1):
+                first = int(match.group(1))
+                if match.group(2):
+                    last = min(last, int(match.group(2)))
+            elif match.group(2):
+                first = max(0, len(archive) - int(match.group(2)))
+            if first >= len(archive) or first > last:
+                headers["Content-Range"] = "bytes */{}".format(len(archive))
+                return self.reply(method, endpoint, 416, headers=headers)
+            status = 206
+            headers["Content-Range"] = "bytes {}-{}/{}".format(first, last, len(archive))
+
+        body = archive[first:last + 1]
+        if method == "HEAD":
+            return self.reply(method, endpoint, status, headers=headers, content_length=len(body))
+
+        drop = self.server.should(self.server.drop_rate)
+        self.reply(method, endpoint, status, body=body[:len(body) // 2] if drop else body, headers=headers,
+                   content_length=len(body))
+        if drop:
+            # the client sees a connection that dropped in the middle of the download
+            self.close_connection = True
+
+    def handle_import_check(self, method, endpoint, query):
+        self.discard_body()
+        self.reply(method, endpoint, 200)
+
+    def handle_import(self, method, endpoint, query):
+        with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as body:
+            received = self.read_body(body)
+            # zipfile finds the archive inside the multipart body on its own
+            try:
+                with zipfile.ZipFile(body) as archive:
+                    names = archive.namelist()
+                    properties = archive.read("exportDescriptor.properties").decode("utf-8")
+                    if "entities.xml" not in names:
+                        raise KeyError("entities.xml")
+            except (zipfile.BadZipFile, KeyError) as e:
+                return self.reply(method, endpoint, 400, {"errorMessages": ["Invalid space export: " + str(e)]},
+                                  received=received)
+
+        match = re.search(r"^spaceKey=(.*)$", properties, re.MULTILINE)
+        key = match.group(1).strip() if match else None
+        if not key or key in self.server.spaces:
+            return self.reply(method, endpoint, 400, {"errorMessages": ["Space " + str(key) + " already exists"]},
+                              received=received)
+        job = self.server.create_job("import", key)
+        if job is None:
+            return self.reply(method, endpoint, 429, {"errorMessages": ["Too many running imports"]},
+                              received=received, headers={"Retry-After": str(self.server.retry_after)})
+
+        self.server.add_space(key)
+        if self.server.instant:
+            return self.reply(method, endpoint, 201, received=received,
+                              headers={"Location": self.server.public_url + "/rest/api/space/" + key})
+        self.reply(method, endpoint, 202, received=received, headers={"Location": self.queue_url(job)})
+
+    def handle_spaces(self, method, endpoint, query):
+        start = int(query.get("start", ["0"])[0])
+        limit = int(query.get("limit", ["25"])[0])
+        space_type = query.get("type", [None])[0]
+        with self.server.lock:
+            spaces = [space for space in self.server.spaces.values()
+                      if space_type is None or space["type"] == space_type]
+        results = spaces[start:start + limit]
+        content = {"results": results, "start": start, "limit": limit, "size": len(results), "_links": {}}
+        if start + limit < len(spaces):
+            content["_links"]["next"] = "/rest/api/space?start={}&limit={}{}".format(
+                start + limit, limit, "&type=" + space_type if space_type else "")
+        self.reply(method, endpoint, 200, content)
+
+    def handle_content_search(self, method, endpoint, query):
+        # only supports space="KEY" order by lastmodified desc
+        match = re.search(r'space\s*=\s*"?([^"\s]+)"?', query.get("cql", [""])[0])
+        key = match.group(1) if match else None
+        with self.server.lock:
+            content = dict(self.server.content[key]) if key in self.server.content else None
+        if content is None:
+            return self.reply(method, endpoint, 200, {"results": [], "start": 0, "limit": 1, "size": 0,
+                                                      "totalSize": 0})
+        result = {"id": "11", "type": "page", "title": "Page 0", "version": {"when": content["last_modified"]}}
+        self.reply(method, endpoint, 200, {"results": [result], "start": 0, "limit": 1, "size": 1,
+                                           "totalSize": content["count"]})
+
+    # helpers
+
+    def queue_url(self, job):
+        return self.server.public_url + BACKUP_RESOURCE + "/queue/" + job.job_id
+
+    def download_url(self, key):
+        return self.server.public_url + BACKUP_RESOURCE + "/download/" + key
+
+    def read_body(self, target):
+        remaining = int(self.headers.get("Content-Length") or 0)
+        received = 0
+        while remaining > 0:
+            chunk = self.rfile.read(min(BUFFER_SIZE, remaining))
+            if not chunk:
+                break
+            target.write(chunk)
+            received += len(chunk)
+            remaining -= len(chunk)
+            self.throttle(len(chunk))
+        return received
+
+    def discard_body(self):
+        return self.read_body(io.BytesIO()) if self.headers.get("Content-Length") else 0
+
+    def throttle(self, size):
+        if self.server.bandwidth:
+            time.sleep(size / float(self.server.bandwidth))
+
+    def reply(self, method, endpoint, status, content=None, body=b"", headers=None, content_type=None,
+              content_length=None, received=0):
+        if content is not None:
+            body = json.dumps(content).encode("utf-8")
+            content_type = "application/json"
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if content_type is not None:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(content_length if content_length is not None else len(body)))
+        self.end_headers()
+
+        sent = 0
+        if method != "HEAD":
+            view = memoryview(body)
+            try:
+                while sent < len(view):
+                    chunk = view[sent:sent + BUFFER_SIZE]
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+                    self.throttle(len(chunk))
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+        self.server.count(method, endpoint, received=received, sent=sent)
+
+
+def build_archive(key, size, pages=3, blog_posts=1):
+    # a small but complete space export, padded with random attachments
+    entities = ['<?xml version="1.0" encoding="UTF-8"?>',
+                '<hibernate-generic datetime="2020-01-01 00:00:00">',
+                '<object class="Space" package="com.atlassian.confluence.spaces">',
+                '<id name="id">1</id>',
+                '<property name="key"><![CDATA[{}]]></property>'.format(key),
+                '<property name="name"><![CDATA[{}]]></property>'.format(key),
+                '</object>']
+    content_id = 10
+    for content_class, count in (("Page", pages), ("BlogPost", blog_posts)):
+        for index in range(count):
+            content_id += 1
+            entities += ['<object class="{}" package="com.atlassian.confluence.pages">'.format(content_class),
+                         '<id name="id">{}</id>'.format(content_id),
+                         '<property name="title"><![CDATA[{} {}]]></property>'.format(content_class, index),
+                         '<property name="contentStatus"><![CDATA[current]]></property>',
+                         '</object>']
+
+    attachments = []
+    remaining = max(0, size)
+    while remaining > 0:
+        attachment_size = min(remaining, 1024 * 1024)
+        content_id += 1
+        attachments.append((content_id, attachment_size))
+        entities += ['<object class="Attachment" package="com.atlassian.confluence.pages">',
+                     '<id name="id">{}</id>'.format(content_id),
+                     '<property name="title"><![CDATA[attachment-{}.bin]]></property>'.format(content_id),
+                     '<property name="fileSize">{}</property>'.format(attachment_size),
+                     '</object>']
+        remaining -= attachment_size
+    entities.append('</hibernate-generic>')
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("entities.xml", "\n".join(entities))
+        archive.writestr("exportDescriptor.properties",
+                         "exportType=space\nspaceKey={}\nbackupAttachments=true\n".format(key))
+        for attachment_id, attachment_size in attachments:
+            archive.writestr(zipfile.ZipInfo("attachments/{}/1".format(attachment_id)),
+                             os.urandom(attachment_size), compress_type=zipfile.ZIP_STORED)
+    return buffer.getvalue()
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="local stand-in for the ConfAPI backup resources")
+    parser.add_argument("--port", type=int, default=1990, help="port to listen on (default: %(default)s).")
+    parser.add_argument("--spaces", default="ds,KEYONE", help="comma separated space keys (default: %(default)s).")
+    parser.add_argument("--archive-size", type=int, default=1024 * 1024,
+                        help="attachment bytes per export archive (default: %(default)s).")
+    parser.add_argument("--job-duration", type=float, default=2.0,
+                        help="seconds of server-side processing per job (default: %(default)s).")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request.")
+    parser.add_argument("--bandwidth", type=int, help="bytes per second and connection.")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="probability of a 503 for a status request.")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="probability of a dropped download.")
+    return parser.parse_args(args[1:])
+
+
+def main(argv):
+    args = parse_args(argv)
+    server = MockConfapiServer(port=args.port, spaces=args.spaces.split(","), archive_size=args.archive_size,
+                               job_duration=args.job_duration, latency=args.latency, bandwidth=args.bandwidth,
+                               fail_rate=args.fail_rate, drop_rate=args.drop_rate)
+    print("Serving mock ConfAPI on " + server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main(argv=sys.argv)
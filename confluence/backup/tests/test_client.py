@@ -0,0 +1,139 @@
+import unittest
+import asyncio
+import importlib
+import subprocess
+import sys
+import os
+import shutil
+import tempfile
+
+
+class ConfluenceTestClient(unittest.TestCase):
+    # runs the asyncio client against the local mock ConfAPI server
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.client")
+        importlib.import_module("confluence.backup.tests.mock_server")
+
+    def setUp(self):
+        self.client_module = sys.modules["confluence.backup.confapi.client"]
+        self.mock_server = sys.modules["confluence.backup.tests.mock_server"]
+        self.server = self.mock_server.MockConfapiServer(spaces=["ds", "KEYONE"], job_duration=0.2, seed=1)
+        self.base_url = self.server.start()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        self.server.stop()
+
+    def client(self, auth=("admin", "admin"), **kwargs):
+        polling = sys.modules["confluence.backup.confapi.polling"]
+        return self.client_module.BackupClient(self.base_url, auth=auth,
+                                               polling_strategy=lambda: polling.FixedPolling(0.05, 0.2), **kwargs)
+
+    def write_archive(self, key):
+        path = os.path.join(self.directory, "Confluence-space-export-" + key + ".xml.zip")
+        with open(path, "wb") as fd:
+            fd.write(self.mock_server.build_archive(key, 1024))
+        return path
+
+    def test_export_spaces(self):
+        keys = ["S" + str(index) for index in range(20)]
+        for key in keys:
+            self.server.add_space(key)
+        progress = []
+
+        async def run():
+            async with self.client(max_jobs=8) as client:
+                return await asyncio.gather(*[client.export_space(key, self.directory,
+                                                                  progress=lambda *args: progress.append(args))
+                                              for key in keys + ["INVALID"]])
+
+        results = asyncio.run(run())
+        self.assertEqual([str(result) for result in results], ["0: Success"] * 20 + ["404: not_found"])
+        self.assertEqual(results[-1].error_messages, ["Space with key INVALID not found"])
+        for key, result in zip(keys, results):
+            with open(result.path, "rb") as fd:
+                self.assertEqual(fd.read(), self.server.archive(key))
+            self.assertEqual(result.bytes, len(self.server.archive(key)))
+            self.assertEqual(len(result.sha256), 64)
+        self.assertTrue(progress)
+        self.assertLessEqual(self.server.stats()["max_running_jobs"]["export"], 8)
+
+    def test_export_steps(self):
+        async def run():
+            async with self.client() as client:
+                submitted = await client.submit_export("ds")
+                ready = await client.poll("ds", submitted.queue_url)
+                downloaded = await client.download("ds", ready.location, os.path.join(self.directory, "ds.zip"))
+                return submitted, ready, downloaded
+
+        submitted, ready, downloaded = asyncio.run(run())
+        self.assertEqual(submitted.state, "queued")
+        self.assertEqual(ready.state, "ready")
+        self.assertEqual((downloaded.state, downloaded.path), ("done", os.path.join(self.directory, "ds.zip")))
+        self.assertEqual(downloaded.to_dict()["bytes"], len(self.server.archive("ds")))
+
+    def test_import_archives(self):
+        paths = [self.write_archive(key) for key in ["N1", "N2", "N3", "ds"]]
+        transfers = []
+
+        async def run():
+            async with self.client() as client:
+                return await asyncio.gather(*[client.import_archive(path,
+                                                                    transfer_progress=lambda *a: transfers.append(a))
+                                              for path in paths])
+
+        results = asyncio.run(run())
+        self.assertEqual([str(result) for result in results], ["0: Success"] * 3 + ["400: bad_request"])
+        self.assertEqual([result.state for result in results], ["done"] * 3 + ["failed"])
+        self.assertTrue(all(key in self.server.spaces for key in ["N1", "N2", "N3"]))
+        self.assertEqual(results[0].bytes, os.path.getsize(paths[0]))
+        self.assertTrue(transfers)
+
+    def test_overloaded_server(self):
+        self.server.capacity = 1
+        self.server.retry_after = 0.05
+
+        async def run():
+            async with self.client(overload_retries=50) as client:
+                return await asyncio.gather(client.export_space("ds", self.directory),
+                                            client.export_space("KEYONE", self.directory))
+
+        self.assertEqual([str(result) for result in asyncio.run(run())], ["0: Success", "0: Success"])
+        self.assertEqual(self.server.stats()["max_running_jobs"]["export"], 1)
+
+    def test_invalid_credentials(self):
+        async def run():
+            async with self.client(auth=("admin2", "admin2")) as client:
+                return await client.check(), await client.export_space("ds", self.directory)
+
+        check, result = asyncio.run(run())
+        self.assertEqual(str(check), "401: unauthorized")
+        self.assertEqual(str(result), "401: unauthorized")
+        self.assertFalse(result.ok)
+
+    def test_unreachable_server(self):
+        async def run():
+            client = self.client_module.BackupClient("http://localhost:1/confluence")
+            async with client:
+                return await client.submit_export("ds")
+
+        self.assertEqual(str(asyncio.run(run())), "444: url not reachable")
+
+    def test_lazy_imports(self):
+        # importing the client must not import requests, which takes most of the startup time
+        code = "import sys; import confluence.backup.confapi.client; print('requests' in sys.modules)"
+        parent_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../../')
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=parent_dir)
+        self.assertEqual(output.strip(), b"False")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import importlib
+import io
+import sys
+import os
+import shutil
+import tempfile
+import zipfile
+
+
+class ConfluenceTestDiscovery(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.discovery")
+
+    def setUp(self):
+        self.discovery = sys.modules["confluence.backup.confapi.discovery"]
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        for file_name in ["a.xml.zip", "b.xml.zip", "notes.txt", "2020/c.xml.zip", "2020/01/d.xml.zip",
+                          "2021/e.xml.zip"]:
+            self.write(file_name, b"x" * 10)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def write(self, file_name, data):
+        if os.path.dirname(file_name):
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, "wb") as fd:
+            fd.write(data)
+
+    def discover(self, *patterns):
+        return self.discovery.discover_files(list(patterns))
+
+    def test_split_pattern(self):
+        self.assertEqual(self.discovery.split_pattern("*.zip"), (".", ["*.zip"]))
+        self.assertEqual(self.discovery.split_pattern("exports/2020/**/*.zip"), ("exports/2020", ["**", "*.zip"]))
+        self.assertEqual(self.discovery.split_pattern("./a/b.zip"), ("a", ["b.zip"]))
+        self.assertEqual(self.discovery.split_pattern("/backup/*/x.zip"), ("/backup", ["*", "x.zip"]))
+        self.assertEqual(self.discovery.split_pattern("/x.zip"), ("/", ["x.zip"]))
+
+    def test_wildcards(self):
+        self.assertEqual(self.discover("*.zip"), ["./a.xml.zip", "./b.xml.zip"])
+        self.assertEqual(self.discover("2020/*.zip", "*/c.*"), ["2020/c.xml.zip"])
+        self.assertEqual(self.discover("20*/*.zip"), ["./2020/c.xml.zip", "./2021/e.xml.zip"])
+        self.assertEqual(self.discover("INVALID.*", "missing/*.zip"), [])
+
+    def test_recursive_wildcard(self):
+        self.assertEqual(self.discover("**/*.zip"), ["./2020/01/d.xml.zip", "./2020/c.xml.zip", "./2021/e.xml.zip",
+                                                     "./a.xml.zip", "./b.xml.zip"])
+        self.assertEqual(self.discover("2020/**/*.zip"), ["2020/01/d.xml.zip", "2020/c.xml.zip"])
+        self.assertEqual(self.discover("**/01/*"), ["./2020/01/d.xml.zip"])
+
+    def test_duplicates(self):
+        os.symlink(os.path.join(self.directory, "a.xml.zip"), "link.xml.zip")
+        self.assertEqual(self.discover("a.xml.zip", "*.zip", "./a.xml.zip", os.path.join(self.directory, "*.zip")),
+                         ["./a.xml.zip", "./b.xml.zip"])
+
+    def test_scans_every_directory_once(self):
+        scanned = []
+        scandir = os.scandir
+        os.scandir = lambda path: scanned.append(path) or scandir(path)
+        try:
+            self.discover("a.*", "b.*", "*.txt", "2021/*", "2021/e.*")
+        finally:
+            os.scandir = scandir
+        self.assertEqual(scanned, [".", "./2021"])
+
+    def scanned(self, *patterns):
+        scanned = []
+        scandir = os.scandir
+        os.scandir = lambda path: scanned.append(path) or scandir(path)
+        try:
+            return self.discover(*patterns), scanned
+        finally:
+            os.scandir = scandir
+
+    def test_scans_overlapping_directories_once(self):
+        self.assertEqual(self.scanned("2020/01/*.zip", "2020/**/*.zip"),
+                         (["2020/01/d.xml.zip", "2020/c.xml.zip"], ["2020", "2020/01"]))
+        # files are named after the first pattern that matches them
+        self.assertEqual(self.scanned("2020/01/*", "**/e.*"),
+                         (["2020/01/d.xml.zip", "./2021/e.xml.zip"], [".", "./2020", "./2020/01", "./2021"]))
+        self.assertEqual(self.scanned("*.txt", "2021/*")[1], [".", "./2021"])
+
+    def test_order_files(self):
+        self.write("large.xml.zip", b"x" * 1000)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("entities.xml", "x" * 100000)
+        self.write("compressed.xml.zip", buffer.getvalue())
+        file_names = ["./a.xml.zip", "./compressed.xml.zip", "./large.xml.zip", "./b.xml.zip"]
+
+        self.assertEqual(self.discovery.order_files(file_names, "size"),
+                         ["./large.xml.zip", "./compressed.xml.zip", "./a.xml.zip", "./b.xml.zip"])
+        self.assertEqual(self.discovery.order_files(file_names, "inventory"),
+                         ["./compressed.xml.zip", "./large.xml.zip", "./a.xml.zip", "./b.xml.zip"])
+        self.assertEqual(self.discovery.order_files(file_names, "name"), file_names)
+
+
+if __name__ == '__main__':
+    unittest.main()
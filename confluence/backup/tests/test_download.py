@@ -0,0 +1,238 @@
+import unittest
+import importlib
+import sys
+import os
+import re
+import json
+import hashlib
+import tempfile
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    # serves the class attribute data, supports Range / If-Range and drops
+    # the connection after drop_after bytes for the first drop_count requests
+    protocol_version = "HTTP/1.1"
+    data = b""
+    etag = '"v1"'
+    accept_ranges = True
+    drop_after = None
+    drop_count = 0
+    range_requests = []
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        handler = type(self)
+        self.send_response(200)
+        self.send_header("ETag", handler.etag)
+        if handler.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(handler.data)))
+        self.end_headers()
+
+    def do_GET(self):
+        handler = type(self)
+        first = 0
+        last = len(handler.data) - 1
+        status = 200
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if match and handler.accept_ranges and self.headers.get("If-Range", handler.etag) == handler.etag:
+            first = int(match.group(1))
+            if match.group(2):
+                last = min(last, int(match.group(2)))
+            with handler.lock:
+                handler.range_requests.append(first)
+            if first >= len(handler.data):
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(len(handler.data)))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        body = handler.data[first:last + 1]
+        self.send_response(status)
+        self.send_header("ETag", handler.etag)
+        if handler.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 206:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(first, last, len(handler.data)))
+        self.end_headers()
+
+        with handler.lock:
+            drop = handler.drop_count and handler.drop_after is not None
+            if drop:
+                handler.drop_count -= 1
+        if drop:
+            self.wfile.write(body[:handler.drop_after])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class ConfluenceTestDownload(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.download")
+        importlib.import_module("confluence.backup.confapi.integrity")
+        importlib.import_module("confluence.backup.confapi.metrics")
+        importlib.import_module("confluence.backup.confapi.session")
+
+    def setUp(self):
+        RangeHandler.data = os.urandom(1024 * 1024 + 3)
+        RangeHandler.etag = '"v1"'
+        RangeHandler.accept_ranges = True
+        RangeHandler.drop_after = None
+        RangeHandler.drop_count = 0
+        RangeHandler.range_requests = []
+        self.server = ThreadingHTTPServer(("localhost", 0), RangeHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://localhost:{}/download".format(self.server.server_port)
+        self.session = sys.modules["confluence.backup.confapi.session"].ConfapiSession()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "Confluence-space-export-KEY.xml.zip")
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def download(self):
+        return sys.modules["confluence.backup.confapi.download"]
+
+    def read(self, path):
+        with open(path, "rb") as fd:
+            return fd.read()
+
+    def test_download(self):
+        progress = []
+        self.download().download(self.session, self.url, self.path,
+                                 callback=lambda size, total: progress.append((size, total)))
+        self.assertEqual(self.read(self.path), RangeHandler.data)
+        self.assertEqual(progress[-1], (len(RangeHandler.data), len(RangeHandler.data)))
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(self.path)])
+
+    def test_download_reuses_connection(self):
+        self.download().download(self.session, self.url, self.path)
+        self.download().download(self.session, self.url, self.path, chunk_size=1000)
+        self.assertEqual(self.read(self.path), RangeHandler.data)
+        self.assertEqual(self.session.connection_stats(), (1, 2))
+
+    def test_read_chunks_reuses_buffer(self):
+        with self.session.get(self.url, stream=True) as response:
+            chunks = [bytes(chunk) for chunk in self.download().read_chunks(response, 256 * 1024)]
+            views = list(self.download().read_chunks(response, 256 * 1024))
+        self.assertEqual(b"".join(chunks), RangeHandler.data)
+        self.assertEqual(max(len(chunk) for chunk in chunks), 256 * 1024)
+        self.assertEqual(views, [])
+
+    def test_download_resumes_after_dropped_connection(self):
+        RangeHandler.drop_after = 300 * 1024
+        RangeHandler.drop_count = 2
+        self.download().download(self.session, self.url, self.path, retry_delay=0)
+        self.assertEqual(self.read(self.path), RangeHandler.data)
+        self.assertEqual(RangeHandler.range_requests, [300 * 1024, 600 * 1024])
+
+    def test_download_checksum(self):
+        RangeHandler.drop_after = 300 * 1024
+        RangeHandler.drop_count = 2
+        checksum = sys.modules["confluence.backup.confapi.integrity"].StreamChecksum()
+        self.download().download(self.session, self.url, self.path, retry_delay=0, checksum=checksum)
+        self.assertEqual(checksum.hexdigest(), hashlib.sha256(RangeHandler.data).hexdigest())
+
+    def test_download_gives_up_after_retries(self):
+        RangeHandler.drop_after = 1024
+        RangeHandler.drop_count = 10
+        with self.assertRaises(self.download().IncompleteDownloadError):
+            self.download().download(self.session, self.url, self.path, retries=2, retry_delay=0)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(os.path.getsize(self.path + ".part"), 3 * 1024)
+
+    def test_download_resumes_part_file_of_previous_run(self):
+        with open(self.path + ".part", "wb") as fd:
+            fd.write(RangeHandler.data[:1000])
+        with open(self.path + ".part.json", "w") as fd:
+            json.dump({"url": "http://elsewhere/", "etag": '"v1"', "length": len(RangeHandler.data)}, fd)
+
+        checksum = sys.modules["confluence.backup.confapi.integrity"].StreamChecksum()
+        self.download().download(self.session, self.url, self.path, checksum=checksum)
+        self.assertEqual(self.read(self.path), RangeHandler.data)
+        self.assertEqual(RangeHandler.range_requests, [1000])
+        self.assertEqual(checksum.hexdigest(), hashlib.sha256(RangeHandler.data).hexdigest())
+        self.assertFalse(os.path.exists(self.path + ".part.json"))
+
+    def test_download_restarts_if_archive_changed(self):
+        with open(self.path + ".part", "wb") as fd:
+            fd.write(b"x" * 1000)
+        with open(self.path + ".part.json", "w") as fd:
+            json.dump({"url": self.url, "etag": '"v0"', "length": len(RangeHandler.data)}, fd)
+
+        self.download().download(self.session, self.url, self.path)
+        self.assertEqual(self.read(self.path), RangeHandler.data)
+        self.assertEqual(RangeHandler.range_requests, [])
+
+    def test_download_of_complete_part_file(self):
+        with open(self.path + ".part", "wb") as fd:
+            fd.write(RangeHandler.data)
+        with open(self.path + ".part.json", "w") as fd:
+            json.dump({"url": self.url, "etag": '"v1"', "length": len(RangeHandler.data)}, fd)
+
+        self.download().download(self.session, self.url, self.path)
+        self.assertEqual(self.read(self.path), RangeHandler.data)
+
+    def test_download_segmented(self):
+        RangeHandler.data = os.urandom(4 * self.download().MIN_SEGMENT_SIZE + 5)
+        progress = []
+        checksum = sys.modules["confluence.backup.confapi.integrity"].StreamChecksum()
+        self.download().download_segmented(self.session, self.url, self.path, 4, chunk_size=64 * 1024,
+                                           callback=lambda size, total: progress.append((size, total)),
+                                           checksum=checksum)
+        self.assertEqual(self.read(self.path), RangeHandler.data)
+        self.assertEqual(checksum.hexdigest(), hashlib.sha256(RangeHandler.data).hexdigest())
+        self.assertEqual(len(RangeHandler.range_requests), 4)
+        self.assertEqual(progress[-1], (len(RangeHandler.data), len(RangeHandler.data)))
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(self.path)])
+
+    def test_download_segmented_counts_requests_for_the_job(self):
+        RangeHandler.data = os.urandom(2 * self.download().MIN_SEGMENT_SIZE)
+        metrics = sys.modules["confluence.backup.confapi.metrics"]
+        run = metrics.RunMetrics("export")
+        session = sys.modules["confluence.backup.confapi.session"].ConfapiSession(metrics=run)
+        self.addCleanup(session.close)
+        with metrics.bind("KEY"):
+            self.download().download_segmented(session, self.url, self.path, 2)
+        # the HEAD request and one request per segment
+        self.assertEqual((run.jobs["KEY"].requests, run.unassigned.requests), (3, 0))
+
+    def test_download_segmented_retries_segments(self):
+        RangeHandler.data = os.urandom(2 * self.download().MIN_SEGMENT_SIZE)
+        RangeHandler.drop_after = 1024 * 1024
+        RangeHandler.drop_count = 2
+        self.download().download_segmented(self.session, self.url, self.path, 2, retry_delay=0)
+        self.assertEqual(self.read(self.path), RangeHandler.data)
+        self.assertEqual(len(RangeHandler.range_requests), 4)
+
+    def test_download_segmented_falls_back_to_single_stream(self):
+        RangeHandler.data = os.urandom(2 * self.download().MIN_SEGMENT_SIZE)
+        RangeHandler.accept_ranges = False
+        self.download().download_segmented(self.session, self.url, self.path, 4)
+        self.assertEqual(self.read(self.path), RangeHandler.data)
+        self.assertEqual(RangeHandler.range_requests, [])
+
+    def test_download_segmented_small_archive(self):
+        self.download().download_segmented(self.session, self.url, self.path, 4)
+        self.assertEqual(self.read(self.path), RangeHandler.data)
+        self.assertEqual(RangeHandler.range_requests, [])
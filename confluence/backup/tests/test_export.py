@@ -130,3 +130,28 @@ class ConfluenceTestExport(unittest.TestCase):
                "--password", CONFLUENCE_USERS["normal_user"]["password"], "--batch"]
         results = sys.modules["confluence.backup.export"].main(lst)
         self.assertEqual(results, ['403: forbidden'])
+
+    def test_export_parallel_multiple_keys(self):
+        confluence_keys = ",".join(CONFLUENCE_KEYS)
+        lst = ["file", CONFLUENCE_BASEURL, confluence_keys, "--username", CONFLUENCE_USERS["admin_user"]["username"],
+               "--password", CONFLUENCE_USERS["admin_user"]["password"], "--batch", "--parallel", "2"]
+        results = sys.modules["confluence.backup.export"].main(lst)
+        self.assertEqual(results, ['0: Success', '0: Success'])
+
+    def test_export_parallel_duplicate_keys(self):
+        confluence_keys = CONFLUENCE_KEYS[0] + "," + CONFLUENCE_KEYS[0]
+        lst = ["file", CONFLUENCE_BASEURL, confluence_keys, "--username", CONFLUENCE_USERS["admin_user"]["username"],
+               "--password", CONFLUENCE_USERS["admin_user"]["password"], "--batch", "--parallel", "2"]
+        results = sys.modules["confluence.backup.export"].main(lst)
+        self.assertEqual(results, ['0: Success'])
+
+    def test_export_parallel_one_invalid_key_from_multiple(self):
+        invalid_key = "INVALID"
+        valid_key = "KEYONE"
+        confluence_keys = invalid_key + "," + valid_key
+        lst = ["file", CONFLUENCE_BASEURL, confluence_keys, "--username",
+               CONFLUENCE_USERS["admin_user"]["username"],
+               "--password", CONFLUENCE_USERS["admin_user"]["password"], "--batch", "--parallel", "2",
+               "--max-jobs", "1", "--max-downloads", "1"]
+        results = sys.modules["confluence.backup.export"].main(lst)
+        self.assertEqual(results, ['404: not_found', '0: Success'])
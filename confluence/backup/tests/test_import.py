@@ -127,8 +127,8 @@ class ConfluenceTestImport(unittest.TestCase):
                "--username", CONFLUENCE_USERS["admin_user"]["username"],
                "--password", CONFLUENCE_USERS["admin_user"]["password"], "--batch"]
         results = sys.modules["confluence.backup.import"].main(lst)
-        self.assertIn("0: Success", results)
-        self.assertIn("400: bad_request", results)
+        # the same file given twice is only imported once
+        self.assertEqual(results, ["0: Success"])
 
     def test_import_more_files(self):
         lst = ["file", CONFLUENCE_BASEURL, CONFLUENCE_FILES["KEYONE"], CONFLUENCE_FILES["ds"], "--username",
@@ -0,0 +1,162 @@
+import unittest
+import importlib
+import hashlib
+import io
+import sys
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+import zlib
+
+
+def build_zip(comment=b""):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("entities.xml", "<hibernate-generic/>")
+        archive.writestr("exportDescriptor.properties", "spaceKey=ds\n")
+        archive.writestr("attachments/1/1", os.urandom(10000))
+        archive.comment = comment
+    return buffer.getvalue()
+
+
+def to_zip64(data):
+    # replaces the end of central directory with zip64 records, as written
+    # for archives with more than 65535 entries or 4 GiB
+    eocd = data.rfind(b"PK\x05\x06")
+    _, _, _, _, entries, size, offset, _ = struct.unpack("<4s4H2LH", data[eocd:eocd + 22])
+    record = struct.pack("<4sQ2H2L4Q", b"PK\x06\x06", 44, 45, 45, 0, 0, entries, entries, size, offset)
+    locator = struct.pack("<4sLQL", b"PK\x06\x07", 0, eocd, 1)
+    end = struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF, 0)
+    return data[:eocd] + record + locator + end
+
+
+class ConfluenceTestIntegrity(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.integrity")
+        importlib.import_module("confluence.backup.confapi.ziputil")
+
+    def setUp(self):
+        self.integrity = sys.modules["confluence.backup.confapi.integrity"]
+        self.ziputil = sys.modules["confluence.backup.confapi.ziputil"]
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "Confluence-space-export-ds.xml.zip")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        with open(self.path, "wb") as fd:
+            fd.write(data)
+
+    def central_directory(self, data):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            start = archive.start_dir
+        return data[start:data.rfind(b"PK\x05\x06")]
+
+    def test_end_of_central_directory(self):
+        data = build_zip()
+        entries, offset, size = self.ziputil.end_of_central_directory(data)
+        self.assertEqual(entries, 3)
+        self.assertEqual(data[offset:offset + size], self.central_directory(data))
+
+    def test_end_of_central_directory_with_comment(self):
+        data = build_zip(comment=b"PK\x05\x06 looks like a signature")
+        self.assertEqual(self.ziputil.end_of_central_directory(data)[0], 3)
+
+    def test_end_of_central_directory_zip64(self):
+        data = build_zip()
+        entries, offset, size = self.ziputil.end_of_central_directory(to_zip64(data))
+        self.assertEqual(entries, 3)
+        self.assertEqual(data[offset:offset + size], self.central_directory(data))
+
+    def test_truncated_archive(self):
+        data = build_zip()
+        for truncated in (data[:-10], data[:len(data) // 2], b"not a zip file"):
+            with self.assertRaises(self.ziputil.InvalidArchiveError):
+                self.ziputil.end_of_central_directory(truncated)
+
+    def test_central_directory_crc32(self):
+        data = build_zip()
+        self.write(data)
+        self.assertEqual(self.ziputil.central_directory_crc32(self.path), zlib.crc32(self.central_directory(data)))
+
+    def test_empty_file(self):
+        self.write(b"")
+        with self.assertRaises(self.ziputil.InvalidArchiveError):
+            self.ziputil.central_directory_crc32(self.path)
+
+    def test_central_directory_entries(self):
+        data = build_zip()
+        _, offset, size = self.ziputil.end_of_central_directory(data)
+        entries = list(self.ziputil.central_directory_entries(data, offset, size))
+        self.assertEqual([entry[0] for entry in entries],
+                         ["entities.xml", "exportDescriptor.properties", "attachments/1/1"])
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertEqual([(info.compress_size, info.file_size, info.header_offset) for info in archive.infolist()],
+                             [entry[1:] for entry in entries])
+
+    def test_check_export_archive(self):
+        data = build_zip()
+        self.write(data)
+        self.assertIsNone(self.ziputil.check_export_archive(self.path))
+        self.write(to_zip64(data))
+        self.assertIsNone(self.ziputil.check_export_archive(self.path))
+
+    def test_check_export_archive_rejects(self):
+        data = build_zip()
+        _, offset, _ = self.ziputil.end_of_central_directory(data)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("entities.xml", "<hibernate-generic/>")
+        cases = [
+            (b"", "empty file"),
+            (b"no zip file", "end of central directory not found"),
+            (data[:-30], "end of central directory not found"),
+            (data[offset:], "central directory lies outside"),
+            (buffer.getvalue(), "exportDescriptor.properties missing"),
+        ]
+        for content, problem in cases:
+            self.write(content)
+            self.assertIn(problem, self.ziputil.check_export_archive(self.path))
+        self.assertIn("cannot read archive", self.ziputil.check_export_archive(self.directory))
+
+    def test_stream_checksum_reads_back_part_file(self):
+        data = os.urandom(100000)
+        self.write(data)
+        checksum = self.integrity.StreamChecksum()
+        checksum.update(b"stale")
+        checksum.seek(self.path, 60000)
+        checksum.update(data[60000:])
+        self.assertEqual(checksum.hexdigest(), hashlib.sha256(data).hexdigest())
+        checksum.seek(self.path, 0)
+        self.assertEqual(checksum.hexdigest(), hashlib.sha256().hexdigest())
+
+    def test_verify_archive(self):
+        data = build_zip()
+        self.write(data)
+        self.assertEqual(self.integrity.verify_archive(self.path), "manifest missing")
+        self.integrity.write_sidecar(self.path, size=len(data), sha256=hashlib.sha256(data).hexdigest(),
+                                     central_directory_crc32=self.ziputil.central_directory_crc32(self.path))
+        self.assertIsNone(self.integrity.verify_archive(self.path))
+
+        self.write(data[:100] + b"x" + data[101:])
+        self.assertEqual(self.integrity.verify_archive(self.path), "checksum mismatch")
+        self.write(data[:-1] + b"x")
+        self.assertEqual(self.integrity.verify_archive(self.path), "central directory damaged")
+        self.write(data[:-1])
+        self.assertEqual(self.integrity.verify_archive(self.path), "size mismatch")
+        os.remove(self.path)
+        self.assertEqual(self.integrity.verify_archive(self.path), "archive missing")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import importlib
+import io
+import json
+import sys
+import os
+import shutil
+import tempfile
+import tracemalloc
+import zipfile
+
+PAGE = ('<object class="{cls}" package="com.atlassian.confluence.pages">'
+        '<id name="id">{id}</id>'
+        '<property name="title"><![CDATA[Page {id}]]></property>'
+        '{extra}'
+        '<collection name="bodyContents" class="java.util.Collection">'
+        '<element class="BodyContent" package="com.atlassian.confluence.core"><id name="id">{id}</id></element>'
+        '</collection>'
+        '</object>\n')
+
+
+def entities(objects):
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<hibernate-generic datetime="2020-01-01 00:00:00">\n'
+            '<object class="Space" package="com.atlassian.confluence.spaces"><id name="id">1</id>'
+            '<property name="key"><![CDATA[ds]]></property></object>\n'
+            + "".join(objects) + '</hibernate-generic>\n')
+
+
+def page(cls, content_id, extra=""):
+    return PAGE.format(cls=cls, id=content_id, extra=extra)
+
+
+class ConfluenceTestInventory(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.inventory")
+        importlib.import_module("confluence.backup.archive")
+
+    def setUp(self):
+        self.inventory = sys.modules["confluence.backup.confapi.inventory"]
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "Confluence-space-export-ds.xml.zip")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, entities_xml, descriptor="spaceKey=ds\n", attachments=()):
+        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("entities.xml", entities_xml)
+            if descriptor is not None:
+                archive.writestr("exportDescriptor.properties", descriptor)
+            for name, data in attachments:
+                archive.writestr(name, data)
+
+    def test_inventory(self):
+        historical = '<property name="originalVersion" class="Page"><id name="id">11</id></property>'
+        self.write(entities([
+            page("Page", 11),
+            page("Page", 12, historical),
+            page("Page", 13, '<property name="contentStatus"><![CDATA[deleted]]></property>'),
+            page("Page", 14, '<property name="contentStatus"><![CDATA[current]]></property>'),
+            page("BlogPost", 15),
+            page("Attachment", 16),
+            page("Attachment", 17),
+        ]), attachments=[("attachments/16/1", b"x" * 1000), ("attachments/17/1", b"y" * 234),
+                         ("attachments/17/2", b"z" * 10)])
+
+        inventory = self.inventory.space_inventory(self.path)
+        self.assertEqual(inventory["space_key"], "ds")
+        self.assertEqual((inventory["pages"], inventory["blog_posts"], inventory["attachments"]), (2, 1, 2))
+        self.assertEqual((inventory["attachment_files"], inventory["attachment_bytes"]), (3, 1244))
+        self.assertEqual(inventory["size"], os.path.getsize(self.path))
+
+    def test_space_key_from_entities(self):
+        self.write(entities([]), descriptor=None)
+        self.assertEqual(self.inventory.space_inventory(self.path)["space_key"], "ds")
+
+    def test_bounded_memory(self):
+        # about 60 MB of entities.xml, parsed in a few MB
+        body = '<property name="bodyContent"><![CDATA[' + "lorem ipsum " * 200 + ']]></property>'
+        self.write(entities(page("Page", index, body) for index in range(20000)))
+
+        tracemalloc.start()
+        try:
+            inventory = self.inventory.space_inventory(self.path)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(inventory["pages"], 20000)
+        self.assertGreater(inventory["entities_bytes"], 50 * 1024 * 1024)
+        self.assertLess(peak, 16 * 1024 * 1024)
+
+    def test_damaged_archive(self):
+        self.write(entities([page("Page", 11)])[:-30])
+        with self.assertRaises(self.inventory.InventoryError):
+            self.inventory.space_inventory(self.path)
+
+        with open(self.path, "wb") as fd:
+            fd.write(b"no zip file")
+        with self.assertRaises(self.inventory.InventoryError):
+            self.inventory.space_inventory(self.path)
+
+    def test_archive_script(self):
+        archive = sys.modules["confluence.backup.archive"]
+        self.write(entities([page("Page", 11), page("BlogPost", 12)]))
+        broken = os.path.join(self.directory, "broken.xml.zip")
+        with open(broken, "wb") as fd:
+            fd.write(b"no zip file")
+
+        output = io.StringIO()
+        sys.stdout, stdout = output, sys.stdout
+        try:
+            results = archive.main(["file", "inventory", self.path, broken, "--json"])
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(results, ["0: Success", "1: invalid archive"])
+        inventory = json.loads(output.getvalue().splitlines()[0])
+        self.assertEqual((inventory["space_key"], inventory["pages"], inventory["blog_posts"]), ("ds", 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import importlib
+import sys
+import os
+import shutil
+import tempfile
+
+
+class ConfluenceTestJournal(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.journal")
+
+    def setUp(self):
+        self.journal = sys.modules["confluence.backup.confapi.journal"]
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "jobs.db")
+        self.now = 0.0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open(self):
+        journal = self.journal.JobJournal(self.path, progress_interval=1.0, clock=lambda: self.now)
+        self.addCleanup(journal.close)
+        return journal
+
+    def test_journal_path(self):
+        self.assertEqual(self.journal.journal_path("http://localhost:1990/confluence/", "export", "/tmp"),
+                         "/tmp/.confapi-export-localhost_1990_confluence.db")
+
+    def test_record(self):
+        journal = self.open()
+        self.assertIsNone(journal.get("ds"))
+        journal.record("ds", self.journal.QUEUED, queue_url="http://host/queue/1")
+        journal.record("ds", self.journal.READY, location="http://host/download/ds")
+        entry = journal.get("ds")
+        self.assertEqual((entry["state"], entry["queue_url"], entry["location"]),
+                         ("ready", "http://host/queue/1", "http://host/download/ds"))
+        with self.assertRaises(ValueError):
+            journal.record("ds", self.journal.DONE, size=1)
+
+    def test_survives_restart(self):
+        journal = self.open()
+        journal.record("ds", self.journal.DONE, bytes=10, sha256="abc")
+        journal.record("KEY", self.journal.QUEUED, queue_url="http://host/queue/2")
+        journal.close()
+
+        entries = self.open().entries()
+        self.assertEqual([(entry["item"], entry["state"]) for entry in entries], [("KEY", "queued"), ("ds", "done")])
+        self.assertEqual((entries[1]["bytes"], entries[1]["sha256"]), (10, "abc"))
+
+    def test_progress_is_throttled(self):
+        journal = self.open()
+        journal.record("ds", self.journal.READY)
+        journal.progress("ds", 100)
+        self.now = 0.5
+        journal.progress("ds", 200)
+        self.assertEqual(journal.get("ds")["bytes"], 100)
+        self.now = 1.5
+        journal.progress("ds", 300)
+        self.assertEqual(journal.get("ds")["bytes"], 300)
+
+    def test_forget(self):
+        journal = self.open()
+        journal.record("ds", self.journal.DONE)
+        journal.record("KEY", self.journal.DONE)
+        journal.forget(["ds", "missing"])
+        self.assertEqual([entry["item"] for entry in journal.entries()], ["KEY"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import importlib
+import datetime
+import sys
+import os
+from unittest import mock
+
+import requests
+
+
+class ConfluenceTestLimiter(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.limiter")
+
+    def setUp(self):
+        self.limiter = sys.modules["confluence.backup.confapi.limiter"]
+        self.now = 0.0
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def response(self, status_code, retry_after=None):
+        response = mock.Mock(status_code=status_code, elapsed=datetime.timedelta(seconds=0.1))
+        response.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+        return response
+
+    def test_is_overload(self):
+        self.assertTrue(self.limiter.is_overload(self.response(429)))
+        self.assertTrue(self.limiter.is_overload(self.response(503)))
+        self.assertFalse(self.limiter.is_overload(self.response(500)))
+        self.assertTrue(self.limiter.is_overload(error=requests.exceptions.ReadTimeout()))
+        self.assertFalse(self.limiter.is_overload(error=requests.exceptions.ConnectionError()))
+
+    def test_overload_delay(self):
+        self.assertEqual(self.limiter.overload_delay(self.response(429, "7"), 0), 7.0)
+        self.assertEqual(self.limiter.overload_delay(self.response(429, "3600"), 0), self.limiter.MAX_OVERLOAD_DELAY)
+        self.assertEqual(self.limiter.overload_delay(self.response(503), 0), 1.0)
+        self.assertEqual(self.limiter.overload_delay(self.response(503), 3), 8.0)
+
+    def test_create_limiters(self):
+        adaptive_limiter, token_bucket = self.limiter.create_limiters(max_jobs=8, max_rps=5)
+        self.assertEqual((adaptive_limiter.maximum, token_bucket.rate), (8, 5.0))
+        self.assertEqual(self.limiter.create_limiters(), (None, None))
+
+    def test_send_submission(self):
+        session = mock.Mock()
+        session.request.side_effect = [self.response(429, "2"), self.response(503), self.response(202)]
+        retries = []
+        response = self.limiter.send_submission(session, "GET", "http://localhost/export", 5,
+                                                lambda response, delay: retries.append((response.status_code, delay)),
+                                                sleep=self.sleep, timeout=3)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(retries, [(429, 2.0), (503, 2.0)])
+        self.assertEqual(self.sleeps, [2.0, 2.0])
+        session.request.assert_called_with("GET", "http://localhost/export", timeout=3)
+
+    def test_send_submission_gives_up(self):
+        session = mock.Mock()
+        session.request.return_value = self.response(429, "0")
+        response = self.limiter.send_submission(session, "POST", "http://localhost/import", 2, sleep=self.sleep)
+        self.assertEqual((response.status_code, session.request.call_count), (429, 3))
+
+    def test_token_bucket(self):
+        bucket = self.limiter.TokenBucket(2, burst=2, clock=lambda: self.now, sleep=self.sleep)
+        for _ in range(6):
+            bucket.acquire()
+        # the burst passes at once, then one request every half second
+        self.assertEqual(self.sleeps, [0.5, 0.5, 0.5, 0.5])
+        self.assertEqual(bucket.waits, 4)
+        self.now += 10
+        self.assertEqual(bucket.acquire(), 0.0)
+
+    def test_token_bucket_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            self.limiter.TokenBucket(0)
+
+    def test_additive_increase(self):
+        limiter = self.limiter.AdaptiveLimiter(4, clock=lambda: self.now)
+        limits = []
+        for _ in range(12):
+            limiter.success(0.1)
+            limits.append(limiter.current())
+        self.assertEqual(limits, [2, 2, 3, 3, 3, 4, 4, 4, 4, 4, 4, 4])
+        self.assertEqual(limiter.increases, 3)
+
+    def test_observe(self):
+        limiter = self.limiter.AdaptiveLimiter(4, clock=lambda: self.now)
+        for status_code in [404, 401, 500, 404, 500]:
+            limiter.observe("GET", self.response(status_code))
+        limiter.observe("GET", error=requests.exceptions.ConnectionError())
+        self.assertEqual((limiter.current(), limiter.successes, limiter.overloads), (1, 0, 0))
+        limiter.observe("POST", self.response(202))
+        limiter.observe("GET", self.response(302))
+        self.assertEqual(limiter.current(), 2)
+        limiter.observe("GET", self.response(429))
+        self.assertEqual((limiter.current(), limiter.overloads), (1, 1))
+
+    def test_multiplicative_decrease(self):
+        limiter = self.limiter.AdaptiveLimiter(16, initial=16, clock=lambda: self.now)
+        limiter.overload()
+        self.assertEqual(limiter.current(), 8)
+        # a burst of errors within the cooldown counts once
+        limiter.overload()
+        self.assertEqual(limiter.current(), 8)
+        self.now = 2.0
+        limiter.overload()
+        self.assertEqual(limiter.current(), 4)
+        self.assertEqual((limiter.overloads, limiter.decreases), (3, 2))
+        for _ in range(10):
+            self.now += 2.0
+            limiter.overload()
+        self.assertEqual(limiter.current(), 1)
+
+    def test_rising_latency(self):
+        limiter = self.limiter.AdaptiveLimiter(8, initial=8, clock=lambda: self.now)
+        for _ in range(10):
+            limiter.success(0.1)
+        self.assertEqual(limiter.current(), 8)
+        for _ in range(10):
+            limiter.success(1.0)
+        self.assertEqual(limiter.current(), 4)
+        self.assertIn("Concurrency: 4 jobs (highest 8, maximum 8)", limiter.summary())
+
+    def test_latency_noise(self):
+        limiter = self.limiter.AdaptiveLimiter(8, clock=lambda: self.now)
+        for latency in [0.001, 0.01, 0.002, 0.02] * 10:
+            limiter.success(latency)
+        self.assertEqual(limiter.decreases, 0)
+        self.assertEqual(limiter.current(), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
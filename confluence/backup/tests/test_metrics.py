@@ -0,0 +1,113 @@
+import unittest
+import importlib
+import json
+import sys
+import os
+import shutil
+import tempfile
+import threading
+
+
+class ConfluenceTestMetrics(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.metrics")
+
+    def setUp(self):
+        self.metrics = sys.modules["confluence.backup.confapi.metrics"]
+        self.directory = tempfile.mkdtemp()
+        self.event_log = os.path.join(self.directory, "events.jsonl")
+        self.now = 0.0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_metrics(self):
+        return self.metrics.RunMetrics("export", event_log=self.event_log, clock=lambda: self.now,
+                                       wall_clock=lambda: 1000.0 + self.now)
+
+    def events(self):
+        with open(self.event_log) as fd:
+            return [json.loads(line) for line in fd]
+
+    def test_phases(self):
+        run = self.run_metrics()
+        run.phase("ds", "submit")
+        self.now = 1.0
+        run.phase("ds", "queue")
+        self.now = 3.0
+        run.phase("ds", "processing")
+        run.phase("ds", "processing")
+        self.now = 6.0
+        run.phase("ds", "download")
+        run.add_bytes("ds", 4000)
+        self.now = 8.0
+        run.finish("ds", 0, "Success")
+        run.close()
+
+        job = run.jobs["ds"]
+        self.assertEqual(dict(job.phases), {"submit": 1.0, "queue": 2.0, "processing": 3.0, "download": 2.0})
+        self.assertEqual((job.seconds, job.bytes_per_second()), (8.0, 2000))
+
+        events = self.events()
+        self.assertEqual([event["event"] for event in events],
+                         ["run_started", "phase", "phase", "phase", "phase", "job_finished", "run_finished"])
+        self.assertEqual((events[5]["item"], events[5]["code"], events[5]["bytes"]), ("ds", 0, 4000))
+        self.assertEqual(events[6]["phases"], {"submit": 1.0, "queue": 2.0, "processing": 3.0, "download": 2.0})
+
+    def test_finish_once(self):
+        run = self.run_metrics()
+        run.phase("ds", "queue")
+        run.finish("ds", 444, "url not reachable")
+        run.finish("ds", 0, "Success")
+        run.close()
+        self.assertEqual((run.jobs["ds"].code, run.totals()["failed_jobs"]), (444, 1))
+        self.assertEqual([event["code"] for event in self.events() if event["event"] == "job_finished"], [444])
+
+    def test_bound(self):
+        run = self.run_metrics()
+        with self.metrics.bind("ds"):
+            count_request = self.metrics.bound(run.count_request)
+        thread = threading.Thread(target=count_request, args=(200,))
+        thread.start()
+        thread.join()
+        self.assertEqual((run.jobs["ds"].requests, run.unassigned.requests), (1, 0))
+
+    def test_requests(self):
+        run = self.run_metrics()
+        run.count_request(200)
+        with self.metrics.bind("ds"):
+            run.count_request(503)
+            run.count_request(None)
+            run.count_retry("ds")
+        self.assertEqual((run.unassigned.requests, run.jobs["ds"].requests), (1, 2))
+        self.assertEqual((run.jobs["ds"].throttled, run.jobs["ds"].failed_requests, run.jobs["ds"].retries),
+                         (1, 1, 1))
+        self.assertEqual(run.totals()["requests"], 3)
+
+    def test_prometheus(self):
+        run = self.run_metrics()
+        run.phase('a"b', "download")
+        run.add_bytes('a"b', 10)
+        self.now = 2.0
+        run.finish('a"b', 404, "not_found")
+        textfile = os.path.join(self.directory, "confapi.prom")
+        run.close(textfile)
+
+        with open(textfile) as fd:
+            lines = fd.read().splitlines()
+        self.assertIn("# TYPE confapi_job_phase_seconds gauge", lines)
+        self.assertIn('confapi_job_phase_seconds{script="export",item="a\\"b",phase="download"} 2.0', lines)
+        self.assertIn('confapi_job_success{script="export",item="a\\"b"} 0', lines)
+        self.assertIn('confapi_run_failed_jobs{script="export"} 1', lines)
+        self.assertFalse(os.path.exists(textfile + ".tmp"))
+
+
+if __name__ == '__main__':
+    unittest.main()
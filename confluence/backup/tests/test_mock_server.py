@@ -0,0 +1,532 @@
+import unittest
+import importlib
+import hashlib
+import json
+import sys
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import mock
+
+ADMIN = ["--username", "admin", "--password", "admin"]
+NORMAL_USER = ["--username", "user", "--password", "user"]
+INVALID_USER = ["--username", "admin2", "--password", "admin2"]
+FAST_POLLING = ["--poll-min", "0.05", "--poll-max", "0.2"]
+
+
+class ConfluenceTestMockServer(unittest.TestCase):
+    # runs export.py and import.py against the local mock ConfAPI server
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the space imports
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.export")
+        importlib.import_module("confluence.backup.import")
+        importlib.import_module("confluence.backup.archive")
+        importlib.import_module("confluence.backup.confapi.journal")
+        importlib.import_module("confluence.backup.tests.mock_server")
+
+    def setUp(self):
+        mock_server = sys.modules["confluence.backup.tests.mock_server"]
+        self.server = mock_server.MockConfapiServer(spaces=["ds", "KEYONE"], job_duration=0.2, seed=1)
+        self.base_url = self.server.start()
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+        self.server.stop()
+
+    def export(self, keys, *args, base_url=None, user=ADMIN):
+        lst = ["file", base_url or self.base_url, keys] + user + FAST_POLLING + ["--batch"] + list(args)
+        return sys.modules["confluence.backup.export"].main(lst)
+
+    def import_files(self, *args, base_url=None, user=ADMIN):
+        lst = ["file", base_url or self.base_url] + list(args) + user + FAST_POLLING + ["--batch"]
+        return sys.modules["confluence.backup.import"].main(lst)
+
+    def write_archive(self, key):
+        file_name = "Confluence-space-export-" + key + ".xml.zip"
+        with open(file_name, "wb") as fd:
+            fd.write(sys.modules["confluence.backup.tests.mock_server"].build_archive(key, 1024))
+        return file_name
+
+    def read(self, file_name):
+        with open(file_name, "rb") as fd:
+            return fd.read()
+
+    def test_export_basic(self):
+        self.assertEqual(self.export("ds"), ["0: Success"])
+        self.assertEqual(self.read("Confluence-space-export-ds.xml.zip"), self.server.archive("ds"))
+
+    def test_export_basic_multiple_keys(self):
+        self.assertEqual(self.export("KEYONE,ds"), ["0: Success", "0: Success"])
+
+    def test_export_instant(self):
+        self.server.instant = True
+        self.assertEqual(self.export("ds"), ["0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"].get("GET queue"), None)
+
+    def test_export_invalid_key(self):
+        self.assertEqual(self.export("INVALID"), ["404: not_found"])
+
+    def test_export_one_invalid_key_from_multiple(self):
+        self.assertEqual(self.export("INVALID,KEYONE"), ["404: not_found", "0: Success"])
+
+    def test_export_invalid_url(self):
+        self.assertEqual(self.export("ds", base_url="http://localhost:1/confluence"), ["444: url not reachable"])
+
+    def test_export_invalid_credentials(self):
+        self.assertEqual(self.export("ds", user=INVALID_USER), ["401: unauthorized"])
+
+    def test_export_invalid_permissions(self):
+        self.assertEqual(self.export("ds", user=NORMAL_USER), ["403: forbidden"])
+
+    def test_export_checks_credentials_once(self):
+        self.assertEqual(self.export("ds,KEYONE", "--parallel", "2"), ["0: Success", "0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET base"], 1)
+
+    def test_export_parallel(self):
+        for key in ["A", "B", "C"]:
+            self.server.add_space(key)
+        results = self.export("A,B,INVALID,C,ds", "--parallel", "3", "--max-downloads", "2")
+        self.assertEqual(results, ["0: Success", "0: Success", "404: not_found", "0: Success", "0: Success"])
+        for key in ["A", "B", "C", "ds"]:
+            self.assertEqual(self.read("Confluence-space-export-" + key + ".xml.zip"), self.server.archive(key))
+
+    def test_export_parallel_duplicate_keys(self):
+        self.assertEqual(self.export("ds,KEYONE,ds", "--parallel", "3"), ["0: Success", "0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET export"], 2)
+
+    def export_all(self, *args):
+        lst = ["file", self.base_url, "--all"] + ADMIN + FAST_POLLING + ["--batch"] + list(args)
+        return sys.modules["confluence.backup.export"].main(lst)
+
+    def test_export_all(self):
+        for index in range(30):
+            self.server.add_space("S{:02d}".format(index))
+        for user in ["alice", "bob"]:
+            self.server.add_space("~" + user, space_type="personal")
+        results = self.export_all("--parallel", "4", "--page-size", "7", "--exclude", "s1*", "--space-type", "global")
+        self.assertEqual(results, ["0: Success"] * 22)
+        exported = sorted(name for name in os.listdir(".") if name.endswith(".xml.zip"))
+        expected = ["ds", "KEYONE"] + ["S{:02d}".format(index) for index in list(range(10)) + list(range(20, 30))]
+        self.assertEqual(exported, sorted("Confluence-space-export-" + key + ".xml.zip" for key in expected))
+        # 32 global spaces in pages of 7
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET space"], 5)
+
+    def test_export_all_include(self):
+        self.server.add_space("~alice", space_type="personal")
+        self.assertEqual(self.export_all("--include", "k*", "--include", "~*"), ["0: Success", "0: Success"])
+        self.assertTrue(os.path.exists("Confluence-space-export-KEYONE.xml.zip"))
+        self.assertTrue(os.path.exists("Confluence-space-export-~alice.xml.zip"))
+        self.assertFalse(os.path.exists("Confluence-space-export-ds.xml.zip"))
+
+    def test_export_all_invalid_arguments(self):
+        with self.assertRaises(SystemExit):
+            sys.modules["confluence.backup.export"].main(["file", self.base_url] + ADMIN)
+        with self.assertRaises(SystemExit):
+            self.export_all("--verify")
+        with self.assertRaises(SystemExit):
+            self.export("ds", "--include", "D*")
+
+    def cluster_node(self):
+        # a second node that shares the spaces and the base URL of the cluster with the first one
+        mock_server = sys.modules["confluence.backup.tests.mock_server"]
+        node = mock_server.MockConfapiServer(spaces=list(self.server.spaces), job_duration=0.2, seed=2,
+                                             public_url=self.base_url)
+        node.start()
+        self.addCleanup(node.stop)
+        return node
+
+    def test_export_cluster_nodes(self):
+        for key in ["A", "B"]:
+            self.server.add_space(key)
+        node = self.cluster_node()
+        results = self.export("A,B,ds,KEYONE", "--parallel", "4", "--node", self.base_url, "--node", node.base_url)
+        self.assertEqual(results, ["0: Success"] * 4)
+        # the jobs are spread evenly and polled and downloaded where they were submitted
+        for server in [self.server, node]:
+            requests = server.stats()["requests_by_endpoint"]
+            self.assertEqual(requests["GET export"], 2)
+            self.assertEqual(requests["GET download"], 2)
+        for key in ["A", "B", "ds", "KEYONE"]:
+            self.assertIn(self.read("Confluence-space-export-" + key + ".xml.zip"),
+                          [self.server.archive(key), node.archive(key)])
+        # every node is free again at the end of the run
+        node_pool = sys.modules["confluence.backup.export"].node_pool
+        self.assertEqual([cluster_node.in_flight for cluster_node in node_pool.nodes], [0, 0])
+
+    def test_export_cluster_nodes_sequential(self):
+        node = self.cluster_node()
+        results = self.export("ds,KEYONE", "--node", self.base_url, "--node", node.base_url)
+        self.assertEqual(results, ["0: Success", "0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET export"], 1)
+        self.assertEqual(node.stats()["requests_by_endpoint"]["GET export"], 1)
+
+    def test_export_lazy_imports(self):
+        # the modules of the archive store, the inventory, the migration and the space list are imported once
+        # they are used
+        modules = ["confluence.backup.confapi." + name for name in ["inventory", "multipart", "spaces", "store"]]
+        code = "import sys; import confluence.backup.export; print([m for m in {} if m in sys.modules])".format(modules)
+        parent_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../../')
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=parent_dir)
+        self.assertEqual(output.strip(), b"[]")
+        self.assertEqual(self.export("ds", "--store", "store", "--inventory"), ["0: Success"])
+
+    def test_export_reuses_connections(self):
+        self.server.job_duration = 0.5
+        self.assertEqual(self.export("ds"), ["0: Success"])
+        stats = self.server.stats()
+        self.assertEqual(stats["connections"], 1)
+        self.assertGreater(stats["requests"], 2)
+
+    def test_export_retries_unavailable_server(self):
+        self.server.fail_rate = 0.5
+        self.server.retry_after = 0
+        self.assertEqual(self.export("ds,KEYONE"), ["0: Success", "0: Success"])
+        self.assertGreater(self.server.stats()["requests_by_endpoint"]["GET queue"], 2)
+
+    def test_export_resumes_dropped_downloads(self):
+        self.server.archive_size = 512 * 1024
+        self.server.drop_rate = 0.5
+        self.assertEqual(self.export("ds,KEYONE", "--download-retries", "20"), ["0: Success", "0: Success"])
+        self.assertEqual(self.read("Confluence-space-export-ds.xml.zip"), self.server.archive("ds"))
+        self.assertEqual(self.read("Confluence-space-export-KEYONE.xml.zip"), self.server.archive("KEYONE"))
+
+    def test_export_incremental(self):
+        self.server.add_space("A")
+        self.assertEqual(self.export("ds,A", "--incremental"), ["0: Success", "0: Success"])
+        self.assertEqual(self.export("ds,A", "--incremental"), ["0: Unchanged", "0: Unchanged"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET export"], 2)
+
+        self.server.touch_space("A")
+        self.assertEqual(self.export("ds,A", "--incremental", "--parallel", "2"), ["0: Unchanged", "0: Success"])
+        self.server.touch_space("A", count=3)
+        self.assertEqual(self.export("ds,A", "--incremental"), ["0: Unchanged", "0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET export"], 4)
+
+    def test_export_incremental_manifest(self):
+        self.assertEqual(self.export("ds", "--incremental", "--manifest", "manifest.json"), ["0: Success"])
+        manifest = sys.modules["confluence.backup.confapi.manifest"].ExportManifest("manifest.json")
+        entry = manifest.get("ds")
+        self.assertEqual(entry["file"], "Confluence-space-export-ds.xml.zip")
+        self.assertEqual(entry["size"], len(self.server.archive("ds")))
+        self.assertEqual(entry["sha256"], hashlib.sha256(self.server.archive("ds")).hexdigest())
+        self.assertTrue(entry["last_modified"].endswith("/4"))
+
+    def test_export_incremental_missing_archive(self):
+        self.assertEqual(self.export("ds", "--incremental"), ["0: Success"])
+        os.remove("Confluence-space-export-ds.xml.zip")
+        self.assertEqual(self.export("ds", "--incremental"), ["0: Success"])
+
+    def test_export_store(self):
+        self.assertEqual(self.export("ds", "--store", "store"), ["0: Success"])
+        self.assertFalse(os.path.exists("Confluence-space-export-ds.xml.zip"))
+        self.assertEqual(self.export("ds", "--store", "store", "--incremental"), ["0: Success"])
+        self.assertEqual(self.export("ds", "--store", "store", "--incremental"), ["0: Unchanged"])
+
+        archive = sys.modules["confluence.backup.archive"]
+        self.assertEqual(archive.main(["file", "restore", "store", "Confluence-space-export-ds.xml.zip"]),
+                         ["0: Success"])
+        self.assertEqual(self.read("Confluence-space-export-ds.xml.zip"), self.server.archive("ds"))
+
+    def test_export_store_checksum_mismatch(self):
+        integrity = sys.modules["confluence.backup.confapi.integrity"]
+        with mock.patch.object(integrity.StreamChecksum, "hexdigest", return_value="0" * 64):
+            self.assertEqual(self.export("ds", "--store", "store"), ["1: checksum mismatch"])
+        self.assertFalse(os.path.exists("Confluence-space-export-ds.xml.zip"))
+        self.assertFalse(os.listdir(os.path.join("store", "snapshots")))
+        # the damaged archive is not taken for the latest export
+        self.assertEqual(self.export("ds", "--store", "store", "--incremental"), ["0: Success"])
+
+    def test_export_checksum_manifest(self):
+        self.assertEqual(self.export("ds", "--central-directory-crc"), ["0: Success"])
+        with open("Confluence-space-export-ds.xml.zip.manifest.json") as fd:
+            manifest = json.load(fd)
+        self.assertEqual(manifest["sha256"], hashlib.sha256(self.server.archive("ds")).hexdigest())
+        self.assertEqual(manifest["size"], len(self.server.archive("ds")))
+        self.assertEqual(manifest["key"], "ds")
+        self.assertIsInstance(manifest["central_directory_crc32"], int)
+        self.assertGreaterEqual(manifest["duration"], 0)
+
+    def test_export_verify(self):
+        self.assertEqual(self.export("ds,KEYONE", "--parallel", "2"), ["0: Success", "0: Success"])
+        requests = self.server.stats()["requests"]
+        self.assertEqual(self.export("ds,KEYONE", "--verify"), ["0: Success", "0: Success"])
+
+        data = self.read("Confluence-space-export-ds.xml.zip")
+        with open("Confluence-space-export-ds.xml.zip", "wb") as fd:
+            fd.write(data[:1000] + bytes([data[1000] ^ 1]) + data[1001:])
+        os.remove("Confluence-space-export-KEYONE.xml.zip")
+        self.assertEqual(self.export("ds,KEYONE", "--verify"), ["1: checksum mismatch", "1: archive missing"])
+        self.assertEqual(self.server.stats()["requests"], requests)
+
+    def test_export_verify_store(self):
+        self.assertEqual(self.export("ds", "--store", "store"), ["0: Success"])
+        self.assertEqual(self.export("ds", "--store", "store", "--verify"), ["0: Success"])
+        self.assertEqual(self.export("KEYONE", "--store", "store", "--verify"), ["1: snapshot missing"])
+
+    def test_export_inventory(self):
+        self.assertEqual(self.export("ds", "--inventory"), ["0: Success"])
+        with open("Confluence-space-export-ds.xml.zip.manifest.json") as fd:
+            inventory = json.load(fd)["inventory"]
+        self.assertEqual((inventory["space_key"], inventory["pages"], inventory["blog_posts"]), ("ds", 3, 1))
+        self.assertEqual(inventory["attachment_bytes"], self.server.archive_size)
+
+        # the server delivers the archive of another space
+        self.server.archives["KEYONE"] = self.server.archive("ds")
+        self.assertEqual(self.export("KEYONE", "--inventory"), ["1: space key mismatch"])
+
+    def test_export_metrics(self):
+        self.assertEqual(self.export("ds,INVALID", "--event-log", "events.jsonl", "--metrics-file", "confapi.prom"),
+                         ["0: Success", "404: not_found"])
+        with open("events.jsonl") as fd:
+            events = [json.loads(line) for line in fd]
+        jobs = {event["item"]: event for event in events if event["event"] == "job_finished"}
+        self.assertEqual(list(jobs["ds"]["phases"]), ["submit", "queue", "processing", "waiting", "download", "check"])
+        self.assertEqual(jobs["ds"]["bytes"], len(self.server.archive("ds")))
+        self.assertGreater(jobs["ds"]["requests"], 2)
+        self.assertEqual((jobs["INVALID"]["code"], jobs["INVALID"]["message"]), (404, "not_found"))
+        self.assertEqual(events[-1]["event"], "run_finished")
+        self.assertEqual(events[-1]["requests"], sum(self.server.stats()["requests_by_endpoint"].values()))
+
+        with open("confapi.prom") as fd:
+            lines = fd.read().splitlines()
+        self.assertIn('confapi_job_success{script="export",item="ds"} 1', lines)
+        self.assertIn('confapi_run_jobs{script="export"} 2', lines)
+
+    def test_import_metrics(self):
+        self.assertEqual(self.import_files(self.write_archive("NEW"), "--event-log", "events.jsonl"), ["0: Success"])
+        with open("events.jsonl") as fd:
+            events = [json.loads(line) for line in fd]
+        job = [event for event in events if event["event"] == "job_finished"][0]
+        self.assertEqual(list(job["phases"]), ["check", "upload", "queue", "processing"])
+        self.assertEqual(job["bytes"], os.path.getsize("Confluence-space-export-NEW.xml.zip"))
+
+    def journal(self, kind):
+        journal_module = sys.modules["confluence.backup.confapi.journal"]
+        journal = journal_module.JobJournal(journal_module.journal_path(self.base_url, kind))
+        self.addCleanup(journal.close)
+        return journal
+
+    def queue_url(self, job):
+        return self.base_url + "/rest/confapi/1/backup/queue/" + job.job_id
+
+    def test_export_resume_reattaches(self):
+        # the export has been submitted by a run that was killed afterwards
+        self.journal("export").record("ds", "queued", queue_url=self.queue_url(self.server.create_job("export", "ds")))
+        self.assertEqual(self.export("ds,KEYONE", "--resume"), ["0: Success", "0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET export"], 1)
+        self.assertEqual(self.read("Confluence-space-export-ds.xml.zip"), self.server.archive("ds"))
+        self.assertEqual(self.journal("export").get("ds")["state"], "done")
+
+    def test_export_resume_skips_finished(self):
+        self.assertEqual(self.export("ds"), ["0: Success"])
+        self.assertEqual(self.export("ds,KEYONE", "--resume"), ["0: Success", "0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET export"], 2)
+
+        # without --resume everything is exported again
+        self.assertEqual(self.export("ds,KEYONE"), ["0: Success", "0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET export"], 4)
+
+    def test_export_resume_partial_download(self):
+        self.server.archive_size = 512 * 1024
+        self.server.drop_rate = 1.0
+        self.assertEqual(self.export("ds", "--download-retries", "0"), ["444: url not reachable"])
+        self.assertTrue(os.path.exists("Confluence-space-export-ds.xml.zip.part"))
+        self.assertEqual(self.journal("export").get("ds")["state"], "ready")
+
+        self.server.drop_rate = 0.0
+        self.assertEqual(self.export("ds", "--resume"), ["0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET export"], 1)
+        self.assertEqual(self.read("Confluence-space-export-ds.xml.zip"), self.server.archive("ds"))
+
+    def test_export_resume_unknown_job(self):
+        # the server has been restarted and does not know the job anymore
+        self.journal("export").record("ds", "queued", queue_url=self.base_url + "/rest/confapi/1/backup/queue/x")
+        self.assertEqual(self.export("ds", "--resume"), ["0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET export"], 1)
+
+    def migrate(self, keys, *args, target_spaces=(), target_user=None):
+        mock_server = sys.modules["confluence.backup.tests.mock_server"]
+        self.target = mock_server.MockConfapiServer(spaces=list(target_spaces), job_duration=0.2, seed=2)
+        target_url = self.target.start()
+        self.addCleanup(self.target.stop)
+        target_args = ["--target-username", target_user, "--target-password", target_user] if target_user else []
+        return self.export(keys, "--migrate-to", target_url, *(target_args + list(args)))
+
+    def test_export_migrate(self):
+        self.assertEqual(self.migrate("ds,KEYONE", "--buffer-size", "16384", "--chunk-size", "4096"),
+                         ["0: Success", "0: Success"])
+        self.assertIn("ds", self.target.spaces)
+        self.assertIn("KEYONE", self.target.spaces)
+        self.assertEqual(self.target.stats()["requests_by_endpoint"]["POST import"], 2)
+        # no archive has been written to disk
+        self.assertEqual([name for name in os.listdir(".") if ".zip" in name], [])
+
+    def test_export_migrate_parallel(self):
+        self.assertEqual(self.migrate("ds,KEYONE", "--parallel", "2"), ["0: Success", "0: Success"])
+        self.assertIn("ds", self.target.spaces)
+        self.assertIn("KEYONE", self.target.spaces)
+
+    def test_export_migrate_existing_space(self):
+        self.assertEqual(self.migrate("ds,KEYONE", target_spaces=["ds"]), ["400: bad_request", "0: Success"])
+
+    def test_export_migrate_invalid_permissions(self):
+        self.assertEqual(self.migrate("ds", target_user="user"), ["403: forbidden"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"].get("GET export"), None)
+
+    def test_export_migrate_dropped_download(self):
+        self.server.drop_rate = 1.0
+        self.assertEqual(self.migrate("ds"), ["444: url not reachable"])
+        self.assertNotIn("ds", self.target.spaces)
+
+    def test_import_basic(self):
+        self.assertEqual(self.import_files(self.write_archive("NEW")), ["0: Success"])
+        self.assertIn("NEW", self.server.spaces)
+
+    def test_import_resume(self):
+        file_name = self.write_archive("NEW")
+        other_file_name = self.write_archive("OTHER")
+        self.assertEqual(self.import_files(file_name), ["0: Success"])
+        self.assertEqual(self.import_files(file_name, other_file_name, "--resume"), ["0: Success", "0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["POST import"], 2)
+
+    def test_import_resume_reattaches(self):
+        file_name = self.write_archive("NEW")
+        self.server.add_space("NEW")
+        self.journal("import").record(os.path.realpath(file_name), "queued", bytes=os.path.getsize(file_name),
+                                      queue_url=self.queue_url(self.server.create_job("import", "NEW")))
+        self.assertEqual(self.import_files(file_name, "--resume"), ["0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"].get("POST import"), None)
+
+    def test_import_double_file(self):
+        file_name = self.write_archive("NEW")
+        # the same file given twice is only imported once
+        self.assertEqual(self.import_files(file_name, file_name, "./" + file_name, "*NEW*"), ["0: Success"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["POST import"], 1)
+
+    def test_import_invalid_archive(self):
+        with open("broken.xml.zip", "wb") as fd:
+            fd.write(b"no zip file")
+        self.assertEqual(self.import_files("broken.xml.zip"), ["400: bad_request"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"].get("POST import"), None)
+
+    def test_import_truncated_archive(self):
+        data = self.read(self.write_archive("NEW"))
+        with open("truncated.xml.zip", "wb") as fd:
+            fd.write(data[:len(data) // 2])
+        self.assertEqual(self.import_files("truncated.xml.zip", "Confluence-space-export-NEW.xml.zip"),
+                         ["0: Success", "400: bad_request"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["POST import"], 1)
+
+    def test_import_skip_preflight(self):
+        with open("broken.xml.zip", "wb") as fd:
+            fd.write(b"no zip file")
+        self.assertEqual(self.import_files("broken.xml.zip", "--skip-preflight"), ["400: bad_request"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["POST import"], 1)
+
+    def test_import_regex(self):
+        self.write_archive("NEW1")
+        self.write_archive("NEW2")
+        self.assertEqual(self.import_files("Confluence-space-export-NEW*"), ["0: Success", "0: Success"])
+
+    def test_import_checks_credentials_once(self):
+        for key in ["N1", "N2", "N3"]:
+            self.write_archive(key)
+        self.assertEqual(self.import_files("Confluence-space-export-N*"), ["0: Success"] * 3)
+        requests_by_endpoint = self.server.stats()["requests_by_endpoint"]
+        self.assertEqual((requests_by_endpoint["GET base"], requests_by_endpoint["PUT import"]), (1, 1))
+
+    def test_import_rechecks_credentials_after_ttl(self):
+        for key in ["N1", "N2"]:
+            self.write_archive(key)
+        self.assertEqual(self.import_files("Confluence-space-export-N*", "--preflight-ttl", "0"), ["0: Success"] * 2)
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["PUT import"], 3)
+
+    def test_import_recursive_regex(self):
+        os.makedirs("2020/01")
+        for key in ["NEW1", "NEW2"]:
+            shutil.move(self.write_archive(key), "2020/01")
+        self.write_archive("NEW3")
+        self.assertEqual(self.import_files("**/Confluence-space-export-NEW*", "*.zip"),
+                         ["0: Success", "0: Success", "0: Success"])
+
+    def test_import_parallel(self):
+        for key in ["N1", "N2", "N3", "N4"]:
+            self.write_archive(key)
+        results = self.import_files("Confluence-space-export-N*", "--parallel", "3")
+        self.assertEqual(results, ["0: Success"] * 4)
+        self.assertTrue(all(key in self.server.spaces for key in ["N1", "N2", "N3", "N4"]))
+
+    def test_import_parallel_capacity(self):
+        keys = ["N1", "N2", "N3", "N4", "N5", "N6"]
+        for key in keys:
+            self.write_archive(key)
+        self.write_archive("ds")
+        results = self.import_files("Confluence-space-export-*", "--parallel", "4", "--max-jobs", "2",
+                                    "--max-uploads", "2", "--order", "name")
+        self.assertEqual(results, ["0: Success"] * 6 + ["400: bad_request"])
+        self.assertTrue(all(key in self.server.spaces for key in keys))
+        self.assertLessEqual(self.server.stats()["max_running_jobs"]["import"], 2)
+
+    def test_export_overloaded_server(self):
+        for key in ["A", "B", "C", "D"]:
+            self.server.add_space(key)
+        self.server.capacity = 2
+        self.server.retry_after = 0.05
+        results = self.export("A,B,C,D,ds", "--parallel", "5", "--adaptive-concurrency", "--overload-retries", "50")
+        self.assertEqual(results, ["0: Success"] * 5)
+        self.assertLessEqual(self.server.stats()["max_running_jobs"]["export"], 2)
+
+    def test_export_overloaded_server_gives_up(self):
+        self.server.capacity = 0
+        self.server.retry_after = 0
+        self.assertEqual(self.export("ds", "--overload-retries", "2"), ["429: too_many_requests"])
+        self.assertEqual(self.server.stats()["requests_by_endpoint"]["GET export"], 3)
+
+    def test_import_overloaded_server(self):
+        keys = ["N1", "N2", "N3", "N4"]
+        for key in keys:
+            self.write_archive(key)
+        self.server.capacity = 2
+        self.server.retry_after = 0.05
+        results = self.import_files("Confluence-space-export-N*", "--parallel", "4", "--adaptive-concurrency",
+                                    "--overload-retries", "50", "--max-rps", "100")
+        self.assertEqual(results, ["0: Success"] * 4)
+        self.assertTrue(all(key in self.server.spaces for key in keys))
+        self.assertLessEqual(self.server.stats()["max_running_jobs"]["import"], 2)
+
+    def test_import_lost_job(self):
+        file_name = self.write_archive("NEW")
+        self.server.forget_jobs = True
+        self.assertEqual(self.import_files(file_name, "--event-log", "events.jsonl"), ["404: not_found"])
+        with open("events.jsonl") as fd:
+            events = [json.loads(line) for line in fd]
+        jobs = [event for event in events if event["event"] == "job_finished"]
+        self.assertEqual([job["code"] for job in jobs], [404])
+        # the import is not taken for done by a later run
+        self.assertEqual(self.journal("import").get(os.path.realpath(file_name))["state"], "queued")
+
+    def test_import_parallel_lost_job(self):
+        self.server.forget_jobs = True
+        self.assertEqual(self.import_files(self.write_archive("N1"), self.write_archive("N2"), "--parallel", "2"),
+                         ["404: not_found", "404: not_found"])
+
+    def test_import_invalid_url(self):
+        self.assertEqual(self.import_files(self.write_archive("NEW"), base_url="http://localhost:1/confluence"),
+                         ["444: url not reachable"])
+
+    def test_import_invalid_credentials(self):
+        self.assertEqual(self.import_files(self.write_archive("NEW"), user=INVALID_USER), ["401: unauthorized"])
+
+    def test_import_invalid_permissions(self):
+        self.assertEqual(self.import_files(self.write_archive("NEW"), user=NORMAL_USER), ["403: forbidden"])
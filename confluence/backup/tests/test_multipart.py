@@ -0,0 +1,111 @@
+import unittest
+import importlib
+import sys
+import os
+import io
+import email.parser
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests_received = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.requests_received.append((dict(self.headers), body))
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class ConfluenceTestMultipart(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.multipart")
+        importlib.import_module("confluence.backup.confapi.session")
+
+    def setUp(self):
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+        fd, self.path = tempfile.mkstemp(suffix=".xml.zip")
+        with os.fdopen(fd, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def encoder(self, **kwargs):
+        return sys.modules["confluence.backup.confapi.multipart"].MultipartFileEncoder.from_path(self.path, **kwargs)
+
+    def parse(self, content_type, body):
+        message = email.parser.BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        self.assertTrue(message.is_multipart())
+        return message.get_payload()
+
+    def test_encoder_body(self):
+        encoder = self.encoder(chunk_size=64 * 1024)
+        body = b"".join(encoder)
+        self.assertEqual(len(body), len(encoder))
+
+        parts = self.parse(encoder.content_type, body)
+        self.assertEqual(len(parts), 1)
+        self.assertEqual(parts[0].get_param("name", header="Content-Disposition"), "file")
+        self.assertEqual(parts[0].get_filename(), os.path.basename(self.path))
+        self.assertEqual(parts[0].get_payload(decode=True), self.data)
+
+    def test_encoder_reports_progress(self):
+        progress = []
+        encoder = self.encoder(callback=lambda sent, total: progress.append((sent, total)))
+        for _ in encoder:
+            pass
+        self.assertEqual(len(progress), 4)
+        self.assertEqual(progress[-1], (len(self.data), len(self.data)))
+
+    def test_encoder_closes_file(self):
+        opened = []
+
+        def open_file():
+            opened.append(io.BytesIO(b"content"))
+            return opened[-1]
+
+        encoder = sys.modules["confluence.backup.confapi.multipart"].MultipartFileEncoder("a.zip", 7, open_file)
+        b"".join(encoder)
+        self.assertTrue(opened[0].closed)
+
+    def test_encoder_detects_truncated_source(self):
+        encoder = sys.modules["confluence.backup.confapi.multipart"].MultipartFileEncoder(
+            "a.zip", 100, lambda: io.BytesIO(b"content"))
+        with self.assertRaises(IOError):
+            b"".join(encoder)
+
+    def test_encoder_upload(self):
+        RecordingHandler.requests_received = []
+        server = ThreadingHTTPServer(("localhost", 0), RecordingHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            session = sys.modules["confluence.backup.confapi.session"].ConfapiSession()
+            encoder = self.encoder()
+            response = session.post("http://localhost:{}/import".format(server.server_port), data=encoder,
+                                    headers={"Content-Type": encoder.content_type})
+            session.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(response.status_code, 201)
+        headers, body = RecordingHandler.requests_received[0]
+        self.assertEqual(int(headers["Content-Length"]), len(encoder))
+        self.assertNotIn("Transfer-Encoding", headers)
+        parts = self.parse(headers["Content-Type"], body)
+        self.assertEqual(parts[0].get_payload(decode=True), self.data)
@@ -0,0 +1,65 @@
+import unittest
+import importlib
+import sys
+import os
+
+
+class ConfluenceTestNodes(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.nodes")
+
+    def setUp(self):
+        self.nodes = sys.modules["confluence.backup.confapi.nodes"]
+        self.pool = self.nodes.NodePool(["http://node1:8090/confluence/", "http://node2:8090/confluence"],
+                                        cluster_url="https://wiki.example.com/confluence")
+
+    def test_least_in_flight(self):
+        self.assertEqual(self.pool.acquire("A").base_url, "http://node1:8090/confluence")
+        self.assertEqual(self.pool.acquire("B").base_url, "http://node2:8090/confluence")
+        self.assertEqual(self.pool.acquire("C").base_url, "http://node1:8090/confluence")
+        # a job keeps its node
+        self.assertEqual(self.pool.acquire("A").base_url, "http://node1:8090/confluence")
+        self.pool.release("A")
+        self.pool.release("C", failed=True)
+        self.pool.release("C")
+        self.assertEqual(self.pool.acquire("D").base_url, "http://node1:8090/confluence")
+        self.assertEqual([(node.in_flight, node.jobs, node.failed) for node in self.pool.nodes], [(1, 3, 1), (1, 1, 0)])
+
+    def test_pin(self):
+        self.pool.acquire("A")
+        self.pool.acquire("B")
+        self.assertEqual(self.pool.pin("B", "https://wiki.example.com/confluence/rest/confapi/1/backup/queue/7"),
+                         "http://node2:8090/confluence/rest/confapi/1/backup/queue/7")
+        self.assertEqual(self.pool.pin("B", "/confluence/download/temp/ds.zip"),
+                         "http://node2:8090/confluence/download/temp/ds.zip")
+        self.assertEqual(self.pool.pin("A", "http://node1:8090/confluence/queue/1"),
+                         "http://node1:8090/confluence/queue/1")
+        # URLs of other hosts and jobs without a node are left alone
+        self.assertEqual(self.pool.pin("A", "https://cdn.example.com/ds.zip"), "https://cdn.example.com/ds.zip")
+        self.assertEqual(self.pool.pin("X", "https://wiki.example.com/confluence/queue/1"),
+                         "https://wiki.example.com/confluence/queue/1")
+
+    def test_attach(self):
+        self.pool.acquire("A")
+        self.pool.attach("A", "http://node2:8090/confluence/rest/confapi/1/backup/queue/3")
+        self.assertEqual(self.pool.node("A").base_url, "http://node2:8090/confluence")
+        self.assertEqual([(node.in_flight, node.jobs) for node in self.pool.nodes], [(0, 0), (1, 1)])
+
+    def test_summary(self):
+        self.pool.acquire("A")
+        self.pool.add_transfer("A", 4 * 1024 * 1024, 2.0)
+        self.pool.release("A")
+        self.assertEqual(self.pool.summary().splitlines(),
+                         ["Node http://node1:8090/confluence: 1 jobs, 0 failed, 4.0 MiB in 2.0s (2.0 MiB/s)",
+                          "Node http://node2:8090/confluence: 0 jobs, 0 failed, 0 B"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import importlib
+import sys
+import os
+import threading
+import time
+
+
+class ConfluenceTestPipe(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.pipe")
+
+    def setUp(self):
+        self.pipe = sys.modules["confluence.backup.confapi.pipe"]
+
+    def write_all(self, pipe, chunks, error=None):
+        def writer():
+            try:
+                for chunk in chunks:
+                    pipe.write(chunk)
+            except BrokenPipeError:
+                self.broken = True
+            pipe.close(error)
+        self.broken = False
+        thread = threading.Thread(target=writer, daemon=True)
+        thread.start()
+        return thread
+
+    def read_all(self, pipe, size):
+        data = b""
+        while True:
+            chunk = pipe.read(size)
+            if not chunk:
+                return data
+            self.assertLessEqual(len(chunk), size)
+            data += chunk
+
+    def test_transfer(self):
+        pipe = self.pipe.StreamPipe(max_size=100)
+        chunks = [bytes([index]) * (index * 7 % 60 + 1) for index in range(200)]
+        thread = self.write_all(pipe, chunks)
+        self.assertEqual(self.read_all(pipe, 33), b"".join(chunks))
+        thread.join()
+        self.assertEqual(pipe.bytes_written, sum(len(chunk) for chunk in chunks))
+
+    def test_backpressure(self):
+        pipe = self.pipe.StreamPipe(max_size=100)
+        thread = self.write_all(pipe, [b"x" * 40] * 10)
+        time.sleep(0.1)
+        # the writer blocks as soon as the buffer is full
+        self.assertEqual(pipe.size, 80)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(len(self.read_all(pipe, 1000)), 400)
+        thread.join()
+        self.assertGreater(pipe.writer_waits, 0)
+
+    def test_large_chunk(self):
+        pipe = self.pipe.StreamPipe(max_size=10)
+        thread = self.write_all(pipe, [b"a" * 25, b"b" * 25])
+        self.assertEqual(self.read_all(pipe, 7), b"a" * 25 + b"b" * 25)
+        thread.join()
+
+    def test_writer_error(self):
+        pipe = self.pipe.StreamPipe(max_size=100)
+        thread = self.write_all(pipe, [b"x" * 10], error=IOError("connection dropped"))
+        self.assertEqual(pipe.read(100), b"x" * 10)
+        with self.assertRaises(IOError):
+            pipe.read(100)
+        thread.join()
+
+    def test_reader_stops(self):
+        pipe = self.pipe.StreamPipe(max_size=100)
+        thread = self.write_all(pipe, [b"x" * 60] * 10)
+        with pipe as fd:
+            fd.read(10)
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(self.broken)
+
+
+if __name__ == '__main__':
+    unittest.main()
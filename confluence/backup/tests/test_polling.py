@@ -0,0 +1,102 @@
+import unittest
+import importlib
+import sys
+import os
+import time
+import email.utils
+
+
+class FakeResponse:
+
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ConfluenceTestPolling(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.polling")
+
+    def polling(self):
+        return sys.modules["confluence.backup.confapi.polling"]
+
+    def adaptive(self, clock, jitter=0.0):
+        return self.polling().AdaptivePolling(min_interval=1, max_interval=60, jitter=jitter, clock=clock,
+                                              rng=lambda: 0.5)
+
+    def test_parse_retry_after_seconds(self):
+        self.assertEqual(self.polling().parse_retry_after("5"), 5.0)
+        self.assertIsNone(self.polling().parse_retry_after(None))
+        self.assertIsNone(self.polling().parse_retry_after("soon"))
+
+    def test_parse_retry_after_http_date(self):
+        now = time.time()
+        value = email.utils.formatdate(now + 30, usegmt=True)
+        self.assertAlmostEqual(self.polling().parse_retry_after(value, now=now), 30, delta=1)
+
+    def test_fixed_polling(self):
+        poller = self.polling().FixedPolling(min_interval=1, max_interval=10)
+        self.assertEqual(poller.next_interval(10), 1)
+        self.assertEqual(poller.next_interval(None, FakeResponse({"Retry-After": "7"})), 7)
+
+    def test_adaptive_polling_honors_retry_after(self):
+        poller = self.adaptive(FakeClock())
+        self.assertEqual(poller.next_interval(50, FakeResponse({"Retry-After": "120"})), 120)
+        self.assertEqual(poller.next_interval(50, FakeResponse({"Retry-After": "0"})), 1)
+
+    def test_adaptive_polling_backs_off_without_progress(self):
+        clock = FakeClock()
+        poller = self.adaptive(clock)
+        intervals = []
+        for _ in range(8):
+            intervals.append(poller.next_interval(10))
+            clock.now += intervals[-1]
+        self.assertEqual(intervals, [1, 2, 4, 8, 16, 32, 60, 60])
+
+    def test_adaptive_polling_estimates_completion(self):
+        clock = FakeClock()
+        poller = self.adaptive(clock)
+        self.assertEqual(poller.next_interval(0), 1)
+        clock.now = 10
+        # 1% per second and 90% left, capped at the maximum interval
+        self.assertEqual(poller.next_interval(10), 60)
+        clock.now = 20
+        # smoothed rate of 4.5% per second and 10% left
+        self.assertAlmostEqual(poller.next_interval(90), 10 / 4.5)
+        clock.now = 22
+        self.assertEqual(poller.next_interval(100), 1)
+
+    def test_adaptive_polling_resets_backoff_on_progress(self):
+        clock = FakeClock()
+        poller = self.adaptive(clock)
+        poller.next_interval(0)
+        clock.now = 1
+        self.assertEqual(poller.next_interval(0), 2)
+        clock.now = 3
+        self.assertEqual(poller.next_interval(0), 4)
+        clock.now = 7
+        self.assertEqual(poller.next_interval(70), 3)
+
+    def test_adaptive_polling_jitter_stays_in_bounds(self):
+        poller = self.polling().AdaptivePolling(min_interval=1, max_interval=4, jitter=0.5)
+        for _ in range(20):
+            self.assertTrue(1 <= poller.next_interval(None) <= 4)
+
+    def test_invalid_interval(self):
+        with self.assertRaises(ValueError):
+            self.polling().FixedPolling(min_interval=5, max_interval=1)
@@ -0,0 +1,106 @@
+import unittest
+import importlib
+import sys
+import os
+
+import requests
+
+
+class FakeResponse:
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+
+class FakeSession:
+    # answers GET and PUT with the next status code of its lists
+
+    def __init__(self, get_codes, put_codes=()):
+        self.get_codes = list(get_codes)
+        self.put_codes = list(put_codes)
+        self.requests = []
+
+    def respond(self, method, url, codes):
+        self.requests.append((method, url))
+        code = codes.pop(0)
+        if isinstance(code, Exception):
+            raise code
+        return FakeResponse(code)
+
+    def get(self, url):
+        return self.respond("GET", url, self.get_codes)
+
+    def put(self, url):
+        return self.respond("PUT", url, self.put_codes)
+
+
+class ConfluenceTestPreflight(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.preflight")
+
+    def setUp(self):
+        self.preflight = sys.modules["confluence.backup.confapi.preflight"]
+        self.now = 0.0
+
+    def cache(self, ttl=60):
+        return self.preflight.PreflightCache(ttl=ttl, clock=lambda: self.now)
+
+    def test_check_server(self):
+        session = FakeSession([200], [405])
+        result = self.preflight.check_server(session, "http://host/confluence/", "rest/confapi/1/backup/import")
+        self.assertTrue(result.ok)
+        self.assertEqual(session.requests, [("GET", "http://host/confluence/"),
+                                            ("PUT", "http://host/confluence/rest/confapi/1/backup/import")])
+
+    def test_check_server_failures(self):
+        result = self.preflight.check_server(FakeSession([401]), "http://host", "import")
+        self.assertEqual((result.ok, result.status_code), (False, 401))
+        result = self.preflight.check_server(FakeSession([200], [403]), "http://host", "import")
+        self.assertEqual((result.ok, result.status_code), (False, 403))
+        result = self.preflight.check_server(FakeSession([requests.exceptions.ConnectionError()]), "http://host")
+        self.assertFalse(result.ok)
+        self.assertIsInstance(result.error, requests.exceptions.ConnectionError)
+
+    def test_cache(self):
+        cache = self.cache()
+        session = FakeSession([200, 200], [200])
+        for _ in range(5):
+            self.assertTrue(cache.check(session, "http://host/", "import").ok)
+            self.assertTrue(cache.check(session, "http://host", "import").ok)
+        self.assertEqual(cache.checks, 1)
+
+        cache.check(session, "http://other")
+        self.assertEqual(cache.checks, 2)
+
+    def test_cache_expires(self):
+        cache = self.cache(ttl=60)
+        session = FakeSession([200, 401])
+        self.assertTrue(cache.check(session, "http://host").ok)
+        self.now = 59
+        self.assertTrue(cache.check(session, "http://host").ok)
+        self.now = 61
+        self.assertEqual(cache.check(session, "http://host").status_code, 401)
+        self.assertEqual(cache.checks, 2)
+
+    def test_failures_are_not_cached(self):
+        cache = self.cache()
+        session = FakeSession([503, 200, 200])
+        self.assertFalse(cache.check(session, "http://host").ok)
+        self.assertTrue(cache.check(session, "http://host").ok)
+        self.assertTrue(cache.check(session, "http://host").ok)
+        self.assertEqual(cache.checks, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import importlib
+import io
+import sys
+import os
+from unittest import mock
+
+
+class ConfluenceTestProgress(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.progress")
+
+    def setUp(self):
+        self.progress = sys.modules["confluence.backup.confapi.progress"]
+        self.stream = io.StringIO()
+        self.now = 0.0
+
+    def renderer(self, interactive):
+        return self.progress.ProgressRenderer(self.stream, interactive=interactive, interval=0.2, log_interval=10,
+                                              clock=lambda: self.now)
+
+    def test_format(self):
+        self.assertEqual(self.progress.format_bytes(512), "512 B")
+        self.assertEqual(self.progress.format_bytes(3 * 1024 * 1024 / 2), "1.5 MiB")
+        self.assertEqual(self.progress.format_duration(75), "1:15")
+        self.assertEqual(self.progress.format_duration(3725), "1:02:05")
+
+    def test_redraws_are_throttled(self):
+        renderer = self.renderer(interactive=True)
+        for index in range(1000):
+            self.now = index * 0.001
+            renderer.update("ds", "Download", index * 1024, 1024 * 1024, unit=self.progress.BYTES)
+        self.assertEqual(renderer.updates, 1000)
+        self.assertEqual(renderer.draws, 4)
+        self.assertEqual(self.stream.getvalue().count("\r"), 4)
+
+    @mock.patch.dict(os.environ, {"COLUMNS": "100"})
+    def test_status(self):
+        renderer = self.renderer(interactive=True)
+        mib = 1024 * 1024
+        renderer.update("ds", "Download", 0, 100 * mib, unit=self.progress.BYTES)
+        renderer.update("KEY", "Download", 10 * mib, 20 * mib, unit=self.progress.BYTES)
+        renderer.update("abc", "Export", 40)
+        self.now = 2.0
+        renderer.update("ds", "Download", 20 * mib, 100 * mib, unit=self.progress.BYTES)
+        renderer.update("KEY", "Download", 14 * mib, 20 * mib, unit=self.progress.BYTES)
+
+        self.assertEqual(renderer.status(),
+                         "ds Download 20% 20.0 MiB 10.0 MiB/s ETA 0:08 | "
+                         "KEY Download 70% 14.0 MiB 2.0 MiB/s ETA 0:03 | "
+                         "abc Export 40% | total 12.0 MiB/s ETA 0:08")
+        # the line is cut to the width of the terminal
+        self.now = 2.5
+        renderer.update("abc", "Export", 40)
+        self.assertTrue(self.stream.getvalue().endswith("\r" + renderer.status()[:99]))
+
+        renderer.finish("ds")
+        renderer.finish("KEY")
+        self.assertEqual(renderer.status(), "abc Export 40%")
+        renderer.close()
+        self.assertTrue(self.stream.getvalue().endswith("\r"))
+
+    def test_log_lines(self):
+        renderer = self.renderer(interactive=False)
+        for second in range(25):
+            self.now = float(second)
+            renderer.update("ds", "Export", second * 4)
+        renderer.close()
+        self.assertEqual(self.stream.getvalue().splitlines(), ["Progress: ds Export 40%", "Progress: ds Export 80%"])
+
+
+if __name__ == '__main__':
+    unittest.main()
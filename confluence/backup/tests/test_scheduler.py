@@ -0,0 +1,145 @@
+import unittest
+import importlib
+import sys
+import os
+import threading
+import time
+
+
+class ConfluenceTestScheduler(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.scheduler")
+
+    def scheduler(self):
+        return sys.modules["confluence.backup.confapi.scheduler"]
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.polls = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.downloads = 0
+        self.max_downloads = 0
+
+    def record(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def submit(self, job):
+        scheduler = self.scheduler()
+        self.record(("submit", job.item))
+        self.assertIs(scheduler.current_job(), job)
+        if job.item == "INVALID":
+            job.errors.append("404: not_found")
+            return scheduler.FAILED, 0
+        if job.item == "FATAL":
+            job.errors.append("401: unauthorized")
+            return scheduler.FAILED, 1
+        if job.item == "QUICK":
+            return scheduler.READY, "download/" + job.item
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.polls[job.item] = 0
+        return scheduler.QUEUED, "queue/" + job.item
+
+    def poll(self, job):
+        scheduler = self.scheduler()
+        self.assertIs(scheduler.current_job(), job)
+        self.polls[job.item] += 1
+        if self.polls[job.item] < 3:
+            return scheduler.RUNNING, 0.01
+        with self.lock:
+            self.in_flight -= 1
+        self.record(("ready", job.item))
+        return scheduler.READY, "download/" + job.item
+
+    def complete(self, job, location):
+        self.assertEqual(location, "download/" + job.item)
+        with self.lock:
+            self.downloads += 1
+            self.max_downloads = max(self.max_downloads, self.downloads)
+        time.sleep(0.02)
+        with self.lock:
+            self.downloads -= 1
+        job.errors.append("0: Success")
+        self.record(("complete", job.item))
+        return 0
+
+    def run_jobs(self, items, **kwargs):
+        scheduler = self.scheduler().JobScheduler(self.submit, self.poll, self.complete, **kwargs)
+        return scheduler.run(items)
+
+    def test_scheduler_submits_up_front(self):
+        jobs = self.run_jobs(["A", "B", "C", "D"], max_jobs=4, max_completions=1)
+        self.assertEqual([job.errors for job in jobs], [["0: Success"]] * 4)
+        self.assertEqual(self.max_in_flight, 4)
+        self.assertEqual(self.max_downloads, 1)
+        submits = [index for index, event in enumerate(self.events) if event[0] == "submit"]
+        readies = [index for index, event in enumerate(self.events) if event[0] == "ready"]
+        self.assertLess(max(submits), min(readies))
+
+    def test_scheduler_limits_jobs_in_flight(self):
+        jobs = self.run_jobs(["A", "B", "C", "D", "E"], max_jobs=2, max_completions=3)
+        self.assertTrue(all(job.state == self.scheduler().DONE for job in jobs))
+        self.assertEqual(self.max_in_flight, 2)
+        self.assertLessEqual(self.max_downloads, 3)
+
+    def test_scheduler_keeps_errors_per_job(self):
+        jobs = self.run_jobs(["A", "INVALID", "QUICK"], max_jobs=3, max_completions=2)
+        self.assertEqual([job.errors for job in jobs], [["0: Success"], ["404: not_found"], ["0: Success"]])
+        self.assertEqual(jobs[1].state, self.scheduler().FAILED)
+        self.assertEqual([job.exit_response for job in jobs], [0, 0, 0])
+
+    def test_scheduler_stops_after_fatal_error(self):
+        jobs = self.run_jobs(["FATAL", "A", "B"], max_jobs=1, max_completions=1)
+        self.assertEqual(jobs[0].exit_response, 1)
+        self.assertEqual([job.state for job in jobs[1:]], [self.scheduler().PENDING] * 2)
+        self.assertEqual(self.events, [("submit", "FATAL")])
+
+    def test_scheduler_consumes_items_lazily(self):
+        def discover():
+            for item in ["A", "B", "C", "D"]:
+                self.record(("found", item))
+                yield item
+
+        jobs = self.run_jobs(discover(), max_jobs=2, max_completions=2)
+        self.assertEqual([job.item for job in jobs], ["A", "B", "C", "D"])
+        self.assertEqual([job.errors for job in jobs], [["0: Success"]] * 4)
+        # the first jobs are submitted before the last items are found
+        self.assertLess(self.events.index(("submit", "A")), self.events.index(("found", "C")))
+        self.assertLess(self.events.index(("ready", "A")), self.events.index(("found", "D")))
+
+    def test_scheduler_stops_consuming_after_fatal_error(self):
+        items = iter(["FATAL", "A", "B"])
+        jobs = self.run_jobs(items, max_jobs=1, max_completions=1)
+        self.assertEqual([job.item for job in jobs], ["FATAL"])
+        self.assertEqual(list(items), ["A", "B"])
+
+    def test_scheduler_reports_finished_jobs(self):
+        finished = []
+        jobs = self.run_jobs(["A", "INVALID", "QUICK"], max_jobs=3, max_completions=2,
+                             finished=lambda job: finished.append((job.item, job.state)))
+        self.assertEqual(sorted(finished), sorted((job.item, job.state) for job in jobs))
+        self.assertIn(("INVALID", self.scheduler().FAILED), finished)
+
+    def test_scheduler_without_completion(self):
+        scheduler = self.scheduler().JobScheduler(self.submit, self.poll, max_jobs=2)
+        jobs = scheduler.run(["A", "QUICK"])
+        self.assertEqual([job.state for job in jobs], [self.scheduler().DONE] * 2)
+
+    def test_scheduler_raises_callback_errors(self):
+        def submit(job):
+            raise ValueError("broken")
+
+        scheduler = self.scheduler().JobScheduler(submit, self.poll)
+        with self.assertRaises(ValueError):
+            scheduler.run(["A"])
@@ -0,0 +1,62 @@
+import unittest
+import importlib
+import sys
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ConfluenceTestSession(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.session")
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("localhost", 0), KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = "http://localhost:{}/confluence".format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_session_reuses_connections(self):
+        session = sys.modules["confluence.backup.confapi.session"].ConfapiSession(auth=("admin", "admin"))
+        for _ in range(5):
+            self.assertEqual(session.get(self.url).status_code, 200)
+        self.assertEqual(session.connection_stats(), (1, 5))
+        self.assertIn("reused: 4 (80.0%)", session.summary())
+        session.close()
+
+    def test_session_keeps_statistics_after_close(self):
+        session = sys.modules["confluence.backup.confapi.session"].ConfapiSession()
+        session.get(self.url)
+        session.get(self.url)
+        session.close()
+        self.assertEqual(session.connection_stats(), (1, 2))
+
+    def test_session_applies_default_timeout(self):
+        session = sys.modules["confluence.backup.confapi.session"].ConfapiSession(connect_timeout=1, read_timeout=2)
+        self.assertEqual(session.timeout, (1, 2))
+        session.close()
@@ -0,0 +1,64 @@
+import unittest
+import importlib
+import json
+import sys
+import os
+from unittest import mock
+
+
+class ConfluenceTestSpaces(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.spaces")
+
+    def setUp(self):
+        self.spaces = sys.modules["confluence.backup.confapi.spaces"]
+
+    def page(self, keys, next_link=None):
+        response = mock.Mock(status_code=200)
+        links = {"base": "https://wiki.example.com/confluence"}
+        if next_link:
+            links["next"] = next_link
+        response.content = json.dumps({"results": [{"key": key} for key in keys], "_links": links}).encode("utf-8")
+        return response
+
+    def test_iter_spaces_is_lazy(self):
+        session = mock.Mock()
+        session.get.side_effect = [self.page(["A", "B"], "/rest/api/space?limit=2&start=2"), self.page(["C"])]
+        spaces = self.spaces.iter_spaces(session, "https://wiki.example.com/confluence", "global", page_size=2)
+        self.assertEqual(next(spaces)["key"], "A")
+        self.assertEqual(session.get.call_count, 1)
+        session.get.assert_called_with("https://wiki.example.com/confluence/rest/api/space",
+                                       params={"limit": 2, "type": "global"})
+        self.assertEqual([space["key"] for space in spaces], ["B", "C"])
+        session.get.assert_called_with("https://wiki.example.com/confluence/rest/api/space?limit=2&start=2",
+                                       params=None)
+
+    def test_next_page_url(self):
+        self.assertIsNone(self.spaces.next_page_url("http://localhost:1990/confluence", {}))
+        self.assertEqual(self.spaces.next_page_url("http://localhost:1990/confluence/",
+                                                   {"next": "/rest/api/space?start=25"}),
+                         "http://localhost:1990/confluence/rest/api/space?start=25")
+        self.assertEqual(self.spaces.next_page_url("http://node1:8090/confluence",
+                                                   {"base": "https://wiki.example.com/confluence",
+                                                    "next": "/rest/api/space?start=25"}),
+                         "http://node1:8090/confluence/rest/api/space?start=25")
+        self.assertEqual(self.spaces.next_page_url("http://node1", {"next": "https://wiki/rest/api/space?start=25"}),
+                         "https://wiki/rest/api/space?start=25")
+
+    def test_matches(self):
+        self.assertTrue(self.spaces.matches("DEV"))
+        self.assertTrue(self.spaces.matches("devops", include=["DEV*"]))
+        self.assertFalse(self.spaces.matches("OPS", include=["DEV*"]))
+        self.assertFalse(self.spaces.matches("~alice", exclude=["~*"]))
+        self.assertFalse(self.spaces.matches("DEVTMP", include=["DEV*"], exclude=["*TMP"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
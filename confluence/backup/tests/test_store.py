@@ -0,0 +1,142 @@
+import unittest
+import importlib
+import io
+import sys
+import os
+import shutil
+import tempfile
+import zipfile
+
+ATTACHMENTS = [os.urandom(300 * 1024) for _ in range(4)]
+
+
+def build_zip(entities, attachments=ATTACHMENTS):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("entities.xml", entities)
+        for index, data in enumerate(attachments):
+            archive.writestr(zipfile.ZipInfo("attachments/{}/1".format(index)), data,
+                             compress_type=zipfile.ZIP_STORED)
+    return buffer.getvalue()
+
+
+class ConfluenceTestStore(unittest.TestCase):
+
+    def setUpClass() -> None:
+        # add current folder to PYTHONPATH for discovering the confapi package
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        parent_dir = os.path.join(dir_path, '../../../')
+        sys.path.insert(0, parent_dir)
+        sys.path.insert(0, dir_path)
+
+        importlib.import_module("confluence.backup.confapi.store")
+        importlib.import_module("confluence.backup.archive")
+
+    def setUp(self):
+        self.store_module = sys.modules["confluence.backup.confapi.store"]
+        self.directory = tempfile.mkdtemp()
+        self.store = self.store_module.ChunkStore(os.path.join(self.directory, "store"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as fd:
+            fd.write(data)
+        return path
+
+    def read(self, path):
+        with open(path, "rb") as fd:
+            return fd.read()
+
+    def test_chunks_at_zip_headers(self):
+        data = build_zip(b"<entities/>")
+        chunks = list(self.store_module.iter_chunks(io.BytesIO(data), min_size=1024, max_size=256 * 1024))
+        self.assertEqual(b"".join(chunks), data)
+        self.assertTrue(all(len(chunk) <= 256 * 1024 for chunk in chunks))
+        # every attachment starts a new chunk
+        self.assertEqual(sum(chunk.startswith(b"PK\x03\x04") for chunk in chunks), len(ATTACHMENTS) + 1)
+
+    def test_chunks_group_small_entries(self):
+        data = build_zip(b"<entities/>", attachments=[os.urandom(100) for _ in range(200)])
+        chunks = list(self.store_module.iter_chunks(io.BytesIO(data), min_size=1024, max_size=256 * 1024))
+        self.assertEqual(b"".join(chunks), data)
+        self.assertTrue(all(chunk.startswith(b"PK") for chunk in chunks))
+        self.assertTrue(all(len(chunk) >= 1024 for chunk in chunks[:-1]))
+
+    def test_chunks_small_buffer(self):
+        data = os.urandom(3 * 1024 + 7)
+        chunks = list(self.store_module.iter_chunks(io.BytesIO(data), min_size=16, max_size=1024))
+        self.assertEqual(b"".join(chunks), data)
+        self.assertEqual([len(chunk) for chunk in chunks], [1024, 1024, 1024, 7])
+
+    def test_add_and_restore(self):
+        data = build_zip(b"<entities/>")
+        snapshot = self.store.add(self.write("Confluence-space-export-ds.xml.zip", data))
+        self.assertEqual(snapshot["size"], len(data))
+        self.assertEqual(snapshot["new_bytes"], len(data))
+
+        target = os.path.join(self.directory, "restored.zip")
+        self.store.restore("Confluence-space-export-ds.xml.zip", target)
+        self.assertEqual(self.read(target), data)
+
+    def test_deduplication(self):
+        first = build_zip(b"<entities>" + b"a" * 5000 + b"</entities>")
+        second = build_zip(b"<entities>" + b"b" * 9000 + b"</entities>")
+        self.store.add(self.write("Confluence-space-export-ds.xml.zip", first))
+        snapshot = self.store.add(self.write("Confluence-space-export-ds.xml.zip", second))
+
+        # only the changed entities.xml and the central directory are new
+        self.assertLess(snapshot["new_bytes"], 16 * 1024)
+        self.assertEqual(len(self.store.snapshots("Confluence-space-export-ds.xml.zip")), 2)
+
+        first_snapshot = self.store.snapshots("Confluence-space-export-ds.xml.zip")[0]
+        target = os.path.join(self.directory, "restored.zip")
+        self.store.restore("Confluence-space-export-ds.xml.zip", target, first_snapshot)
+        self.assertEqual(self.read(target), first)
+        self.store.restore("Confluence-space-export-ds.xml.zip", target)
+        self.assertEqual(self.read(target), second)
+
+    def test_add_checksum_mismatch(self):
+        path = self.write("Confluence-space-export-ds.xml.zip", build_zip(b"<entities/>"))
+        with self.assertRaises(self.store_module.ChecksumMismatchError):
+            self.store.add(path, sha256="0" * 64)
+        self.assertEqual(self.store.snapshots("Confluence-space-export-ds.xml.zip"), [])
+        self.assertIsNone(self.store.load("Confluence-space-export-ds.xml.zip"))
+
+    def test_restore_missing_chunk(self):
+        snapshot = self.store.add(self.write("Confluence-space-export-ds.xml.zip", build_zip(b"<entities/>")))
+        os.remove(self.store.chunk_path(snapshot["chunks"][1][0]))
+        target = os.path.join(self.directory, "restored.zip")
+        with self.assertRaises(IOError):
+            self.store.restore("Confluence-space-export-ds.xml.zip", target)
+        self.assertFalse(os.path.exists(target))
+
+    def test_prune(self):
+        for index in range(3):
+            self.store.add(self.write("Confluence-space-export-ds.xml.zip", build_zip(b"<e%d/>" % index)))
+        removed_snapshots, removed_chunks = self.store.prune(keep=1)
+        self.assertEqual(removed_snapshots, 2)
+        self.assertGreater(removed_chunks, 0)
+        self.store.restore("Confluence-space-export-ds.xml.zip", os.path.join(self.directory, "restored.zip"))
+
+    def test_archive_script(self):
+        archive = sys.modules["confluence.backup.archive"]
+        data = build_zip(b"<entities/>")
+        store = os.path.join(self.directory, "store")
+        path = self.write("Confluence-space-export-ds.xml.zip", data)
+        self.assertEqual(archive.main(["file", "add", store, path]), ["0: Success"])
+        self.assertEqual(archive.main(["file", "list", store]), ["0: Success"])
+
+        output = os.path.join(self.directory, "output")
+        os.mkdir(output)
+        self.assertEqual(archive.main(["file", "restore", store, "Confluence-space-export-ds.xml.zip",
+                                       "--output", output]), ["0: Success"])
+        self.assertEqual(self.read(os.path.join(output, "Confluence-space-export-ds.xml.zip")), data)
+        self.assertEqual(archive.main(["file", "restore", store, "INVALID", "--output", output]),
+                         ["1: no snapshot of INVALID in " + store])
+
+
+if __name__ == '__main__':
+    unittest.main()